@@ -1,11 +1,34 @@
-from fastapi import FastAPI
+import time
+import uuid
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .routes.chat import router as chat_router
 from .routers.try_on import router as try_on_router
 from .routers.tara import router as tara_router
+from .utils.metrics import (
+	registry, start_request_timings, server_timing_header,
+	HTTP_LATENCY, HTTP_REQUESTS, HTTP_IN_FLIGHT,
+)
+from .routers.admin import router as admin_router
+from .routers.wardrobe import router as wardrobe_router
+from .utils.structured_logging import configure_logging, start_request_log_context, record_log_overhead
+from .utils.usage import bind_request
+from .utils.serialization import NegotiatedResponse, negotiate_response_format
+from .utils.admission import AdmissionControlMiddleware, admission_gates, admission_routes
+from .utils.cancellation import DisconnectCancellationMiddleware
+from .utils.embeddings import embedding_service
+from .utils.env import env_flag
+from .utils.loop_lag import loop_lag_monitor
 
 def create_app() -> FastAPI:
-	app= FastAPI(title="Fashion Assistant API")
+	configure_logging()
+	# orjson by default, MessagePack for clients sending Accept: application/msgpack
+	app= FastAPI(title="Fashion Assistant API", default_response_class=NegotiatedResponse)
+	# Innermost middleware, so shed requests still get CORS headers, metrics and a request id
+	app.add_middleware(AdmissionControlMiddleware, gates=admission_gates, routes=admission_routes)
+	# Outside admission control, so requests still queued for a slot are cancelled too
+	app.add_middleware(DisconnectCancellationMiddleware)
 	app.add_middleware(
 		CORSMiddleware,
 		allow_origins=["*"],
@@ -14,12 +37,70 @@ def create_app() -> FastAPI:
 		allow_headers=["*"],
 	)
 
+	@app.middleware("http")
+	async def record_request_metrics(request: Request, call_next):
+		timings = start_request_timings()
+		start = time.perf_counter()
+		HTTP_IN_FLIGHT.inc()
+		status = "500"
+		try:
+			response = await call_next(request)
+			status = str(response.status_code)
+		finally:
+			HTTP_IN_FLIGHT.dec()
+			elapsed = time.perf_counter() - start
+			# Label by route template, not raw path, to keep label cardinality bounded
+			route = request.scope.get("route")
+			route_path = getattr(route, "path", "unmatched")
+			HTTP_LATENCY.observe(elapsed, method=request.method, route=route_path)
+			HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status)
+		response.headers["Server-Timing"] = server_timing_header(timings, total=elapsed)
+		response.headers["Timing-Allow-Origin"] = "*"
+		return response
+
+	@app.middleware("http")
+	async def bind_request_context(request: Request, call_next):
+		# Correlation id: honour the caller's X-Request-ID so logs join up across services
+		request_id = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+		overhead = start_request_log_context(request_id)
+		bind_request(request.scope)
+		negotiate_response_format(request.headers.get("accept"))
+		try:
+			response = await call_next(request)
+		finally:
+			record_log_overhead(overhead)
+		response.headers["X-Request-ID"] = request_id
+		return response
+
 	app.include_router(chat_router, prefix="/api")
 	app.include_router(try_on_router)
 	app.include_router(tara_router)
+	app.include_router(admin_router)
+	app.include_router(wardrobe_router)
+
+	@app.on_event("startup")
+	async def warm_up_embeddings():
+		# Off by default: most deployments only need the model once the semantic cache is enabled
+		if env_flag("EMBEDDING_WARMUP"):
+			await embedding_service.warm_up()
+
+	@app.on_event("startup")
+	async def start_loop_lag_monitor():
+		if loop_lag_monitor is not None:
+			loop_lag_monitor.start()
+
+	@app.on_event("shutdown")
+	async def stop_loop_lag_monitor():
+		if loop_lag_monitor is not None:
+			await loop_lag_monitor.stop()
+
 	@app.get("/", tags=["Root"])
 	async def read_root():
 		return {"message":"Welcome to fashion assistant API!"}
+
+	@app.get("/metrics", include_in_schema=False)
+	async def metrics():
+		return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 	return app
 
 app=create_app()
\ No newline at end of file
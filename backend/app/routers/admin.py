@@ -0,0 +1,127 @@
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Optional
+import os
+from ..utils.usage import usage_tracker
+from ..utils.admission import admission_gates
+from ..utils.model_routing import model_router
+from ..utils.embeddings import embedding_service
+from ..utils.loop_lag import loop_lag_monitor
+from ..utils.structured_repair import structured_output_stats
+from ..routes.chat import agent_singleton
+from ..routers.try_on import try_on_service, try_on_results
+
+router = APIRouter(
+    prefix="/api/admin",
+    tags=["admin"]
+)
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    If ADMIN_TOKEN is set, admin endpoints require a matching X-Admin-Token header.
+    Without it they are open, which is only meant for local development.
+    """
+    expected = os.environ.get("ADMIN_TOKEN")
+    if expected and x_admin_token != expected:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@router.get("/usage", dependencies=[Depends(require_admin)])
+async def get_usage(top_sessions: int = 20):
+    """
+    Token, latency and cost totals aggregated per endpoint, model, stage and session.
+    """
+    return usage_tracker.summary(top_sessions=top_sessions)
+
+@router.get("/usage/sessions/{session_id}", dependencies=[Depends(require_admin)])
+async def get_session_usage(session_id: str):
+    """
+    Usage for a single session, including whether it has exceeded its token budget.
+    """
+    usage = usage_tracker.session_usage(session_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for this session")
+    return {
+        "session_id": session_id,
+        "usage": usage,
+        "token_budget": usage_tracker.session_token_budget,
+        "over_budget": usage_tracker.is_over_budget(session_id),
+    }
+
+@router.get("/semantic-cache", dependencies=[Depends(require_admin)])
+async def get_semantic_cache_stats():
+    """
+    Hit rate and estimated latency saved by the chat semantic cache.
+    """
+    if agent_singleton.semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent_singleton.semantic_cache.stats()}
+
+@router.get("/profiler-gate", dependencies=[Depends(require_admin)])
+async def get_profiler_gate_stats():
+    """
+    How many chat turns skipped the profiler LLM call or were extracted locally, and the audited miss rate.
+    """
+    if agent_singleton.profile_gate is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent_singleton.profile_gate.stats()}
+
+@router.get("/profiler-batching", dependencies=[Depends(require_admin)])
+async def get_profiler_batching_stats():
+    """
+    Profile extractions served by a batched call, a single call or a single-call fallback, and the Groq requests saved.
+    """
+    if agent_singleton.profile_batcher is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent_singleton.profile_batcher.stats()}
+
+
+@router.get("/structured-outputs", dependencies=[Depends(require_admin)])
+async def get_structured_output_stats():
+    """
+    Per call site and schema: outputs that parsed, were repaired locally, needed only the failed fields re-asked,
+    needed a full retry or failed, and the estimated latency saved against repeating the full call.
+    """
+    return structured_output_stats()
+
+@router.get("/admission", dependencies=[Depends(require_admin)])
+async def get_admission_stats():
+    """
+    Concurrency, queue depth, measured service time and CoDel state of each admission gate.
+    """
+    return {name: gate.stats() for name, gate in admission_gates.items()}
+
+@router.get("/try-on-suggestions", dependencies=[Depends(require_admin)])
+async def get_try_on_suggestion_savings():
+    """
+    Requests per try-on suggestion mode, and the latency and tokens each mode saves per request compared with the full analysis path.
+    """
+    return try_on_service.suggestion_savings()
+
+@router.get("/try-on-results", dependencies=[Depends(require_admin)])
+async def get_try_on_result_cache():
+    """
+    Registered try-on results and the memory held by cached originals and transcoded variants.
+    """
+    return try_on_results.stats()
+
+@router.get("/model-routing", dependencies=[Depends(require_admin)])
+async def get_model_routing():
+    """
+    The active routing policy (tiers and per-site routes) and shadow A/B results: latency and output similarity per site and shadow tier.
+    """
+    return model_router.stats()
+
+@router.get("/embeddings", dependencies=[Depends(require_admin)])
+async def get_embedding_stats():
+    """
+    Embedding model and backend, whether it is loaded yet, micro-batch sizes, throughput (texts/sec) and average embed() latency.
+    """
+    return embedding_service.stats()
+
+@router.get("/event-loop", dependencies=[Depends(require_admin)])
+async def get_event_loop_lag():
+    """
+    How late this worker's event loop runs scheduled timers: average, worst in the last window, worst since start.
+    """
+    if loop_lag_monitor is None:
+        return {"enabled": False}
+    return {"enabled": True, **loop_lag_monitor.stats()}
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
 from ..services.tara_stylist import TaraStylistService, TaraResponse, VisualSuggestionsResponse
+from ..utils.structured_logging import get_logger
+from ..utils.uploads import as_payload
+from ..utils.serialization import NegotiatedResponse, dumps
+
+logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api/tara", tags=["Tara Stylist"])
 tara_service = TaraStylistService()
@@ -9,6 +15,7 @@ tara_service = TaraStylistService()
 class TaraRequest(BaseModel):
     image: str # Base64 encoded image
     prompt: str
+    parallel: bool = False # Generate the 4 options as concurrent calls
 
 class VisualizeRequest(BaseModel):
     original_image: str # Base64 encoded image
@@ -19,16 +26,45 @@ class VisualizeRequest(BaseModel):
 @router.post("/analyze", response_model=TaraResponse)
 async def analyze_style(request: TaraRequest):
     try:
-        # Remove header if present (data:image/jpeg;base64,)
-        if "," in request.image:
-            image_data = request.image.split(",")[1]
-        else:
-            image_data = request.image
-            
-        return await tara_service.generate_recommendations(image_data, request.prompt)
+        # A data URL is passed through as-is (no split/copy); bare base64 is wrapped once
+        image_data = as_payload(request.image)
+        return NegotiatedResponse(await tara_service.generate_recommendations(image_data, request.prompt, parallel=request.parallel))
     except Exception as e:
+        logger.error("Error in Tara analyze endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/analyze/stream")
+async def analyze_style_stream(request: TaraRequest, http_request: Request):
+    """
+    Progressive version of /analyze. Each TaraRecommendationOption is sent as soon
+    as it validates: Server-Sent Events when the client accepts text/event-stream,
+    NDJSON (one option per line) otherwise. A final "done" event carries the count;
+    an "error" event replaces it if the look couldn't be described or every option failed.
+    """
+    image_data = as_payload(request.image)
+
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    def encode(event: str, payload: dict) -> bytes:
+        if use_sse:
+            return b"event: " + event.encode() + b"\ndata: " + dumps(payload) + b"\n\n"
+        return dumps({"event": event, **payload}) + b"\n"
+
+    async def event_stream():
+        count = 0
+        try:
+            async for option in tara_service.stream_recommendations(image_data, request.prompt):
+                count += 1
+                yield encode("option", {"option": option})
+        except Exception as e:
+            logger.error("Error in Tara stream endpoint", exc_info=True)
+            yield encode("error", {"detail": str(e)})
+            return
+        yield encode("done", {"count": count})
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
 @router.post("/visualize", response_model=VisualSuggestionsResponse)
 async def visualize_category(request: VisualizeRequest):
     try:
@@ -45,4 +81,5 @@ async def visualize_category(request: VisualizeRequest):
             request.description
         )
     except Exception as e:
+        logger.error("Error in Tara visualize endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,62 +1,156 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import Response, JSONResponse
-from typing import List
-import base64
-from ..services.virtual_try_on import VirtualTryOnService
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from typing import Dict, List, Optional
+from ..services.virtual_try_on import SUGGESTION_MODES, VirtualTryOnService
+from ..services.try_on_results import (
+    RESULT_FORMATS, CachedImage, ResultNotFound, TryOnResultStore, UpstreamError, parse_range,
+)
+from ..routes.chat import analyzer_singleton
+from ..utils.structured_logging import get_logger
+from ..utils.uploads import read_image, read_upload
+
+logger = get_logger(__name__)
 
 router = APIRouter(
     prefix="/api/try-on",
     tags=["virtual-try-on"]
 )
 
-# Initialize service
-try_on_service = VirtualTryOnService()
+# Initialize service (sharing the chat analyzer, so suggestions can reuse its cached analyses)
+try_on_service = VirtualTryOnService(garment_analyzer=analyzer_singleton)
+try_on_results = TryOnResultStore.from_env()
+
+
+def _result_headers(result_id: str) -> Dict[str, str]:
+    return {
+        # result ids are never reused, so a variant never changes
+        "Cache-Control": f"private, max-age={int(try_on_results.ttl_seconds)}, immutable",
+        "Accept-Ranges": "bytes",
+        "X-Try-On-Result-Id": result_id,
+    }
+
+
+async def _stream_original(result_id: str) -> StreamingResponse:
+    media_type, length, chunks = await try_on_results.open_original(result_id)
+    headers = {**_result_headers(result_id), "Content-Location": f"/api/try-on/results/{result_id}"}
+    if length is not None:
+        headers["Content-Length"] = str(length)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def _image_response(request: Request, result_id: str, image: CachedImage, headers: Dict[str, str]) -> Response:
+    headers = {**_result_headers(result_id), **headers, "ETag": image.etag}
+    if image.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    size = len(image.data)
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None:
+        return Response(content=image.data, media_type=image.media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=image.data[start:end + 1], status_code=206, media_type=image.media_type, headers=headers)
 
 @router.post("/edit")
 async def edit_garment(
     human_image: UploadFile = File(...),
     garment_image: UploadFile = File(...),
-    prompt: str = Form(...)
+    prompt: str = Form(...),
+    response: str = Form("image")
 ):
     """
     Perform virtual try-on using Pixazo AI.
     Takes a human image and a garment image, and a description.
-    Returns the result image as PNG.
+    Streams the result image through as Pixazo sends it (response="image"), or with
+    response="json" returns its result id and URL, for /api/try-on/results/{result_id}.
     """
     try:
         if not human_image.content_type.startswith('image/') or not garment_image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Both files must be images")
+        if response not in ("image", "json"):
+            raise HTTPException(status_code=400, detail="response must be image or json")
             
-        human_bytes = await human_image.read()
-        garment_bytes = await garment_image.read()
+        human_bytes = await read_upload(human_image)
+        garment_bytes = await read_upload(garment_image)
         
-        result_image_bytes = await try_on_service.try_on(human_bytes, garment_bytes, prompt)
+        output_url = await try_on_service.generate(human_bytes, garment_bytes, prompt)
+        result_id = try_on_results.register(output_url)
         
-        return Response(content=result_image_bytes, media_type="image/png")
+        if response == "json":
+            return JSONResponse(content={"result_id": result_id, "url": f"/api/try-on/results/{result_id}"})
+        return await _stream_original(result_id)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in edit_garment endpoint: {str(e)}")
+        logger.error("Error in edit_garment endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/suggestions")
 async def get_suggestions(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    mode: Optional[str] = Form(None)
 ):
     """
     Analyze the uploaded image and generate 4 creative try-on prompts.
+    mode: "direct" (one vision call), "tags" (minimal tags, then a text call) or "full";
+    defaults to TRY_ON_SUGGESTION_MODE.
     """
     try:
         if not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
+        if mode is not None and mode not in SUGGESTION_MODES:
+            raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SUGGESTION_MODES)}")
             
-        image_bytes = await file.read()
-        # Convert to base64 for the analyzer
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
+        # Encoded once, straight into the data URL the analyzer sends
+        image = await read_image(file)
         
-        suggestions = await try_on_service.generate_suggestions(image_base64)
+        suggestions, used_mode = await try_on_service.generate_suggestions(image, mode=mode)
         
-        return JSONResponse(content={"suggestions": suggestions})
+        return JSONResponse(content={"suggestions": suggestions, "mode": used_mode})
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in get_suggestions endpoint: {str(e)}")
+        logger.error("Error in get_suggestions endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/results/{result_id}")
+async def get_result(
+    request: Request,
+    result_id: str,
+    format: str = Query("original"),
+    width: Optional[int] = Query(None, ge=16, le=4096),
+):
+    """
+    A try-on result image. format: "original" (as Pixazo made it), "webp", "jpeg"
+    (progressive) or "auto" (WebP if the Accept header allows it, else JPEG);
+    width downscales WebP/JPEG variants (snapped to a fixed set of sizes).
+    Supports If-None-Match and single byte ranges.
+    """
+    if format not in RESULT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(RESULT_FORMATS)}")
+    if format == "original" and width is not None:
+        raise HTTPException(status_code=400, detail="width needs format webp, jpeg or auto")
+    headers = {}
+    if format == "auto":
+        format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+        headers["Vary"] = "Accept"
+    try:
+        if format == "original":
+            image = try_on_results.cached_original(result_id)
+            if image is None:
+                if request.headers.get("range") is None:
+                    # first fetch: pass upstream's bytes through as they arrive
+                    return await _stream_original(result_id)
+                image = await try_on_results.original(result_id)
+        else:
+            image = await try_on_results.variant(result_id, format, width)
+    except ResultNotFound:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    except UpstreamError as e:
+        logger.warning("Try-on result download failed", extra={"result_id": result_id, "error": str(e)})
+        raise HTTPException(status_code=502, detail=str(e))
+    return _image_response(request, result_id, image, headers)
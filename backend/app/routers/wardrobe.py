@@ -0,0 +1,98 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+import asyncio
+import time
+from ..models import GarmentAnalysis
+from ..services.wardrobe_store import WardrobeStore
+from ..services.outfit_scorer import OutfitScorer
+
+router = APIRouter(
+    prefix="/api/wardrobe",
+    tags=["wardrobe"]
+)
+
+wardrobe_singleton = WardrobeStore.from_env()
+outfit_scorer = OutfitScorer.from_env()
+
+@router.get("/{user_id}/items")
+async def query_wardrobe(
+    user_id: str,
+    category: Optional[List[str]] = Query(None),
+    type: Optional[List[str]] = Query(None),
+    colors: Optional[List[str]] = Query(None),
+    patterns: Optional[List[str]] = Query(None),
+    style_aesthetic: Optional[List[str]] = Query(None),
+    vibe_mood: Optional[List[str]] = Query(None),
+):
+    """
+    Query a user's saved garments without the LLM, e.g.
+    /api/wardrobe/{user_id}/items?colors=navy&patterns=solid&category=tops&style_aesthetic=minimalist
+    Filters on different fields must all match; repeating a field matches any of its values.
+    """
+    filters = {
+        "category": category,
+        "type": type,
+        "colors": colors,
+        "patterns": patterns,
+        "style_aesthetic": style_aesthetic,
+        "vibe_mood": vibe_mood,
+    }
+    start = time.perf_counter()
+    items = await asyncio.to_thread(wardrobe_singleton.query, user_id, {k: v for k, v in filters.items() if v})
+    took_us = (time.perf_counter() - start) * 1_000_000
+    return {"count": len(items), "took_us": round(took_us, 1), "items": items}
+
+@router.post("/{user_id}/items")
+async def add_wardrobe_item(user_id: str, analysis: GarmentAnalysis):
+    """
+    Save a GarmentAnalysis (e.g. from /api/analyze-garment) to the user's wardrobe.
+    """
+    item_id = await asyncio.to_thread(wardrobe_singleton.add, user_id, analysis)
+    return {"item_id": item_id}
+
+@router.delete("/{user_id}/items/{item_id}")
+async def delete_wardrobe_item(user_id: str, item_id: int):
+    if not await asyncio.to_thread(wardrobe_singleton.remove, user_id, item_id):
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"deleted": item_id}
+
+@router.get("/{user_id}/outfits")
+async def suggest_outfits(
+    user_id: str,
+    size: int = Query(2, ge=2, le=3),
+    top_k: int = Query(5, ge=1, le=20),
+    explain: int = Query(3, ge=0, le=10),
+):
+    """
+    Rank every pair (size=2) or triple (size=3) of the user's saved garments by
+    local colour-harmony, style and category rules, and return the top_k.
+    Only the best `explain` outfits get a written hybrid recommendation from the LLM
+    (for triples, of their best-matching pair).
+    """
+    # imported here: chat imports this module for wardrobe_singleton
+    from ..routes.chat import analyzer_singleton
+
+    items = await asyncio.to_thread(wardrobe_singleton.items, user_id)
+    analyses = [GarmentAnalysis.model_validate(item) for item in items]
+    start = time.perf_counter()
+    outfits = await outfit_scorer.top_outfits(analyses, size=size, top_k=top_k)
+    took_ms = (time.perf_counter() - start) * 1000
+
+    hybrids = await asyncio.gather(*(
+        analyzer_singleton.generate_hybrid_recommendation(analyses[outfit.core_pair[0]], analyses[outfit.core_pair[1]])
+        for outfit in outfits[:explain]
+    ))
+    return {
+        "count": len(outfits),
+        "candidates_scored": len(analyses),
+        "took_ms": round(took_ms, 2),
+        "outfits": [
+            {
+                "item_ids": [items[i]["item_id"] for i in outfit.items],
+                "score": outfit.score,
+                "breakdown": outfit.breakdown,
+                "hybrid": hybrids[rank] if rank < len(hybrids) else None,
+            }
+            for rank, outfit in enumerate(outfits)
+        ],
+    }
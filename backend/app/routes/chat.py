@@ -1,32 +1,45 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional
-import base64
+from typing import Optional, List
+import asyncio
+import os
 from ..services.fashion_agent import FashionAgent
-from ..services.garment_analyzer import GarmentAnalyzer
+from ..services.garment_analyzer import GarmentAnalyzer, HybridRecommendation
+from ..models import GarmentAnalysis
+from ..services.batch_ingestion import BatchIngestionService
+from ..routers.wardrobe import wardrobe_singleton
+from ..utils.structured_logging import get_logger
+from ..utils.usage import bind_session
+from ..utils.uploads import read_image, read_upload
+from ..utils.serialization import NegotiatedResponse, dumps
+
+logger = get_logger(__name__)
 
 class ChatResponse(BaseModel):
     session_id: str
     answer: str
     model_used: str
 
-class AnalysisResponse(BaseModel):
-    category: str
-    type: str
-    style_aesthetic: list[str]
-    cultural_elements: list[str]
-    vibe_mood: list[str]
-    colors: list[str]
-    patterns: list[str]
-    preference_score: int
-    body_shape_tips: list[str]
-    styling_suggestions: list[str]
+class AnalysisResponse(GarmentAnalysis):
     image_data: str  # base64 encoded image for gallery
+    wardrobe_item_id: Optional[int] = None  # set when save_to_wardrobe was requested
+
+    @classmethod
+    def from_analysis(cls, analysis: GarmentAnalysis, image_data: str, wardrobe_item_id: Optional[int] = None) -> "AnalysisResponse":
+        # the analysis was validated when the model produced it; reuse its field values as they are
+        return cls.model_construct(**analysis.__dict__, image_data=image_data, wardrobe_item_id=wardrobe_item_id)
 
 router = APIRouter()
 
 agent_singleton = FashionAgent()
 analyzer_singleton = GarmentAnalyzer()
+batch_singleton = BatchIngestionService(
+    analyzer_singleton,
+    concurrency=int(os.environ.get("BATCH_CONCURRENCY", "4"))
+)
+
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "50"))
 
 def get_agent() -> FashionAgent:
     return agent_singleton
@@ -51,14 +64,11 @@ async def chat_with_agent(
         model_used = "GPT OSS"
         
         if image:
-            print(f"📸 Image received: {image.filename}, content_type: {image.content_type}")
-            contents = await image.read()
-            image_data = base64.b64encode(contents).decode("utf-8")
+            image_data = await read_image(image)
             model_used = "Llama 4 Maverik"
-            print(f"✅ Image encoded, size: {len(image_data)} chars")
+            logger.debug("Chat image received", extra={"image_name": image.filename, "content_type": image.content_type, "encoded_chars": image_data.encoded_size})
 
-        print(f"💬 Message: {message[:100]}...")
-        print(f"🤖 Using model: {model_used}")
+        logger.info("Chat turn", extra={"session_id": session_id, "message_chars": len(message), "model": model_used})
 
         answer, metadata = await agent.respond(
             session_id=session_id,
@@ -66,7 +76,7 @@ async def chat_with_agent(
             image_data=image_data
         )
 
-        print(f"✅ Response generated: {answer[:100]}...")
+        logger.debug("Chat response generated", extra={"answer_chars": len(answer)})
 
         return ChatResponse(
             session_id=metadata.get("session_id", session_id),
@@ -74,66 +84,88 @@ async def chat_with_agent(
             model_used=model_used
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Error in chat endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Error in chat endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing request: {str(e)}")
 
 @router.post("/analyze-garment", response_model=AnalysisResponse)
 async def analyze_garment(
     image: UploadFile = File(...),
     session_id: str = Form(default="default-session"),
+    save_to_wardrobe: bool = Form(default=False),
+    mode: Optional[str] = Form(default=None),
     analyzer: GarmentAnalyzer = Depends(get_analyzer)
 ):
     """
     StyleScan endpoint - Analyzes a garment image and returns structured data.
     Uses vision model to extract detailed fashion insights.
+    With save_to_wardrobe, the analysis is also added to the session's wardrobe index.
+    mode="local" skips the vision model and returns colours/pattern from the pixels only.
     """
+    if mode not in (None, "full", "local"):
+        raise HTTPException(status_code=400, detail="mode must be 'full' or 'local'")
+    # Read and encode image (413 past MAX_UPLOAD_BYTES)
+    image_data = await read_image(image)
     try:
-        print(f"\n{'='*60}")
-        print(f"🔍 StyleScan Analysis Request")
-        print(f"📸 Image: {image.filename}, type: {image.content_type}")
-        
-        # Read and encode image
-        contents = await image.read()
-        image_data = base64.b64encode(contents).decode("utf-8")
-        print(f"✅ Image encoded: {len(image_data)} chars")
+        bind_session(session_id)
+        logger.info("StyleScan analysis request", extra={"image_name": image.filename, "content_type": image.content_type, "encoded_chars": image_data.encoded_size})
         
         # Perform analysis
-        analysis = await analyzer.analyze(image_data, session_id)
+        analysis = await analyzer.analyze(image_data, session_id, mode=mode)
         
-        print(f"✅ Analysis complete:")
-        print(f"   Category: {analysis.category}")
-        print(f"   Type: {analysis.type}")
-        print(f"   Score: {analysis.preference_score}/100")
-        print(f"{'='*60}\n")
+        logger.info("StyleScan analysis complete", extra={"category": analysis.category, "garment_type": analysis.type, "score": analysis.preference_score})
+
+        wardrobe_item_id = await asyncio.to_thread(wardrobe_singleton.add, session_id, analysis) if save_to_wardrobe else None
         
-        # Return analysis with image data for gallery
-        return AnalysisResponse(
-            category=analysis.category,
-            type=analysis.type,
-            style_aesthetic=analysis.style_aesthetic,
-            cultural_elements=analysis.cultural_elements,
-            vibe_mood=analysis.vibe_mood,
-            colors=analysis.colors,
-            patterns=analysis.patterns,
-            preference_score=analysis.preference_score,
-            body_shape_tips=analysis.body_shape_tips,
-            styling_suggestions=analysis.styling_suggestions,
-            image_data=image_data
-        )
+        # Return analysis with image data for gallery; returning the Response skips FastAPI's re-validation
+        return NegotiatedResponse(AnalysisResponse.from_analysis(analysis, image_data.b64, wardrobe_item_id))
         
     except Exception as e:
-        print(f"❌ Error in analyze endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Error in analyze endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@router.post("/analyze-garments/batch")
+async def analyze_garments_batch(
+    images: List[UploadFile] = File(...),
+    session_id: str = Form(default="default-session"),
+    batch_id: Optional[str] = Form(default=None),
+    save_to_wardrobe: bool = Form(default=False),
+):
+    """
+    Wardrobe onboarding - analyze many garment photos in one request.
+    Streams NDJSON: a "batch" line with the batch_id, then one line per image
+    as soon as its analysis completes, then a "done" line. Exact duplicates are
+    reported instead of analyzed. Resubmit with the same batch_id to resume an
+    interrupted batch; already-analyzed images are returned without a new call.
+    With save_to_wardrobe, each new analysis is added to the session's wardrobe.
+    """
+    if len(images) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} images per batch")
+    for image in images:
+        if not (image.content_type or "").startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"{image.filename} is not an image")
+
+    bind_session(session_id)
+    # Upload files are closed once the handler returns, before the stream is sent.
+    # The batch run consumes this list, dropping each image's bytes once it is being analyzed.
+    payload = [(image.filename, await read_upload(image)) for image in images]
+    logger.info("Batch analysis request", extra={"images": len(payload), "batch_id": batch_id})
+
+    async def ndjson_stream():
+        async for event in batch_singleton.run(payload, session_id, batch_id=batch_id):
+            # resumed results were already saved by the run that produced them
+            if save_to_wardrobe and event["event"] == "result" and not event["resumed"]:
+                event["wardrobe_item_id"] = await asyncio.to_thread(wardrobe_singleton.add, session_id, GarmentAnalysis(**event["analysis"]))
+            yield dumps(event) + b"\n"
+
+    return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
 class CompareResponse(BaseModel):
     analysis1: AnalysisResponse
     analysis2: AnalysisResponse
-    hybrid: dict
+    hybrid: HybridRecommendation
 
 @router.post("/compare-garments", response_model=CompareResponse)
 async def compare_garments(
@@ -146,76 +178,30 @@ async def compare_garments(
     Compare two garments and generate hybrid recommendations.
     Analyzes both images and creates a combined style suggestion.
     """
+    # Process both images (413 past MAX_UPLOAD_BYTES)
+    image_data1 = await read_image(image1)
+    image_data2 = await read_image(image2)
     try:
-        print(f"\n{'='*60}")
-        print(f"🔍 StyleScan COMPARE Request")
-        print(f"📸 Image 1: {image1.filename}")
-        print(f"📸 Image 2: {image2.filename}")
-        
-        # Process both images
-        contents1 = await image1.read()
-        image_data1 = base64.b64encode(contents1).decode("utf-8")
-        
-        contents2 = await image2.read()
-        image_data2 = base64.b64encode(contents2).decode("utf-8")
-        
-        print(f"✅ Both images encoded")
+        bind_session(session_id)
+        logger.info("StyleScan compare request", extra={"image1_name": image1.filename, "image2_name": image2.filename})
         
         # Analyze both garments
-        print("🔍 Analyzing garment 1...")
         analysis1 = await analyzer.analyze(image_data1, f"{session_id}-1")
-        
-        print("🔍 Analyzing garment 2...")
         analysis2 = await analyzer.analyze(image_data2, f"{session_id}-2")
         
         # Generate hybrid recommendation
-        print("🔮 Generating hybrid recommendation...")
         hybrid = await analyzer.generate_hybrid_recommendation(analysis1, analysis2)
         
-        print(f"✅ Compare analysis complete!")
-        print(f"{'='*60}\n")
+        logger.info("StyleScan compare complete", extra={"style_score": hybrid.style_score})
         
-        return CompareResponse(
-            analysis1=AnalysisResponse(
-                category=analysis1.category,
-                type=analysis1.type,
-                style_aesthetic=analysis1.style_aesthetic,
-                cultural_elements=analysis1.cultural_elements,
-                vibe_mood=analysis1.vibe_mood,
-                colors=analysis1.colors,
-                patterns=analysis1.patterns,
-                preference_score=analysis1.preference_score,
-                body_shape_tips=analysis1.body_shape_tips,
-                styling_suggestions=analysis1.styling_suggestions,
-                image_data=image_data1
-            ),
-            analysis2=AnalysisResponse(
-                category=analysis2.category,
-                type=analysis2.type,
-                style_aesthetic=analysis2.style_aesthetic,
-                cultural_elements=analysis2.cultural_elements,
-                vibe_mood=analysis2.vibe_mood,
-                colors=analysis2.colors,
-                patterns=analysis2.patterns,
-                preference_score=analysis2.preference_score,
-                body_shape_tips=analysis2.body_shape_tips,
-                styling_suggestions=analysis2.styling_suggestions,
-                image_data=image_data2
-            ),
-            hybrid={
-                "combined_style": hybrid.combined_style,
-                "best_features_garment1": hybrid.best_features_garment1,
-                "best_features_garment2": hybrid.best_features_garment2,
-                "hybrid_suggestions": hybrid.hybrid_suggestions,
-                "recommended_search_terms": hybrid.recommended_search_terms,
-                "style_score": hybrid.style_score
-            }
-        )
+        return NegotiatedResponse(CompareResponse.model_construct(
+            analysis1=AnalysisResponse.from_analysis(analysis1, image_data1.b64),
+            analysis2=AnalysisResponse.from_analysis(analysis2, image_data2.b64),
+            hybrid=hybrid
+        ))
         
     except Exception as e:
-        print(f"❌ Error in compare endpoint: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.error("Error in compare endpoint", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Comparison failed: {str(e)}")
 
 @router.get("/health")
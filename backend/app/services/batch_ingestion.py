@@ -0,0 +1,138 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .garment_analyzer import GarmentAnalyzer
+from ..utils.metrics import registry
+from ..utils.structured_logging import get_logger
+from ..utils.uploads import ImagePayload, content_hash
+
+logger = get_logger(__name__)
+
+BATCH_IMAGES = registry.counter(
+    "fashion_batch_images_total", "Images received by the batch ingestion endpoint by outcome", ["outcome"]
+)
+
+
+@dataclass
+class _BatchState:
+    created_at: float
+    # content hash -> serialized GarmentAnalysis, for every image completed so far
+    results: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+class BatchIngestionService:
+    """
+    Analyzes a batch of wardrobe photos with bounded concurrency and yields
+    events as each one finishes.
+
+    Results are remembered per batch id (keyed by content hash) for `ttl_seconds`,
+    so a client whose stream was interrupted can resubmit with the same batch id
+    and only the images that never completed are sent to the vision model again.
+    """
+
+    def __init__(self, analyzer: GarmentAnalyzer, concurrency: int = 4, ttl_seconds: float = 3600.0, max_batches: int = 1000):
+        self.analyzer = analyzer
+        self.concurrency = concurrency
+        self.ttl_seconds = ttl_seconds
+        self.max_batches = max_batches
+        self._batches: "OrderedDict[str, _BatchState]" = OrderedDict()
+
+    def _get_batch(self, batch_id: Optional[str]) -> Tuple[str, _BatchState]:
+        now = time.time()
+        while self._batches:
+            oldest_id, oldest = next(iter(self._batches.items()))
+            if now - oldest.created_at <= self.ttl_seconds and len(self._batches) <= self.max_batches:
+                break
+            self._batches.pop(oldest_id)
+
+        if batch_id and batch_id in self._batches:
+            return batch_id, self._batches[batch_id]
+        batch_id = batch_id or uuid.uuid4().hex
+        state = self._batches[batch_id] = _BatchState(created_at=now)
+        return batch_id, state
+
+    async def run(
+        self,
+        images: List[Tuple[str, bytes]],
+        session_id: str,
+        batch_id: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Args:
+            images: (filename, raw bytes) pairs in upload order. The list is consumed:
+                each entry's bytes are released once its analysis starts.
+            session_id: forwarded to GarmentAnalyzer.analyze
+            batch_id: id from an earlier, interrupted run to resume it
+
+        Yields dict events: "batch" first, then one "result", "duplicate" or "error"
+        per image in completion order, and "done" last. Failed images are not
+        remembered, so resuming the batch analyzes them again.
+        """
+        batch_id, state = self._get_batch(batch_id)
+        hashes = [content_hash(data) for _, data in images]
+
+        first_index: Dict[str, int] = {}
+        pending: List[int] = []
+        events: List[Dict[str, Any]] = []
+        duplicates = resumed = 0
+        for index, digest in enumerate(hashes):
+            filename = images[index][0]
+            if digest in first_index:
+                images[index] = (filename, None)
+                duplicates += 1
+                events.append({"event": "duplicate", "index": index, "filename": filename, "hash": digest, "duplicate_of": first_index[digest]})
+                continue
+            first_index[digest] = index
+            if digest in state.results:
+                images[index] = (filename, None)
+                resumed += 1
+                events.append({"event": "result", "index": index, "filename": filename, "hash": digest, "resumed": True, "analysis": state.results[digest]})
+            else:
+                pending.append(index)
+
+        yield {"event": "batch", "batch_id": batch_id, "total": len(images), "to_analyze": len(pending), "duplicates": duplicates, "resumed": resumed}
+        for event in events:
+            yield event
+        BATCH_IMAGES.inc(duplicates, outcome="duplicate")
+        BATCH_IMAGES.inc(resumed, outcome="resumed")
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def analyze_one(index: int):
+            async with semaphore:
+                filename, data = images[index]
+                images[index] = (filename, None)
+                try:
+                    image = ImagePayload.from_bytes(data)
+                    del data
+                    return index, await self.analyzer.analyze(image, f"{session_id}-batch-{index}", raise_on_error=True), None
+                except Exception as e:
+                    return index, None, e
+
+        tasks = [asyncio.create_task(analyze_one(index)) for index in pending]
+        completed = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, analysis, error = await next_done
+                if error is not None:
+                    failed += 1
+                    BATCH_IMAGES.inc(outcome="error")
+                    logger.warning("Batch image failed", exc_info=error)
+                    yield {"event": "error", "index": index, "filename": images[index][0], "hash": hashes[index], "detail": str(error)}
+                    continue
+                completed += 1
+                BATCH_IMAGES.inc(outcome="analyzed")
+                result = analysis.model_dump()
+                state.results[hashes[index]] = result
+                yield {"event": "result", "index": index, "filename": images[index][0], "hash": hashes[index], "resumed": False, "analysis": result}
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        logger.info("Batch complete", extra={"batch_id": batch_id, "analyzed": completed, "failed": failed, "duplicates": duplicates, "resumed": resumed})
+        yield {"event": "done", "batch_id": batch_id, "analyzed": completed, "failed": failed, "duplicates": duplicates, "resumed": resumed}
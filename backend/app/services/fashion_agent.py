@@ -1,24 +1,130 @@
 from __future__ import annotations
-from typing import Annotated, TypedDict, Dict, Any, List
+import os
+import time
+from typing import Annotated, TypedDict, Dict, Any, List, Optional, Union
 
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import add_messages
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
-from ..utils.langchain_groq import get_groq_chat_llm
+from ..utils.model_routing import routed_llm
 from ..models import UserProfile
+from ..utils.metrics import track_stage, registry
+from ..utils.structured_logging import get_logger
+from ..utils.structured_repair import repairing_structured_output
+from ..utils.usage import usage_tracker, bind_session
+from .semantic_cache import SemanticCache
+from .profile_gate import ProfileGate
+from .profile_batcher import PROFILER_SYSTEM_PROMPT, ProfileBatcher
+from .session_store import create_session_store, VersionConflict
+from ..utils.uploads import ImagePayload, as_payload, content_hash
+
+logger = get_logger(__name__)
+
+# once a session exceeds SESSION_TOKEN_BUDGET it only sends this many recent messages
+ECONOMY_HISTORY_MESSAGES = 6
+
+# the semantic cache only answers when the session has at most this many prior messages,
+# i.e. before earlier turns can change what the right answer is
+SEMANTIC_CACHE_MAX_HISTORY = int(os.environ.get("SEMANTIC_CACHE_MAX_HISTORY", "0"))
+
+# attempts at saving a turn when other workers keep writing the same session
+SAVE_RETRIES = 3
+
+PROFILE_LIST_FIELDS = ["style_keywords", "clothing_types_liked", "colors"]
+
+# image descriptions kept per session (oldest dropped first)
+SESSION_MAX_IMAGES = int(os.environ.get("SESSION_MAX_IMAGES", "20"))
+
+IMAGE_DESCRIPTION_PROMPT = (
+   "Describe the fashion content of this image for a stylist who cannot see it, in at most 80 words: "
+   "each visible garment and accessory with its colour, pattern, fabric and fit, then the overall style. "
+   "No preamble."
+)
+
+CHAT_IMAGES = registry.counter(
+   "fashion_chat_image_descriptions_total", "Chat images by whether their description was already in the session", ["result"]
+)
+
+def merge_profile(profile: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+   """
+   Returns a new profile with `updates` applied: non-empty scalars overwrite,
+   list fields are unioned (keeping existing order first).
+   """
+   merged = profile.copy()
+   for key in ["name", "budget_tier"]:
+      if updates.get(key):
+         merged[key] = updates[key]
+   for key in PROFILE_LIST_FIELDS:
+      new_items = updates.get(key)
+      if new_items:
+         existing = list(merged.get(key, []))
+         existing.extend(item for item in new_items if item not in existing)
+         merged[key] = existing
+   return merged
+
+def profile_gains(profile: Dict[str, Any], updates: Dict[str, Any]) -> bool:
+   """
+   Whether `updates` adds anything to `profile`, ignoring case and surrounding
+   whitespace ("navy" after "Navy" is nothing new).
+   """
+   def key(value: Any) -> str:
+      return str(value).strip().casefold()
+
+   for field in ["name", "budget_tier"]:
+      if updates.get(field) and key(updates[field]) != key(profile.get(field) or ""):
+         return True
+   for field in PROFILE_LIST_FIELDS:
+      known = {key(item) for item in profile.get(field) or []}
+      if any(key(item) not in known for item in updates.get(field) or []):
+         return True
+   return False
+
+def build_chat_prompt(messages: List[BaseMessage], user_profile: Dict[str, Any], economy_mode: bool = False) -> List[BaseMessage]:
+   """System prompt with the user's profile, followed by the conversation history (trimmed in economy mode)."""
+   profile_text = "\n".join([f"- {k}: {v}" for k, v in user_profile.items() if v])
+   system_prompt = (
+      "You are a friendly fashion assistant. "
+      "Use the user's profile to personalize your advice.\n"
+      f"--- USER PROFILE ---\n{profile_text}\n--------------------"
+   )
+   if economy_mode:
+      messages = messages[-ECONOMY_HISTORY_MESSAGES:]
+   return [SystemMessage(content=system_prompt)] + messages
+
+def _latest_exchange(messages: List[BaseMessage]) -> tuple[str, str]:
+   """The user's message of this turn and the assistant reply it answered ("" if none)."""
+   for index in range(len(messages) - 1, -1, -1):
+      if isinstance(messages[index], HumanMessage):
+         previous = messages[index - 1] if index > 0 and isinstance(messages[index - 1], AIMessage) else None
+         content = messages[index].content
+         return (content if isinstance(content, str) else ""), (previous.content if previous is not None else "")
+   return "", ""
 
 # defining state
 # below one is the memory that will be passed between the nodes in the graph
 class AgentState(TypedDict):
-   messages: List[BaseMessage]
+   # add_messages appends what a node returns instead of replacing the whole history
+   messages: Annotated[List[BaseMessage], add_messages]
    user_profile: Dict[str,Any]
+   economy_mode: bool   # session is over its token budget -> cheaper model, shorter history, no profiler
 
 class FashionAgent:
    def __init__(self):
-      self._sessions: Dict[str, AgentState] = {}   #in memory storage temporarily
-      self.llm = get_groq_chat_llm()
+      # in-process by default; SESSION_STORE=sqlite shares sessions between workers
+      self.sessions = create_session_store()
+      # models come from the routing policy; over-budget sessions are routed to a smaller chat model
+      self.llm = routed_llm("agent.chat")
+      self.profiler_llm = routed_llm("agent.profiler")
+      # forces "userprofile" output, repairing near-misses instead of failing the turn's extraction
+      self.profile_extractor = repairing_structured_output(self.profiler_llm, UserProfile)
+      # only used to turn a chat image into text once; the conversation itself stays text-only
+      self.vision_llm = routed_llm("agent.vision")
 
       self.graph = self._build_graph()
+      self.semantic_cache = SemanticCache.from_env()   # None unless SEMANTIC_CACHE_ENABLED
+      self.profile_gate = ProfileGate.from_env()       # None if PROFILER_GATE_ENABLED is off
+      self.profile_batcher = ProfileBatcher.from_env(self.profiler_llm)   # None unless PROFILER_BATCH_ENABLED
 
    def _build_graph(self):
 
@@ -39,18 +145,12 @@ class FashionAgent:
       return workflow.compile()
 
    async def _chatbot_node(self, state: AgentState):
-      messages = state["messages"]
-      user_profile = state.get("user_profile",{})
-      profile_text = "\n".join([f"- {k}: {v}" for k, v in user_profile.items() if v])
-      system_prompt = (
-         "You are a friendly fashion assistant. "
-         "Use the user's profile to personalize your advice.\n"
-         f"--- USER PROFILE ---\n{profile_text}\n--------------------"
-      )
+      economy_mode = state.get("economy_mode", False)
       # combine system prompt + converstation history
-      prompt_messages = [SystemMessage(content=system_prompt)] + messages
+      prompt_messages = build_chat_prompt(state["messages"], state.get("user_profile", {}), economy_mode)
       # llm calling
-      response = await self.llm.ainvoke(prompt_messages)
+      with track_stage("agent.chatbot"):
+         response = await self.llm.ainvoke(prompt_messages)
       return {"messages": [response]}
 
 # the profiler node- the node analyses the messages to update the user profile
@@ -58,64 +158,152 @@ class FashionAgent:
        messages = state["messages"]
        current_profile = state.get("user_profile",{})
 
+       if state.get("economy_mode"):
+           # over budget: keep the profile we have rather than paying for another extraction
+           return {"user_profile": current_profile}
+
+       # most turns carry no new preference: decide locally whether the extraction call is needed
+       decision = None
+       audit = False
+       if self.profile_gate is not None:
+           user_text, previous_reply = _latest_exchange(messages)
+           decision = await self.profile_gate.classify(user_text, previous_reply)
+           audit = self.profile_gate.should_audit(decision)
+           if decision.decision != "llm":
+               current_profile = merge_profile(current_profile, decision.updates)
+               if not audit:
+                   logger.info("Profiler gated", extra={"decision": decision.decision, "profile_fields": sorted(decision.updates)})
+                   return {"user_profile": current_profile}
+
        # we only analyse last few messages to save tokens
        recent_conversation = messages[-3:]
-       # create a specialised llm that forces "userprofile" output
-       structured_llm = self.llm.with_structured_output(UserProfile)
-
-       extractor_prompt = ChatPromptTemplate.from_messages([
-           ("system", "You are an expert data analyst. Extract user fashion preferences from the conversation. "
-                      "Update the profile only if new info is found. If nothing new, leave fields empty."),
-           ("placeholder", "{messages}")
-       ])
-
-       # run the extraction chain
-       chain= extractor_prompt | structured_llm
-       extracted_data:UserProfile = await chain.ainvoke({"messages": recent_conversation})
-
-       updated_profile = current_profile.copy()
-
-       if extracted_data.name:
-           updated_profile["name"] = extracted_data.name
-       if extracted_data.budget_tier:
-           updated_profile["budget_tier"] = extracted_data.budget_tier
-       for key in ["style_keywords", "clothing_types_liked", "colors"]:
-           new_items = getattr(extracted_data, key)
-           if new_items:
-               existing = set(updated_profile.get(key, []))
-               existing.update(new_items)
-               updated_profile[key] = list(existing)
-
-       print(f"--- 🕵️ Profiler Update: {updated_profile} ---")
+       if self.profile_batcher is not None:
+           # shares one request with other sessions' extractions queued in the same window
+           extracted_data: UserProfile = await self.profile_batcher.extract(recent_conversation)
+       else:
+           extractor_prompt = ChatPromptTemplate.from_messages([
+               ("system", PROFILER_SYSTEM_PROMPT),
+               ("placeholder", "{messages}")
+           ])
+
+           # run the extraction chain
+           chain= extractor_prompt | self.profile_extractor
+           with track_stage("agent.profiler"):
+               extracted_data:UserProfile = await chain.ainvoke({"messages": recent_conversation})
+
+       updated_profile = merge_profile(current_profile, extracted_data.model_dump())
+       if audit:
+           # the gate's own result is already in current_profile; anything the LLM adds on top was missed
+           self.profile_gate.record_audit(decision, missed=profile_gains(current_profile, extracted_data.model_dump()))
+
+       # Full profile only at (sampled) DEBUG; INFO just says which fields are populated
+       logger.debug("Profiler update", extra={"profile": updated_profile})
+       logger.info("Profiler run", extra={"profile_fields": sorted(k for k, v in updated_profile.items() if v)})
        return {"user_profile": updated_profile}
 
-   async def respond(self, session_id: str, message: str) -> tuple[str, dict]:
+   async def _describe_image(self, image: ImagePayload) -> str:
+       message = HumanMessage(content=[{"type": "text", "text": IMAGE_DESCRIPTION_PROMPT}, image.message_part()])
+       with track_stage("agent.describe_image"):
+           response = await self.vision_llm.ainvoke([message])
+       return response.content.strip()
+
+   async def respond(self, session_id: str, message: str, image_data: Optional[Union[str, ImagePayload]] = None) -> tuple[str, dict]:
        """
        Main entry point for the API.
+
+       An image is described once by the vision model and the description is kept
+       in the session (keyed by content hash), so the turn, and every later turn
+       that refers back to it, is plain text. Sending the same image again in the
+       session reuses the stored description.
        """
        # 1. Load or Initialize Session State
-       if session_id not in self._sessions:
-           self._sessions[session_id] = {
-               "messages": [],
-               "user_profile": {}
-           }
-
-       current_state = self._sessions[session_id]
+       current_state, version = await self.sessions.load(session_id)
+       bind_session(session_id)
+       economy_mode = usage_tracker.is_over_budget(session_id)
+       if economy_mode:
+           logger.info("Session over token budget, using economy mode", extra={"session_id": session_id})
+
+       history = current_state["messages"]
+       profile_before = current_state["user_profile"]
+
+       new_images = {}
+       if image_data is not None:
+           image = as_payload(image_data)
+           image_hash = content_hash(image.raw())
+           description = current_state.get("images", {}).get(image_hash)
+           CHAT_IMAGES.inc(result="reused" if description else "described")
+           if description is None:
+               description = await self._describe_image(image)
+               new_images[image_hash] = description
+           message = f"{message}\n\n[Shared image: {description}]"
+
+       # image turns depend on the picture, not just the question, so they are never cached
+       cacheable = self.semantic_cache is not None and image_data is None and len(history) <= SEMANTIC_CACHE_MAX_HISTORY
+       if cacheable:
+           cached_answer = await self._cache_call(self.semantic_cache.lookup(message, profile_before))
+           if cached_answer is not None:
+               new_messages = [HumanMessage(content=message), AIMessage(content=cached_answer)]
+               await self._save_turn(session_id, current_state, version, new_messages, profile_before, profile_before)
+               return cached_answer, {"session_id": session_id, "cached": True}
+       elif self.semantic_cache is not None:
+           self.semantic_cache.record_skip()
 
        # 2. Add the user's new message to the state
-       current_state["messages"].append(HumanMessage(content=message))
+       human_message = HumanMessage(content=message)
 
        # 3. Run the Graph!
        # The graph handles the flow: Chatbot -> Profiler -> End
-       final_state = await self.graph.ainvoke(current_state)
+       started = time.perf_counter()
+       final_state = await self.graph.ainvoke({
+           "messages": history + [human_message],
+           "user_profile": profile_before,
+           "economy_mode": economy_mode,
+       })
 
-       # 4. Save the updated state back to memory
-       self._sessions[session_id] = final_state
+       # 4. Save the updated state back to the session store
+       new_messages = final_state["messages"][len(history):]
+       await self._save_turn(session_id, current_state, version, new_messages, profile_before, final_state["user_profile"], new_images)
 
        # 5. Return the chatbot's response (the last message)
        bot_response = final_state["messages"][-1].content
+       if cacheable:
+           self.semantic_cache.record_generation_latency(time.perf_counter() - started)
+           await self._cache_call(self.semantic_cache.store(message, profile_before, bot_response))
        return bot_response, {"session_id": session_id}
 
+   async def _cache_call(self, call):
+       # the cache is an optimisation: if embedding fails the turn still goes through the LLM
+       try:
+           return await call
+       except Exception:
+           logger.warning("Semantic cache unavailable", exc_info=True)
+           return None
+
+   async def _save_turn(self, session_id, state, version, new_messages, profile_before, profile_after, new_images=None):
+       """
+       Append this turn to the session with an optimistic version check. If another
+       worker saved the session in the meantime, replay the turn on top of its
+       version (messages appended, only the profile fields this turn changed
+       merged in) instead of overwriting it.
+       """
+       profile_updates = {k: v for k, v in profile_after.items() if v != profile_before.get(k)}
+       for attempt in range(SAVE_RETRIES):
+           new_state = {
+               **state,
+               "messages": state["messages"] + list(new_messages),
+               "user_profile": merge_profile(state["user_profile"], profile_updates),
+           }
+           if new_images:
+               images = {**state.get("images", {}), **new_images}
+               new_state["images"] = dict(list(images.items())[-SESSION_MAX_IMAGES:])
+           try:
+               await self.sessions.save(session_id, new_state, version)
+               return
+           except VersionConflict:
+               logger.info("Session version conflict, replaying turn", extra={"session_id": session_id, "attempt": attempt + 1})
+               state, version = await self.sessions.load(session_id)
+       raise VersionConflict(f"could not save session {session_id} after {SAVE_RETRIES} attempts")
+
        
 
 
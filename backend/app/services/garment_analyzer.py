@@ -1,9 +1,26 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple, Union
+import asyncio
+import os
 from langchain_core.messages import HumanMessage
-from ..utils.langchain_groq import get_groq_chat_llm
+from ..utils.model_routing import routed_llm
+from ..utils.metrics import track_stage
+from ..utils.structured_logging import get_logger
+from ..utils.structured_repair import repairing_structured_output
+from ..utils.image_features import GarmentHints, load_rgb, extract_colors, detect_pattern
+from ..utils.perceptual_hash import ImageFingerprint, NearDuplicateIndex, fingerprint
+from ..utils.uploads import ImagePayload, as_payload
 from ..models import GarmentAnalysis
 from pydantic import BaseModel, Field
 
+logger = get_logger(__name__)
+
+
+def _pixel_features(image_bytes: bytes) -> Tuple[GarmentHints, ImageFingerprint]:
+    # one decode for both the colour/pattern hints and the near-duplicate fingerprint
+    rgb = load_rgb(image_bytes)
+    return GarmentHints(colors=extract_colors(rgb), pattern=detect_pattern(rgb)), fingerprint(rgb)
+
+
 class HybridRecommendation(BaseModel):
     """Hybrid recommendation combining two garments"""
     combined_style: str = Field(..., description="Combined style description")
@@ -17,35 +34,79 @@ class GarmentAnalyzer:
     
     
     def __init__(self):
-        print("🎨 Initializing GarmentAnalyzer...")
-        # Use vision model for image analysis
-        self.vision_llm = get_groq_chat_llm(
-            model_name="meta-llama/llama-4-maverick-17b-128e-instruct", 
-            temperature=0.3  # Lower temperature for more consistent structured output
-        )
+        # Use vision model for image analysis (models and temperatures come from the routing policy)
+        self.vision_llm = routed_llm("garment.vision")
         # Text model for hybrid recommendations
-        self.text_llm = get_groq_chat_llm(
-            model_name="openai/gpt-oss-120b",
-            temperature=0.7
-        )
-        # Create structured output version
-        self.structured_llm = self.vision_llm.with_structured_output(GarmentAnalysis)
-        self.hybrid_llm = self.text_llm.with_structured_output(HybridRecommendation)
-        print("✅ GarmentAnalyzer ready (using meta-llama/llama-4-maverick-17b-128e-instruct)\n")
+        self.text_llm = routed_llm("garment.text")
+        # Create structured output version (out-of-range scores, truncated JSON etc. are repaired locally)
+        self.structured_llm = repairing_structured_output(self.vision_llm, GarmentAnalysis)
+        self.hybrid_llm = repairing_structured_output(self.text_llm, HybridRecommendation)
+        # "full" = vision model with local colour/pattern hints, "local" = pixels only, no LLM call
+        self.default_mode = os.environ.get("GARMENT_ANALYSIS_MODE", "full")
+        # analyses of earlier images, found again by perceptual hash when a re-encoded/resized copy comes in
+        self.duplicates = NearDuplicateIndex.from_env("garment")
+        logger.info("GarmentAnalyzer ready")
     
-    async def analyze(self, image_data: str, session_id: str = "default") -> GarmentAnalysis:
+    async def _local_features(self, image: ImagePayload) -> Tuple[Optional[GarmentHints], Optional[ImageFingerprint]]:
+        """Dominant colours, pattern and perceptual fingerprint from the pixels; (None, None) if the image can't be decoded."""
+        try:
+            with track_stage("garment.local_features"):
+                return await asyncio.to_thread(lambda: _pixel_features(image.raw()))
+        except Exception:
+            logger.warning("Local colour/pattern extraction failed", exc_info=True)
+            return None, None
+
+    async def cached_analysis(self, image_data: Union[str, ImagePayload]) -> Optional[GarmentAnalysis]:
+        """The stored full analysis of this image or a near-duplicate of it, without calling the LLM; None if there is none."""
+        if self.duplicates is None:
+            return None
+        image = as_payload(image_data)
+        try:
+            with track_stage("garment.fingerprint"):
+                # same decode path as _pixel_features, so the hash matches what analyze() stored
+                image_fp = await asyncio.to_thread(lambda: fingerprint(load_rgb(image.raw())))
+        except Exception:
+            logger.warning("Fingerprinting failed", exc_info=True)
+            return None
+        match = self.duplicates.lookup(image_fp)
+        if match is None:
+            return None
+        distance, stored = match
+        logger.info("Found cached analysis of a near-duplicate image", extra={"hamming_distance": distance})
+        return GarmentAnalysis.model_validate(stored)
+
+    async def analyze(
+        self,
+        image_data: Union[str, ImagePayload],
+        session_id: str = "default",
+        mode: Optional[str] = None,
+        raise_on_error: bool = False,
+    ) -> GarmentAnalysis:
         """
         Analyze a garment image and return structured insights.
         
         Args:
-            image_data: Base64 encoded image
+            image_data: ImagePayload, or a base64 string / data URL
             session_id: Optional session identifier for context
+            mode: "full" (default) or "local" for a pixels-only analysis without the LLM
+            raise_on_error: re-raise a failed vision call instead of returning the fallback analysis
             
         Returns:
             GarmentAnalysis object with detailed fashion insights
         """
-        print(f"🔍 Starting garment analysis...")
-        
+        mode = mode or self.default_mode
+        image = as_payload(image_data)
+        hints, image_fp = await self._local_features(image)
+        if image_fp is not None and self.duplicates is not None:
+            match = self.duplicates.lookup(image_fp)
+            if match is not None:
+                distance, stored = match
+                logger.info("Reusing analysis of a near-duplicate image", extra={"hamming_distance": distance})
+                return GarmentAnalysis.model_validate(stored)
+
+        if mode == "local":
+            return self._fallback_analysis(hints)
+
         # Create analysis prompt
         analysis_prompt = """You are an expert fashion analyst with deep knowledge of:
 - Garment categories, types, and construction
@@ -67,33 +128,39 @@ Analyze this garment image in detail. Provide:
 9. **Styling Suggestions**: Give 3-5 concrete styling ideas.
 
 Be specific, detailed, and fashion-forward in your analysis."""
+        if hints is not None:
+            analysis_prompt += "\n\n" + hints.as_prompt()
 
         # Construct vision message
         message = HumanMessage(content=[
             {"type": "text", "text": analysis_prompt},
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-            }
+            image.message_part()
         ])
         
         try:
-            print("📤 Sending to vision model for structured analysis...")
-            analysis: GarmentAnalysis = await self.structured_llm.ainvoke([message])
+            with track_stage("garment.analyze"):
+                analysis: GarmentAnalysis = await self.structured_llm.ainvoke([message])
             
-            print(f"✅ Analysis received:")
-            print(f"   - Category: {analysis.category} / {analysis.type}")
-            print(f"   - Aesthetics: {', '.join(analysis.style_aesthetic)}")
-            print(f"   - Score: {analysis.preference_score}/100")
+            logger.info("Garment analysis received", extra={"category": analysis.category, "garment_type": analysis.type, "score": analysis.preference_score})
+            logger.debug("Garment aesthetics", extra={"style_aesthetic": analysis.style_aesthetic})
+            if image_fp is not None and self.duplicates is not None:
+                self.duplicates.add(image_fp, analysis.model_dump())
             
             return analysis
             
         except Exception as e:
-            import traceback
-            print(f"❌ Error during analysis: {str(e)}")
-            traceback.print_exc()
+            if raise_on_error:
+                raise
+            logger.error("Error during analysis, returning fallback", exc_info=True)
             # Return a fallback analysis
-            print("🔄 Returning fallback analysis...")
+            return self._fallback_analysis(hints)
+
+    def _fallback_analysis(self, hints: Optional[GarmentHints]) -> GarmentAnalysis:
+        """
+        Analysis without the vision model. Colours and pattern come from the local
+        pixel analysis when it succeeded; everything else is generic.
+        """
+        if hints is None:
             return GarmentAnalysis(
                 category="Unknown",
                 type="Unable to analyze",
@@ -113,6 +180,27 @@ Be specific, detailed, and fashion-forward in your analysis."""
                     "Try different angles for better analysis"
                 ]
             )
+
+        colors = hints.color_names()
+        pattern = hints.pattern.label
+        return GarmentAnalysis(
+            category="Unknown",
+            type="Garment (quick color analysis)",
+            style_aesthetic=["Contemporary"],
+            cultural_elements=[],
+            vibe_mood=["Casual"],
+            colors=colors,
+            patterns=[pattern],
+            preference_score=50,
+            body_shape_tips=[
+                "Detailed fit and body shape tips need the full AI analysis"
+            ],
+            styling_suggestions=[
+                f"Anchor the outfit around the {colors[0].lower()} and keep the other pieces neutral",
+                "Pair with solid basics to let the pattern stand out" if pattern != "Solid"
+                else "Add a patterned or textured piece for contrast",
+            ]
+        )
     
     async def generate_hybrid_recommendation(
         self, 
@@ -129,8 +217,6 @@ Be specific, detailed, and fashion-forward in your analysis."""
         Returns:
             HybridRecommendation with combined insights and search terms
         """
-        print("🔮 Generating hybrid recommendation...")
-        
         prompt = f"""You are a creative fashion stylist. Two garments have been analyzed:
 
 **Garment 1:**
@@ -157,19 +243,18 @@ Create a hybrid style recommendation that:
 Be creative and fashion-forward!"""
 
         try:
-            recommendation: HybridRecommendation = await self.hybrid_llm.ainvoke([
-                HumanMessage(content=prompt)
-            ])
+            with track_stage("garment.hybrid"):
+                recommendation: HybridRecommendation = await self.hybrid_llm.ainvoke([
+                    HumanMessage(content=prompt)
+                ])
             
-            print(f"✅ Hybrid recommendation generated:")
-            print(f"   - Style: {recommendation.combined_style[:50]}...")
-            print(f"   - Compatibility: {recommendation.style_score}/100")
-            print(f"   - Search terms: {', '.join(recommendation.recommended_search_terms)}")
+            logger.info("Hybrid recommendation generated", extra={"style_score": recommendation.style_score})
+            logger.debug("Hybrid search terms", extra={"search_terms": recommendation.recommended_search_terms})
             
             return recommendation
             
         except Exception as e:
-            print(f"❌ Error generating hybrid: {str(e)}")
+            logger.error("Error generating hybrid recommendation", exc_info=True)
             return HybridRecommendation(
                 combined_style="Unable to generate hybrid recommendation",
                 best_features_garment1=["Analysis pending"],
@@ -0,0 +1,343 @@
+"""
+Local outfit-compatibility scoring over stored garment analyses.
+
+Each GarmentAnalysis is encoded once into small feature arrays: a one-hot
+garment role (top, bottom, dress, ...), a colour histogram over 12 hue bins
+plus a neutral bin, a patterned flag and a multi-hot style/vibe vector (or a
+sentence embedding of it). Every pair is then scored at once with matrix
+products:
+
+    harmony = colors @ HARMONY @ colors.T     (hue-wheel rules, neutrals go with anything)
+    style   = style @ style.T                 (cosine similarity)
+    roles   = roles @ COMPLEMENT @ roles.T    (top + bottom good, two tops invalid)
+
+and triples as the mean of their three pairs. Triples are only built on the
+`max_pairs` best valid pairs (each extended by every third garment), so work
+and memory grow with pairs x n rather than n^3; ranking runs in a worker
+thread. Only the top few outfits are worth a written LLM recommendation.
+"""
+import asyncio
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..models import GarmentAnalysis
+from ..utils.embeddings import embedding_service
+from ..utils.env import env_flag
+from ..utils.image_features import NAMED_COLORS, _hex_to_rgb, rgb_to_lab
+from ..utils.metrics import track_stage
+from .semantic_cache import EmbedFn
+
+ROLES = ("top", "bottom", "dress", "outerwear", "shoes", "accessory", "other")
+_ROLE_INDEX = {role: i for i, role in enumerate(ROLES)}
+
+# checked in this order against the garment type first, then its category
+_ROLE_WORDS = (
+    ("dress", ("dress", "gown", "jumpsuit", "romper", "saree", "sari", "lehenga", "anarkali")),
+    ("outerwear", ("outerwear", "jacket", "coat", "blazer", "cardigan", "parka", "trench", "bomber", "gilet", "vest", "shacket", "windbreaker")),
+    ("shoes", ("shoe", "footwear", "sneaker", "trainer", "boot", "heel", "sandal", "loafer", "flat", "pump", "mule", "oxford")),
+    ("accessory", ("accessory", "accessories", "bag", "belt", "scarf", "hat", "cap", "jewelry", "jewellery", "watch", "sunglasses")),
+    ("bottom", ("bottom", "jean", "pant", "trouser", "skirt", "short", "chino", "legging", "jogger", "culotte", "palazzo")),
+    ("top", ("top", "shirt", "t-shirt", "tee", "blouse", "sweater", "sweatshirt", "hoodie", "knit", "tank", "polo", "camisole", "kurta", "jumper", "pullover", "turtleneck", "crop")),
+)
+_ROLE_PATTERNS = [
+    (role, re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")(?:e?s)?\b"))
+    for role, words in _ROLE_WORDS
+]
+
+
+def _complement_matrix() -> np.ndarray:
+    """How well two roles go together in one outfit; 0 means they can't be worn together."""
+    pairs = {
+        ("top", "bottom"): 1.0,
+        ("top", "outerwear"): 0.7,
+        ("bottom", "outerwear"): 0.7,
+        ("dress", "outerwear"): 0.8,
+        ("top", "shoes"): 0.6,
+        ("bottom", "shoes"): 0.8,
+        ("dress", "shoes"): 0.8,
+        ("outerwear", "shoes"): 0.6,
+        ("top", "accessory"): 0.5,
+        ("bottom", "accessory"): 0.5,
+        ("dress", "accessory"): 0.6,
+        ("outerwear", "accessory"): 0.5,
+        ("shoes", "accessory"): 0.5,
+    }
+    matrix = np.zeros((len(ROLES), len(ROLES)), dtype=np.float32)
+    for (a, b), value in pairs.items():
+        matrix[_ROLE_INDEX[a], _ROLE_INDEX[b]] = matrix[_ROLE_INDEX[b], _ROLE_INDEX[a]] = value
+    other = _ROLE_INDEX["other"]
+    matrix[other, :other] = matrix[:other, other] = 0.3
+    return matrix
+
+
+COMPLEMENT = _complement_matrix()
+
+HUE_BINS = 12
+_NEUTRAL_BIN = HUE_BINS
+# wear-anything shades, whatever their measured chroma
+NEUTRAL_COLORS = {
+    "black", "charcoal", "grey", "light grey", "white", "ivory", "cream", "beige",
+    "khaki", "camel", "tan", "brown", "chocolate", "navy", "denim blue",
+}
+COLOR_ALIASES = {
+    "gray": "Grey", "light gray": "Light Grey", "silver": "Light Grey", "off-white": "Ivory",
+    "off white": "Ivory", "blue": "Royal Blue", "light blue": "Sky Blue", "dark blue": "Navy",
+    "indigo": "Navy", "denim": "Denim Blue", "green": "Forest Green", "sage": "Sage Green",
+    "wine": "Burgundy", "violet": "Purple", "lilac": "Lavender", "blush": "Blush Pink",
+    "nude": "Beige", "sand": "Beige", "stone": "Beige", "taupe": "Tan", "peach": "Coral",
+}
+
+
+def _harmony_matrix() -> np.ndarray:
+    """
+    Colour-harmony score between hue bins (30 degrees each) and the neutral bin:
+    monochrome and analogous hues, triads, split-complements and complements
+    score high, clashing in-between hues low; neutrals pair with everything.
+    """
+    by_distance = {0: 0.85, 1: 0.8, 2: 0.5, 3: 0.45, 4: 0.75, 5: 0.8, 6: 0.9}
+    matrix = np.empty((HUE_BINS + 1, HUE_BINS + 1), dtype=np.float32)
+    for i in range(HUE_BINS):
+        for j in range(HUE_BINS):
+            distance = abs(i - j)
+            matrix[i, j] = by_distance[min(distance, HUE_BINS - distance)]
+    matrix[_NEUTRAL_BIN, :] = matrix[:, _NEUTRAL_BIN] = 0.9
+    matrix[_NEUTRAL_BIN, _NEUTRAL_BIN] = 0.8
+    return matrix
+
+
+HARMONY = _harmony_matrix()
+# garments with no recognised colour: neither rewarded nor punished much
+UNKNOWN_HARMONY = 0.6
+
+_COLOR_BINS: Dict[str, int] = {}
+for _name, _hex in NAMED_COLORS.items():
+    _l, _a, _b = rgb_to_lab(np.array(_hex_to_rgb(_hex), dtype=np.float32))
+    if _name.lower() in NEUTRAL_COLORS or np.hypot(_a, _b) < 15:
+        _COLOR_BINS[_name.lower()] = _NEUTRAL_BIN
+    else:
+        _COLOR_BINS[_name.lower()] = int(np.degrees(np.arctan2(_b, _a)) % 360 // (360 / HUE_BINS))
+
+SOLID_PATTERNS = {"solid", "plain", "none", "no pattern", "block color", "colorblock"}
+
+
+def garment_role(analysis: GarmentAnalysis) -> str:
+    for text in (analysis.type, analysis.category):
+        text = (text or "").lower()
+        for role, pattern in _ROLE_PATTERNS:
+            if pattern.search(text):
+                return role
+    return "other"
+
+
+def color_bin(name: str) -> Optional[int]:
+    """Hue bin (or the neutral bin) of a colour name; None if it isn't a colour we know."""
+    key = name.lower().strip()
+    if key in _COLOR_BINS:
+        return _COLOR_BINS[key]
+    if key in COLOR_ALIASES:
+        return _COLOR_BINS[COLOR_ALIASES[key].lower()]
+    # "Midnight Navy", "Dusty Rose Pink": fall back to the last word we recognise
+    for word in reversed(key.replace("-", " ").split()):
+        if word in _COLOR_BINS:
+            return _COLOR_BINS[word]
+        if word in COLOR_ALIASES:
+            return _COLOR_BINS[COLOR_ALIASES[word].lower()]
+    return None
+
+
+def style_terms(analysis: GarmentAnalysis) -> List[str]:
+    # aesthetics come back as "Minimalist: Clean lines...", only the label counts
+    terms = [value.split(":", 1)[0] for value in analysis.style_aesthetic] + list(analysis.vibe_mood)
+    return sorted({term.strip().lower() for term in terms if term.strip()})
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+@dataclass
+class OutfitFeatures:
+    roles: np.ndarray       # (n, len(ROLES)) one-hot
+    colors: np.ndarray      # (n, HUE_BINS + 1) weights summing to 1, or all zero if unknown
+    patterned: np.ndarray   # (n,) 1.0 if the garment has a non-solid pattern
+    style: np.ndarray       # (n, d) unit-norm style vectors
+    preference: np.ndarray  # (n,) preference_score / 100
+
+
+@dataclass
+class ScoredOutfit:
+    items: Tuple[int, ...]
+    score: float
+    # the best-scoring pair within the outfit, the one to describe when only two garments can be
+    core_pair: Tuple[int, int] = (0, 0)
+    breakdown: Dict[str, float] = field(default_factory=dict)
+
+
+class OutfitScorer:
+    """
+    Ranks every pair or triple of a set of garments by a weighted sum of colour
+    harmony, style similarity, role complement and the user's preference
+    scores, minus a penalty for pairing two patterned pieces. Outfits must be
+    wearable: a dress, or a top and a bottom.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[EmbedFn] = None,
+        harmony_weight: float = 0.35,
+        style_weight: float = 0.3,
+        complement_weight: float = 0.25,
+        preference_weight: float = 0.1,
+        pattern_clash_penalty: float = 0.15,
+        max_pairs: int = 200,
+    ):
+        self.embed_fn = embed_fn
+        self.harmony_weight = harmony_weight
+        self.style_weight = style_weight
+        self.complement_weight = complement_weight
+        self.preference_weight = preference_weight
+        self.pattern_clash_penalty = pattern_clash_penalty
+        self.max_pairs = max_pairs
+
+    @classmethod
+    def from_env(cls) -> "OutfitScorer":
+        """
+        OUTFIT_STYLE_EMBEDDINGS (default off): compare styles with sentence embeddings instead of shared terms.
+        OUTFIT_MAX_PAIRS (default 200): best pairs that triples are built from.
+        """
+        use_embeddings = env_flag("OUTFIT_STYLE_EMBEDDINGS")
+        return cls(
+            embed_fn=embedding_service.embed if use_embeddings else None,
+            max_pairs=int(os.environ.get("OUTFIT_MAX_PAIRS", "200")),
+        )
+
+    async def features(self, analyses: List[GarmentAnalysis]) -> OutfitFeatures:
+        n = len(analyses)
+        roles = np.zeros((n, len(ROLES)), dtype=np.float32)
+        colors = np.zeros((n, HUE_BINS + 1), dtype=np.float32)
+        patterned = np.zeros(n, dtype=np.float32)
+        preference = np.zeros(n, dtype=np.float32)
+        terms = [style_terms(analysis) for analysis in analyses]
+        for i, analysis in enumerate(analyses):
+            roles[i, _ROLE_INDEX[garment_role(analysis)]] = 1.0
+            # the first listed colour is the dominant one
+            for rank, name in enumerate(analysis.colors):
+                bin_index = color_bin(name)
+                if bin_index is not None:
+                    colors[i, bin_index] += 1.0 / (rank + 1)
+            patterned[i] = float(any(p.lower().strip() not in SOLID_PATTERNS for p in analysis.patterns))
+            preference[i] = analysis.preference_score / 100.0
+        totals = colors.sum(axis=1, keepdims=True)
+        colors = colors / np.where(totals == 0, 1, totals)
+
+        if self.embed_fn is not None:
+            style = await self.embed_fn([", ".join(t) or "none" for t in terms])
+        else:
+            vocabulary = {term: j for j, term in enumerate(sorted({t for item in terms for t in item}))}
+            style = np.zeros((n, max(1, len(vocabulary))), dtype=np.float32)
+            for i, item in enumerate(terms):
+                for term in item:
+                    style[i, vocabulary[term]] = 1.0
+        return OutfitFeatures(roles, colors, patterned, _normalize_rows(np.asarray(style, dtype=np.float32)), preference)
+
+    def pair_components(self, f: OutfitFeatures) -> Dict[str, np.ndarray]:
+        """(n, n) matrices of each score component for every pair."""
+        harmony = f.colors @ HARMONY @ f.colors.T
+        known = f.colors.sum(axis=1) > 0
+        harmony = np.where(known[:, None] & known[None, :], harmony, UNKNOWN_HARMONY)
+        return {
+            "color_harmony": harmony,
+            "style": f.style @ f.style.T,
+            "complement": f.roles @ COMPLEMENT @ f.roles.T,
+            "preference": (f.preference[:, None] + f.preference[None, :]) / 2,
+            "pattern_clash": np.outer(f.patterned, f.patterned),
+        }
+
+    def pair_scores(self, components: Dict[str, np.ndarray]) -> np.ndarray:
+        return (
+            self.harmony_weight * components["color_harmony"]
+            + self.style_weight * components["style"]
+            + self.complement_weight * components["complement"]
+            + self.preference_weight * components["preference"]
+            - self.pattern_clash_penalty * components["pattern_clash"]
+        )
+
+    def _rank(self, f: OutfitFeatures, size: int, top_k: int) -> Tuple[Dict[str, np.ndarray], np.ndarray, List[Tuple[Tuple[int, ...], float]]]:
+        """(pair components, pair scores, best (items, score) first); pure numpy, run off the event loop."""
+        n = len(f.preference)
+        components = self.pair_components(f)
+        scores = self.pair_scores(components)
+        valid = components["complement"] > 0
+        dress, top, bottom = (f.roles[:, _ROLE_INDEX[r]] > 0 for r in ("dress", "top", "bottom"))
+        upper = np.triu(np.ones((n, n), dtype=bool), 1)
+
+        if size == 2:
+            wearable = dress[:, None] | dress[None, :] | (top[:, None] & bottom[None, :]) | (bottom[:, None] & top[None, :])
+            totals = np.where(valid & wearable & upper, scores, -np.inf).ravel()
+            candidates = int(np.isfinite(totals).sum())
+            k = min(top_k, candidates)
+            if k == 0:
+                return components, scores, []
+            best = np.argpartition(-totals, k - 1)[:k]
+            best = best[np.argsort(-totals[best])]
+            return components, scores, [
+                (tuple(int(x) for x in np.unravel_index(index, (n, n))), float(totals[index])) for index in best
+            ]
+
+        # triples: extend the best valid pairs with every third garment, (pairs, n) instead of (n, n, n)
+        pair_scores = np.where(valid & upper, scores, -np.inf).ravel()
+        m = min(self.max_pairs, int(np.isfinite(pair_scores).sum()))
+        if m == 0:
+            return components, scores, []
+        pairs = np.argpartition(-pair_scores, m - 1)[:m]
+        a, b = np.unravel_index(pairs, (n, n))
+        third = np.arange(n)
+        usable = valid[a] & valid[b] & (third[None, :] != a[:, None]) & (third[None, :] != b[:, None])
+        has_dress = dress[a][:, None] | dress[b][:, None] | dress[None, :]
+        has_top = top[a][:, None] | top[b][:, None] | top[None, :]
+        has_bottom = bottom[a][:, None] | bottom[b][:, None] | bottom[None, :]
+        triple = (scores[a, b][:, None] + scores[a] + scores[b]) / 3
+        totals = np.where(usable & (has_dress | (has_top & has_bottom)), triple, -np.inf).ravel()
+        candidates = int(np.isfinite(totals).sum())
+        # a triple can be reached from each of its three pairs
+        k = min(3 * top_k, candidates)
+        if k == 0:
+            return components, scores, []
+        best = np.argpartition(-totals, k - 1)[:k]
+        best = best[np.argsort(-totals[best])]
+        ranked, seen = [], set()
+        for index in best:
+            row, col = divmod(int(index), n)
+            items = tuple(sorted((int(a[row]), int(b[row]), col)))
+            if items not in seen:
+                seen.add(items)
+                ranked.append((items, float(totals[index])))
+        return components, scores, ranked[:top_k]
+
+    async def top_outfits(self, analyses: List[GarmentAnalysis], size: int = 2, top_k: int = 5) -> List[ScoredOutfit]:
+        """The `top_k` best outfits of `size` (2 or 3) garments, best first; indices refer to `analyses`."""
+        if size not in (2, 3):
+            raise ValueError("size must be 2 or 3")
+        if len(analyses) < size:
+            return []
+        with track_stage("outfits.score"):
+            f = await self.features(analyses)
+            components, scores, ranked = await asyncio.to_thread(self._rank, f, size, top_k)
+
+        outfits = []
+        for items, total in ranked:
+            pairs = [(a, b) for pos, a in enumerate(items) for b in items[pos + 1:]]
+            breakdown = {
+                name: round(float(np.mean([matrix[a, b] for a, b in pairs])), 3)
+                for name, matrix in components.items()
+            }
+            core_pair = max(pairs, key=lambda pair: scores[pair])
+            outfits.append(ScoredOutfit(
+                items=items, score=round(total * 100, 1), core_pair=core_pair, breakdown=breakdown,
+            ))
+        return outfits
@@ -0,0 +1,182 @@
+"""
+Cross-session micro-batching of profile extraction.
+
+Every chat turn that gets past the profile gate makes one small
+structured-output call with the same system prompt. At peak many sessions do
+this within a few milliseconds of each other, and each call counts against
+the Groq request rate limit. The batcher holds extraction jobs for up to
+`window_ms` (or until `max_batch` are waiting), sends them as one request with
+each conversation tagged by an id, and hands each session the profile
+returned under its id. Conversations the model skipped, and whole batches
+that fail, fall back to one call per conversation.
+"""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
+
+from ..models import UserProfile
+from ..utils.env import env_flag
+from ..utils.metrics import registry, track_stage
+from ..utils.structured_logging import get_logger
+from ..utils.structured_repair import repairing_structured_output
+from ..utils.usage import bind_session
+
+logger = get_logger(__name__)
+
+PROFILER_BATCH_JOBS = registry.counter(
+    "fashion_profiler_batch_jobs_total", "Profile extractions by how they were served", ["path"]
+)
+PROFILER_BATCH_SIZE = registry.histogram(
+    "fashion_profiler_batch_size", "Conversations per batched profile extraction call",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32),
+)
+
+PROFILER_SYSTEM_PROMPT = (
+    "You are an expert data analyst. Extract user fashion preferences from the conversation. "
+    "Update the profile only if new info is found. If nothing new, leave fields empty."
+)
+BATCH_INSTRUCTIONS = (
+    " You are given several independent conversations, each in a <conversation id=...> block. "
+    "Extract a separate profile for each one from that conversation alone, never mixing information "
+    "between conversations, and return exactly one entry per id."
+)
+
+
+class KeyedProfile(UserProfile):
+    conversation_id: str = Field(..., description="The id of the conversation this profile was extracted from")
+
+
+class BatchedProfiles(BaseModel):
+    profiles: List[KeyedProfile] = Field(..., description="One profile per conversation id")
+
+
+def _transcript(messages: List[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        content = message.content
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        role = "User" if message.type == "human" else "Assistant"
+        lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+class ProfileBatcher:
+    def __init__(self, llm, window_ms: float = 50.0, max_batch: int = 8):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.single_chain = ChatPromptTemplate.from_messages([
+            ("system", PROFILER_SYSTEM_PROMPT),
+            ("placeholder", "{messages}"),
+        ]) | repairing_structured_output(llm, UserProfile)
+        self.batch_llm = repairing_structured_output(llm, BatchedProfiles)
+        self._pending: List[Tuple[List[BaseMessage], asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.jobs = {"batched": 0, "single": 0, "fallback": 0}
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls, llm) -> Optional["ProfileBatcher"]:
+        """
+        PROFILER_BATCH_ENABLED (default off), PROFILER_BATCH_WINDOW_MS (default 50:
+        the longest a turn waits for others), PROFILER_BATCH_MAX_SIZE (default 8).
+        """
+        if not env_flag("PROFILER_BATCH_ENABLED"):
+            return None
+        return cls(
+            llm,
+            window_ms=float(os.environ.get("PROFILER_BATCH_WINDOW_MS", "50")),
+            max_batch=int(os.environ.get("PROFILER_BATCH_MAX_SIZE", "8")),
+        )
+
+    async def extract(self, messages: List[BaseMessage]) -> UserProfile:
+        """The profile update for one conversation, extracted together with whatever other sessions queued meanwhile."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((messages, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        # jobs whose request was cancelled while waiting aren't worth a call
+        batch = [(messages, future) for messages, future in batch if not future.done()]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _single(self, messages: List[BaseMessage], future: asyncio.Future, path: str) -> None:
+        self.calls += 1
+        try:
+            with track_stage("agent.profiler"):
+                profile = await self.single_chain.ainvoke({"messages": messages})
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        self.jobs[path] += 1
+        PROFILER_BATCH_JOBS.inc(path=path)
+        if not future.done():
+            future.set_result(profile)
+
+    async def _run(self, batch: List[Tuple[List[BaseMessage], asyncio.Future]]) -> None:
+        # one call serves several sessions, so its tokens aren't charged to whichever one came first
+        bind_session(None)
+        if len(batch) == 1:
+            await self._single(*batch[0], "single")
+            return
+
+        ids = [f"c{i + 1}" for i in range(len(batch))]
+        conversations = "\n\n".join(
+            f'<conversation id="{key}">\n{_transcript(messages)}\n</conversation>'
+            for key, (messages, _) in zip(ids, batch)
+        )
+        PROFILER_BATCH_SIZE.observe(len(batch))
+        self.calls += 1
+        try:
+            with track_stage("agent.profiler_batch"):
+                result: BatchedProfiles = await self.batch_llm.ainvoke([
+                    SystemMessage(content=PROFILER_SYSTEM_PROMPT + BATCH_INSTRUCTIONS),
+                    HumanMessage(content=conversations),
+                ])
+            by_id = {profile.conversation_id.strip(): profile for profile in result.profiles}
+        except Exception:
+            logger.warning("Batched profile extraction failed, falling back to single calls", extra={"batch_size": len(batch)}, exc_info=True)
+            by_id = {}
+
+        missing = []
+        for key, (messages, future) in zip(ids, batch):
+            profile = by_id.get(key)
+            if profile is None:
+                missing.append((messages, future))
+                continue
+            self.jobs["batched"] += 1
+            PROFILER_BATCH_JOBS.inc(path="batched")
+            if not future.done():
+                future.set_result(UserProfile(**profile.model_dump(exclude={"conversation_id"})))
+        if missing:
+            if by_id:
+                logger.warning("Batched profile extraction skipped conversations", extra={"missing": len(missing), "batch_size": len(batch)})
+            await asyncio.gather(*(self._single(messages, future, "fallback") for messages, future in missing))
+
+    def stats(self) -> Dict[str, Any]:
+        jobs = sum(self.jobs.values())
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "jobs": dict(self.jobs),
+            "llm_calls": self.calls,
+            "calls_saved": max(0, jobs - self.calls),
+        }
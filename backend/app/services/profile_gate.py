@@ -0,0 +1,272 @@
+import os
+import random
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.embeddings import embedding_service
+from ..utils.env import env_flag
+from ..utils.image_features import NAMED_COLORS
+from ..utils.metrics import registry
+from ..utils.structured_logging import get_logger
+from .semantic_cache import EmbedFn
+
+logger = get_logger(__name__)
+
+PROFILER_GATE = registry.counter(
+    "fashion_profiler_gate_total", "Chat turns by how the profile update was obtained", ["decision"]
+)
+PROFILER_GATE_AUDITS = registry.counter(
+    "fashion_profiler_gate_audits_total",
+    "Sampled gate decisions re-checked with the LLM extraction, by whether the gate missed a preference",
+    ["decision", "result"],
+)
+
+COLOR_TERMS = {name.lower() for name in NAMED_COLORS} | {
+    "red", "blue", "green", "yellow", "orange", "purple", "pink", "black", "white", "grey", "gray",
+    "brown", "beige", "navy", "teal", "olive", "maroon", "lilac", "turquoise", "silver", "nude",
+    "pastel", "pastels", "neutral", "neutrals", "earth tones", "jewel tones", "monochrome",
+}
+
+GARMENT_TERMS = {
+    "dress", "dresses", "gown", "skirt", "skirts", "jeans", "trousers", "pants", "chinos", "shorts",
+    "leggings", "joggers", "shirt", "shirts", "blouse", "blouses", "top", "tops", "tee", "t-shirt",
+    "t-shirts", "tank top", "crop top", "sweater", "sweaters", "jumper", "cardigan", "hoodie", "hoodies",
+    "sweatshirt", "jacket", "jackets", "blazer", "blazers", "coat", "coats", "trench coat", "parka",
+    "vest", "waistcoat", "suit", "suits", "jumpsuit", "romper", "kurta", "kurtas", "saree", "sari",
+    "lehenga", "salwar", "sneakers", "trainers", "boots", "heels", "loafers", "sandals", "flats",
+    "shoes", "bag", "bags", "handbag", "tote", "scarf", "scarves", "hat", "hats", "cap", "belt",
+    "jewellery", "jewelry", "earrings", "necklace", "watch",
+}
+
+STYLE_TERMS = {
+    "minimalist", "minimal", "bohemian", "boho", "streetwear", "vintage", "retro", "classic", "preppy",
+    "grunge", "punk", "gothic", "goth", "athleisure", "sporty", "casual", "smart casual", "formal",
+    "business casual", "elegant", "chic", "edgy", "romantic", "feminine", "androgynous", "y2k",
+    "cottagecore", "old money", "quiet luxury", "normcore", "ethnic", "indo-western", "oversized",
+    "tailored", "monochrome", "colorful", "colourful", "scandinavian", "french girl", "techwear",
+}
+
+BUDGET_TERMS = {
+    "cheap": "low", "affordable": "low", "inexpensive": "low", "on a budget": "low", "tight budget": "low",
+    "budget-friendly": "low", "budget friendly": "low", "low budget": "low", "student budget": "low",
+    "mid-range": "medium", "mid range": "medium", "moderate budget": "medium", "medium budget": "medium",
+    "reasonably priced": "medium",
+    "luxury": "high", "designer": "high", "high-end": "high", "high end": "high", "premium": "high",
+    "splurge": "high", "money is no object": "high", "high budget": "high",
+}
+
+_POSITIVE_CUE = re.compile(
+    r"\b(?:i|i'm|i am|i've|i have)\s+(?:really\s+|mostly\s+|usually\s+|always\s+)?"
+    r"(?:like|love|adore|prefer|enjoy|wear|live in|go for|gravitate to(?:wards)?|am into|'m into|been into|"
+    r"(?:a\s+)?(?:big\s+)?fan of)\b"
+    r"|\bmy (?:favou?rite|go-to|style|wardrobe|budget|signature)\b"
+    r"|\b(?:i'm|i am) (?:into|a fan of|all about)\b",
+    re.IGNORECASE,
+)
+_NEGATIVE_CUE = re.compile(
+    r"\b(?:don't|do not|never|not|hate|dislike|can't stand|no longer|avoid|anything but|except)\b",
+    re.IGNORECASE,
+)
+# case-insensitive lead-in, but the name itself must be capitalised
+_NAME_TRIVIAL = re.compile(r"\b(?i:my name is|my name's|call me)\s+([A-Z][a-zA-Z'-]{1,30})\b")
+_NAME_POSSIBLE = re.compile(r"\b(?i:i'm|i am|this is|it's)\s+[A-Z][a-z]+\b")
+_ASKED_PREFERENCE = re.compile(
+    r"\b(?:prefer|favou?rite|like to wear|your style|budget|your name|what colou?rs?|which colou?rs?)\b[^?]*\?",
+    re.IGNORECASE,
+)
+_SHARED_IMAGE = re.compile(r"\n\n\[Shared image: .*\]$", re.DOTALL)
+
+# example preference statements for the optional embedding check; they cover what the
+# lexicons can't list (decades, celebrities, vibes) in the register users actually write
+PREFERENCE_PROTOTYPES = [
+    "I love the 70s look with flared trousers",
+    "I mostly dress like a dark academia character",
+    "I want to look more like a rockstar",
+    "My wardrobe is all earthy, natural fabrics",
+    "I'm trying to dress more grown up for work",
+    "I usually go for oversized comfy fits",
+    "I can't afford expensive brands",
+    "Clean, simple, no logos is my thing",
+]
+
+
+def _lexicon_pattern(terms) -> "re.Pattern":
+    # longest first, so "trench coat" wins over "coat" at the same position; plurals match
+    # but only the lexicon term is captured ("blues" -> "blue")
+    alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+    return re.compile(r"(?<![\w-])(" + alternatives + r")(?:e?s)?(?![\w-])")
+
+
+_COLOR_PATTERN = _lexicon_pattern(COLOR_TERMS)
+_GARMENT_PATTERN = _lexicon_pattern(GARMENT_TERMS)
+_STYLE_PATTERN = _lexicon_pattern(STYLE_TERMS)
+_BUDGET_PATTERN = _lexicon_pattern(BUDGET_TERMS)
+
+
+def _find_terms(text: str, pattern: "re.Pattern") -> List[str]:
+    found = []
+    for term in pattern.findall(text):
+        if term not in found:
+            found.append(term)
+    return found
+
+
+@dataclass
+class GateDecision:
+    """
+    "skip": no preference signal, keep the profile as it is;
+    "local": trivial statement, `updates` were extracted without the LLM;
+    "llm": preference signal that needs the extraction call.
+    """
+    decision: str
+    updates: Dict[str, Any] = field(default_factory=dict)
+    reason: str = ""
+
+
+class ProfileGate:
+    """
+    Local pre-classifier in front of the profiler's LLM extraction.
+
+    Only the user's own text of the new turn is looked at (earlier turns were
+    already extracted, image descriptions are not preferences). A turn carries
+    a preference signal if it has a first-person preference cue, a name, a
+    budget term, a colour, garment or style term, or (optionally) is
+    embedding-close to example preference statements.
+    Positive, un-negated statements that only name colours, garments, styles,
+    a budget or a name are extracted locally; everything else goes to the LLM.
+
+    A fraction `audit_rate` of skipped and local decisions also runs the LLM
+    extraction; a miss is an audit where the LLM found profile information the
+    gate did not.
+    """
+
+    def __init__(
+        self,
+        audit_rate: float = 0.05,
+        embed_fn: Optional[EmbedFn] = None,
+        embedding_threshold: float = 0.55,
+    ):
+        self.audit_rate = audit_rate
+        self.embed_fn = embed_fn
+        self.embedding_threshold = embedding_threshold
+        self._prototypes: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.decisions = {"skip": 0, "local": 0, "llm": 0}
+        self.audits = {"skip": 0, "local": 0}
+        self.misses = {"skip": 0, "local": 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["ProfileGate"]:
+        """
+        PROFILER_GATE_ENABLED (default on), PROFILER_GATE_AUDIT_RATE (default 0.05),
+        PROFILER_GATE_EMBEDDINGS (default off; uses the shared embedding service),
+        PROFILER_GATE_EMBEDDING_THRESHOLD (default 0.55).
+        """
+        if not env_flag("PROFILER_GATE_ENABLED", default=True):
+            return None
+        use_embeddings = env_flag("PROFILER_GATE_EMBEDDINGS")
+        return cls(
+            audit_rate=float(os.environ.get("PROFILER_GATE_AUDIT_RATE", "0.05")),
+            embed_fn=embedding_service.embed if use_embeddings else None,
+            embedding_threshold=float(os.environ.get("PROFILER_GATE_EMBEDDING_THRESHOLD", "0.55")),
+        )
+
+    def classify_text(self, text: str, previous_reply: str = "") -> GateDecision:
+        """Lexicon-only decision for the user's message (`previous_reply`: the assistant turn it answers)."""
+        text = _SHARED_IMAGE.sub("", text)
+        lowered = text.lower()
+        colors = _find_terms(lowered, _COLOR_PATTERN)
+        garments = _find_terms(lowered, _GARMENT_PATTERN)
+        styles = _find_terms(lowered, _STYLE_PATTERN)
+        budget = _find_terms(lowered, _BUDGET_PATTERN)
+        name = _NAME_TRIVIAL.search(text)
+        positive = _POSITIVE_CUE.search(text) is not None
+        negative = _NEGATIVE_CUE.search(text) is not None
+        has_terms = bool(colors or garments or styles)
+
+        if name is None and _NAME_POSSIBLE.search(text):
+            return GateDecision("llm", reason="possible name")
+        answers_question = has_terms and _ASKED_PREFERENCE.search(previous_reply or "") is not None
+        if not (positive or name or budget or has_terms):
+            return GateDecision("skip", reason="no preference signal")
+        if negative or "?" in text or len(text) > 300:
+            return GateDecision("llm", reason="negated, question or long message")
+        if answers_question and not positive:
+            return GateDecision("llm", reason="answer to a preference question")
+        if has_terms and not positive:
+            # "I'm looking for a red dress for a wedding" - may or may not be a lasting preference
+            return GateDecision("llm", reason="known terms without a preference cue")
+        if positive and not (has_terms or budget):
+            # "I love that!" - a cue with nothing the lexicons recognise
+            return GateDecision("llm", reason="preference cue without known terms")
+
+        tiers = {BUDGET_TERMS[term] for term in budget}
+        if len(tiers) > 1:
+            return GateDecision("llm", reason="conflicting budget terms")
+        updates: Dict[str, Any] = {}
+        if name:
+            updates["name"] = name.group(1)
+        if tiers:
+            updates["budget_tier"] = tiers.pop()
+        if positive:
+            if colors:
+                updates["colors"] = [t.title() for t in colors]
+            if garments:
+                updates["clothing_types_liked"] = garments
+            if styles:
+                updates["style_keywords"] = [t.title() for t in styles]
+        return GateDecision("local", updates=updates, reason="trivial statement")
+
+    async def _embedding_signal(self, text: str) -> bool:
+        if self._prototypes is None:
+            vectors = await self.embed_fn(PREFERENCE_PROTOTYPES)
+            self._prototypes = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        vector = (await self.embed_fn([text]))[0]
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return False
+        return float((self._prototypes @ (vector / norm)).max()) >= self.embedding_threshold
+
+    async def classify(self, text: str, previous_reply: str = "") -> GateDecision:
+        decision = self.classify_text(text, previous_reply)
+        if decision.decision == "skip" and self.embed_fn is not None:
+            try:
+                if await self._embedding_signal(_SHARED_IMAGE.sub("", text)):
+                    decision = GateDecision("llm", reason="embedding match")
+            except Exception:
+                logger.warning("Profiler gate embedding check failed, using the LLM", exc_info=True)
+                decision = GateDecision("llm", reason="embedding check failed")
+        with self._lock:
+            self.decisions[decision.decision] += 1
+        PROFILER_GATE.inc(decision=decision.decision)
+        return decision
+
+    def should_audit(self, decision: GateDecision) -> bool:
+        return decision.decision != "llm" and random.random() < self.audit_rate
+
+    def record_audit(self, decision: GateDecision, missed: bool) -> None:
+        with self._lock:
+            self.audits[decision.decision] += 1
+            self.misses[decision.decision] += int(missed)
+        PROFILER_GATE_AUDITS.inc(decision=decision.decision, result="missed" if missed else "agreed")
+        if missed:
+            logger.info("Profiler gate missed a preference", extra={"decision": decision.decision, "reason": decision.reason})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.decisions.values())
+            return {
+                "decisions": dict(self.decisions),
+                "llm_calls_avoided_rate": (self.decisions["skip"] + self.decisions["local"]) / total if total else 0.0,
+                "audit_rate": self.audit_rate,
+                "audits": dict(self.audits),
+                "misses": dict(self.misses),
+                "miss_rate": {
+                    key: self.misses[key] / self.audits[key] if self.audits[key] else None for key in self.audits
+                },
+                "embeddings": self.embed_fn is not None,
+            }
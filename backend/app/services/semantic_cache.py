@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+from ..utils.embeddings import embedding_service
+from ..utils.env import env_flag
+from ..utils.metrics import registry
+from ..utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_REQUESTS = registry.counter(
+    "fashion_semantic_cache_requests_total", "Semantic cache lookups by result", ["result"]
+)
+CACHE_LATENCY_SAVED = registry.counter(
+    "fashion_semantic_cache_latency_saved_seconds_total", "Estimated generation time avoided by cache hits"
+)
+CACHE_ENTRIES = registry.gauge(
+    "fashion_semantic_cache_entries", "Answers currently held in the semantic cache"
+)
+
+# Only these profile fields change what a good generic answer looks like; the
+# name is deliberately left out (answers from named users are never stored).
+FINGERPRINT_FIELDS = ("budget_tier", "style_keywords", "clothing_types_liked", "colors")
+# vectors of recently missed questions, kept so store() doesn't embed them again
+_RECENT_VECTORS = 256
+
+EmbedFn = Callable[[List[str]], Awaitable[np.ndarray]]
+
+
+def normalize_question(question: str) -> str:
+    question = question.lower().strip()
+    question = re.sub(r"[^\w\s']", " ", question)
+    return re.sub(r"\s+", " ", question).strip()
+
+
+def profile_fingerprint(profile: Dict[str, Any]) -> str:
+    relevant = {}
+    for key in FINGERPRINT_FIELDS:
+        value = profile.get(key)
+        if isinstance(value, list):
+            value = sorted(str(v).lower() for v in value)
+        elif isinstance(value, str):
+            value = value.lower()
+        if value:
+            relevant[key] = value
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class _CacheEntry:
+    key: int
+    fingerprint: str
+    question: str
+    vector: np.ndarray
+    answer: str
+    created_at: float
+    hits: int = 0
+
+
+@dataclass
+class _Bucket:
+    """Entries sharing one profile fingerprint, with a lazily rebuilt vector matrix."""
+    entries: Dict[int, _CacheEntry] = field(default_factory=dict)
+    _matrix: Optional[np.ndarray] = None
+    _keys: List[int] = field(default_factory=list)
+
+    def invalidate(self) -> None:
+        self._matrix = None
+
+    def matrix(self):
+        if self._matrix is None:
+            self._keys = list(self.entries)
+            self._matrix = np.stack([self.entries[k].vector for k in self._keys]) if self._keys else np.empty((0, 0), dtype=np.float32)
+        return self._keys, self._matrix
+
+
+async def _default_embed(texts: List[str]) -> np.ndarray:
+    # The shared service loads its model on first use, so the server doesn't pay for it unless the cache is enabled
+    return await embedding_service.embed(texts)
+
+
+class SemanticCache:
+    """
+    Opt-in cache of chat answers for stateless, near-duplicate questions.
+
+    A lookup embeds the normalized question and compares it (cosine similarity)
+    against answers cached under the same profile fingerprint. Entries expire
+    after `ttl_seconds` and the least recently used are evicted past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[EmbedFn] = None,
+        threshold: float = 0.92,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 5000,
+    ):
+        self.embed_fn = embed_fn or _default_embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._buckets: Dict[str, _Bucket] = {}
+        self._lru: "OrderedDict[int, str]" = OrderedDict()  # key -> fingerprint, oldest first
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._recent_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # running average of a full generation, used to estimate time saved per hit
+        self._miss_latency_avg: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @classmethod
+    def from_env(cls) -> Optional["SemanticCache"]:
+        """Build a cache if SEMANTIC_CACHE_ENABLED is set, otherwise return None."""
+        if not env_flag("SEMANTIC_CACHE_ENABLED"):
+            return None
+        return cls(
+            threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            ttl_seconds=float(os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+            max_entries=int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "5000")),
+        )
+
+    async def _embed(self, question: str) -> np.ndarray:
+        normalized = normalize_question(question)
+        with self._lock:
+            # embedded by the lookup that missed just before this store
+            vector = self._recent_vectors.pop(normalized, None)
+        if vector is not None:
+            return vector
+        vector = (await self.embed_fn([normalized]))[0].astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remember_vector(self, question: str, vector: np.ndarray) -> None:
+        """Keep a missed question's vector for the store() that usually follows; caller holds the lock."""
+        self._recent_vectors[normalize_question(question)] = vector
+        while len(self._recent_vectors) > _RECENT_VECTORS:
+            self._recent_vectors.popitem(last=False)
+
+    def _remove(self, key: int) -> None:
+        fingerprint = self._lru.pop(key, None)
+        bucket = self._buckets.get(fingerprint)
+        if bucket is not None and bucket.entries.pop(key, None) is not None:
+            bucket.invalidate()
+            if not bucket.entries:
+                del self._buckets[fingerprint]
+
+    async def lookup(self, question: str, profile: Dict[str, Any]) -> Optional[str]:
+        start = time.perf_counter()
+        fingerprint = profile_fingerprint(profile)
+        if fingerprint not in self._buckets:
+            with self._lock:
+                self._record_miss()
+            return None
+
+        vector = await self._embed(question)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(fingerprint)
+            if bucket is not None:
+                expired = [k for k, e in bucket.entries.items() if now - e.created_at > self.ttl_seconds]
+                for key in expired:
+                    self._remove(key)
+            if fingerprint not in self._buckets:
+                self._remember_vector(question, vector)
+                self._record_miss()
+                return None
+
+            keys, matrix = bucket.matrix()
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self._remember_vector(question, vector)
+                self._record_miss()
+                return None
+
+            entry = bucket.entries[keys[best]]
+            entry.hits += 1
+            self._lru.move_to_end(entry.key)
+            self.hits += 1
+            saved = None
+            if self._miss_latency_avg is not None:
+                saved = max(0.0, self._miss_latency_avg - (time.perf_counter() - start))
+                self.latency_saved += saved
+
+        CACHE_REQUESTS.inc(result="hit")
+        if saved is not None:
+            CACHE_LATENCY_SAVED.inc(saved)
+        logger.debug("Semantic cache hit", extra={"similarity": float(scores[best]), "cached_question": entry.question})
+        return entry.answer
+
+    def _record_miss(self) -> None:
+        # caller holds the lock
+        self.misses += 1
+        CACHE_REQUESTS.inc(result="miss")
+
+    def record_skip(self) -> None:
+        CACHE_REQUESTS.inc(result="skipped")
+
+    def record_generation_latency(self, seconds: float) -> None:
+        if self._miss_latency_avg is None:
+            self._miss_latency_avg = seconds
+        else:
+            self._miss_latency_avg = 0.9 * self._miss_latency_avg + 0.1 * seconds
+
+    async def store(self, question: str, profile: Dict[str, Any], answer: str) -> None:
+        if profile.get("name"):
+            # answers to named users tend to address them by name
+            return
+        vector = await self._embed(question)
+        fingerprint = profile_fingerprint(profile)
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            bucket = self._buckets.setdefault(fingerprint, _Bucket())
+            bucket.entries[key] = _CacheEntry(
+                key=key,
+                fingerprint=fingerprint,
+                question=question,
+                vector=vector,
+                answer=answer,
+                created_at=time.time(),
+            )
+            bucket.invalidate()
+            self._lru[key] = fingerprint
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+            CACHE_ENTRIES.set(len(self._lru))
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._lru),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "avg_generation_seconds": self._miss_latency_avg,
+            "threshold": self.threshold,
+        }
@@ -0,0 +1,182 @@
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_core.messages import messages_from_dict, messages_to_dict
+
+from ..utils.metrics import registry
+from ..utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+SESSION_CONFLICTS = registry.counter(
+    "fashion_session_version_conflicts_total", "Session saves rejected because another worker wrote first"
+)
+SESSION_CACHE = registry.counter(
+    "fashion_session_read_cache_total", "Per-worker session read cache lookups", ["result"]
+)
+
+
+class VersionConflict(Exception):
+    """Raised when a session was modified by someone else since it was loaded."""
+
+
+def empty_session() -> Dict[str, Any]:
+    return {"messages": [], "user_profile": {}}
+
+
+def serialize_state(state: Dict[str, Any]) -> str:
+    payload = {key: value for key, value in state.items() if key != "messages"}
+    payload["messages"] = messages_to_dict(state.get("messages", []))
+    return json.dumps(payload)
+
+
+def deserialize_state(raw: str) -> Dict[str, Any]:
+    payload = json.loads(raw)
+    payload["messages"] = messages_from_dict(payload.get("messages", []))
+    return payload
+
+
+def _copy_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    # messages are never mutated in place, so a new list is enough; the profile's lists are, so deep-copy it
+    return {**state, "messages": list(state["messages"]), "user_profile": copy.deepcopy(state.get("user_profile", {}))}
+
+
+class InMemorySessionStore:
+    """
+    Single-process store with the same optimistic-versioning contract as the
+    shared stores. Version 0 means "session doesn't exist yet".
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+    async def load(self, session_id: str) -> Tuple[Dict[str, Any], int]:
+        version, state = self._sessions.get(session_id, (0, None))
+        if state is None:
+            return empty_session(), 0
+        # hand out a copy so callers can't mutate the stored state without saving
+        return _copy_state(state), version
+
+    async def save(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        current_version, _ = self._sessions.get(session_id, (0, None))
+        if current_version != expected_version:
+            SESSION_CONFLICTS.inc()
+            raise VersionConflict(f"session {session_id} is at version {current_version}, expected {expected_version}")
+        self._sessions[session_id] = (expected_version + 1, state)
+        return expected_version + 1
+
+
+class SQLiteSessionStore:
+    """
+    Session state shared by every worker process on a host through one SQLite
+    database in WAL mode (concurrent readers, one writer at a time).
+
+    Each row carries a version; `save` is a compare-and-swap on that version so
+    two workers can't silently overwrite each other. Loads first read only the
+    version and reuse the worker-local cached copy when it is still current,
+    skipping the transfer and deserialization of long histories.
+    """
+
+    def __init__(self, path: str, read_cache_size: int = 1000):
+        self.path = path
+        self.read_cache_size = read_cache_size
+        self._cache: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " state TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+        logger.info("SQLite session store ready", extra={"path": path})
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cache_get(self, session_id: str, version: int) -> Optional[Dict[str, Any]]:
+        with self._cache_lock:
+            entry = self._cache.get(session_id)
+            if entry is None or entry[0] != version:
+                return None
+            self._cache.move_to_end(session_id)
+            return entry[1]
+
+    def _cache_put(self, session_id: str, version: int, state: Dict[str, Any]) -> None:
+        with self._cache_lock:
+            self._cache[session_id] = (version, state)
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.read_cache_size:
+                self._cache.popitem(last=False)
+
+    def _load_sync(self, session_id: str) -> Tuple[Dict[str, Any], int]:
+        conn = self._connection()
+        row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return empty_session(), 0
+        version = row[0]
+
+        state = self._cache_get(session_id, version)
+        if state is not None:
+            SESSION_CACHE.inc(result="hit")
+        else:
+            SESSION_CACHE.inc(result="miss")
+            version, raw = conn.execute("SELECT version, state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            state = deserialize_state(raw)
+            self._cache_put(session_id, version, state)
+        return _copy_state(state), version
+
+    def _save_sync(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        raw = serialize_state(state)
+        conn = self._connection()
+        new_version = expected_version + 1
+        if expected_version == 0:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, version, state, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, new_version, raw, time.time()),
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE sessions SET version = ?, state = ?, updated_at = ? WHERE session_id = ? AND version = ?",
+                (new_version, raw, time.time(), session_id, expected_version),
+            )
+        if cursor.rowcount != 1:
+            SESSION_CONFLICTS.inc()
+            raise VersionConflict(f"session {session_id} changed since version {expected_version}")
+        self._cache_put(session_id, new_version, _copy_state(state))
+        return new_version
+
+    async def load(self, session_id: str) -> Tuple[Dict[str, Any], int]:
+        return await asyncio.to_thread(self._load_sync, session_id)
+
+    async def save(self, session_id: str, state: Dict[str, Any], expected_version: int) -> int:
+        return await asyncio.to_thread(self._save_sync, session_id, state, expected_version)
+
+
+def create_session_store():
+    """
+    SESSION_STORE=memory (default) keeps sessions in this process only.
+    SESSION_STORE=sqlite shares them across workers through SESSION_DB_PATH.
+    """
+    backend = os.environ.get("SESSION_STORE", "memory").lower()
+    if backend == "sqlite":
+        return SQLiteSessionStore(
+            os.environ.get("SESSION_DB_PATH", "./sessions.db"),
+            read_cache_size=int(os.environ.get("SESSION_READ_CACHE_SIZE", "1000")),
+        )
+    return InMemorySessionStore()
@@ -1,11 +1,18 @@
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Union
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage
-from ..utils.langchain_groq import get_groq_chat_llm
+from ..utils.model_routing import routed_llm
+from ..utils.metrics import track_stage
+from ..utils.structured_logging import get_logger
+from ..utils.structured_repair import repairing_structured_output
+from ..utils.perceptual_hash import NearDuplicateIndex, fingerprint
+from ..utils.uploads import ImagePayload, as_payload
 import httpx
 import os
 import asyncio
 
+logger = get_logger(__name__)
+
 class TaraRecommendationCategory(BaseModel):
     category_name: str = Field(..., description="Name of the category (e.g., Jewellery, Tops, Lower, Color Palette)")
     keywords: List[str] = Field(..., description="Few keywords describing the change/addition")
@@ -29,46 +36,77 @@ class VisualSuggestionsResponse(BaseModel):
 
 from dotenv import load_dotenv
 
+# One direction per option so the concurrent generations don't converge on the same look
+STYLE_DIRECTIONS = [
+    "Refined & elevated: polish the current look with cleaner lines and premium finishes",
+    "Bold & trend-forward: push the look toward current runway and street trends",
+    "Relaxed & effortless: a comfortable, easy-going take that still feels put together",
+    "Heritage & cultural: draw on traditional, vintage or regional fashion influences",
+]
+
 class TaraStylistService:
     def __init__(self):
-        print("🎨 Initializing TaraStylistService...")
         load_dotenv()
-        # Vision model for analyzing the image
-        self.vision_llm = get_groq_chat_llm(
-            model_name="meta-llama/llama-4-maverick-17b-128e-instruct", 
-            temperature=0.5
-        )
+        # Vision model for analyzing the image (models and temperatures come from the routing policy)
+        self.vision_llm = routed_llm("tara.vision")
         # Text model for generating structured recommendations
-        self.text_llm = get_groq_chat_llm(
-            model_name="openai/gpt-oss-120b",
-            temperature=0.7
-        )
-        self.structured_llm = self.text_llm.with_structured_output(TaraResponse)
+        self.text_llm = routed_llm("tara.text")
+        # invalid options are dropped and missing fields re-asked instead of failing the whole response
+        self.structured_llm = repairing_structured_output(self.text_llm, TaraResponse)
+        # Single-option schema for the parallel generation mode
+        self.option_llm = repairing_structured_output(self.text_llm, TaraRecommendationOption)
         self.unsplash_access_key = os.environ.get("UNSPLASH_ACCESS_KEY")
         
         if not self.unsplash_access_key:
-            print("⚠️ WARNING: UNSPLASH_ACCESS_KEY not found in environment variables!")
-        else:
-            print(f"✅ Unsplash Key loaded (starts with: {self.unsplash_access_key[:4]}...)")
+            logger.warning("UNSPLASH_ACCESS_KEY not found in environment variables")
+
+        # vision descriptions of earlier photos, reused for re-encoded/resized copies of the same look
+        self.descriptions = NearDuplicateIndex.from_env("tara")
             
-        print("✅ TaraStylistService ready")
+        logger.info("TaraStylistService ready")
+
+    async def describe_look(self, image_data: Union[str, ImagePayload]) -> str:
+        """
+        Run the vision stage once and return a text description of the current look.
+        The description is shared by every option generated for the same request,
+        and reused for later uploads that are perceptual near-duplicates.
+        """
+        image = as_payload(image_data)
+        image_fp = None
+        if self.descriptions is not None:
+            try:
+                with track_stage("tara.phash"):
+                    image_fp = await asyncio.to_thread(lambda: fingerprint(image.raw()))
+            except Exception:
+                logger.warning("Perceptual hash failed", exc_info=True)
+            if image_fp is not None:
+                match = self.descriptions.lookup(image_fp)
+                if match is not None:
+                    logger.info("Reusing description of a near-duplicate look", extra={"hamming_distance": match[0]})
+                    return match[1]
 
-    async def generate_recommendations(self, image_data: str, user_prompt: str) -> TaraResponse:
-        print("🔍 Starting Tara analysis...")
-        
-        # Step 1: Analyze image with Vision LLM to get a description
         vision_prompt = "Describe this person's outfit in detail, including clothing, accessories, colors, and overall style."
         message = HumanMessage(content=[
             {"type": "text", "text": vision_prompt},
-            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}}
+            image.message_part()
         ])
-        
-        try:
-            print("📤 Sending to vision model...")
+
+        with track_stage("tara.vision"):
             vision_response = await self.vision_llm.ainvoke([message])
-            current_look_description = vision_response.content
-            print("✅ Vision analysis complete")
-            
+        if image_fp is not None:
+            self.descriptions.add(image_fp, vision_response.content)
+        return vision_response.content
+
+    async def generate_recommendations(self, image_data: Union[str, ImagePayload], user_prompt: str, parallel: bool = False) -> TaraResponse:
+        try:
+            # Step 1: Analyze image with Vision LLM to get a description
+            current_look_description = await self.describe_look(image_data)
+
+            if parallel:
+                options = await self._generate_options(current_look_description, user_prompt)
+                logger.info("Tara recommendations generated", extra={"mode": "parallel", "options": len(options)})
+                return TaraResponse(options=options)
+
             # Step 2: Generate recommendations
             generation_prompt = f"""
             You are Tara, an expert AI stylist.
@@ -93,32 +131,124 @@ class TaraStylistService:
             Ensure the recommendations are actionable, creative, and strictly align with the user's request.
             """
             
-            print("🔮 Generating structured recommendations...")
-            response = await self.structured_llm.ainvoke(generation_prompt)
-            print("✅ Recommendations generated")
+            with track_stage("tara.text"):
+                response = await self.structured_llm.ainvoke(generation_prompt)
+            logger.info("Tara recommendations generated", extra={"mode": "single", "options": len(response.options)})
             return response
             
         except Exception as e:
-            print(f"❌ Error in Tara service: {str(e)}")
+            logger.error("Error in Tara service", exc_info=True)
             # Return empty/error response if needed, or let it bubble up
             raise e
 
-    async def get_visual_suggestions(self, original_image_data: str, category: str, keywords: List[str], description: str) -> VisualSuggestionsResponse:
-        print(f"🖼️ Fetching visual suggestions for {category}...")
+    async def _generate_options(self, current_look_description: str, user_prompt: str) -> List[TaraRecommendationOption]:
+        """
+        All options as concurrent calls, in id order. Same policy as the stream:
+        failed options are left out, and it raises only if every one failed.
+        """
+        tasks = [
+            asyncio.create_task(self._generate_option(current_look_description, user_prompt, option_id))
+            for option_id in range(1, len(STYLE_DIRECTIONS) + 1)
+        ]
+        try:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            # the request was cancelled: don't leave calls running (and billed)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        options = [result for result in results if isinstance(result, TaraRecommendationOption)]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            logger.warning("Tara option failed", exc_info=error)
+        if not options:
+            raise RuntimeError(f"All {len(tasks)} Tara options failed: {errors[-1]}") from errors[-1]
+        return options
+
+    async def stream_recommendations(self, image_data: Union[str, ImagePayload], user_prompt: str) -> AsyncIterator[TaraRecommendationOption]:
+        """
+        Generate the options as independent concurrent calls and yield each one
+        as soon as it validates, in completion order rather than id order.
+        Raises if every option failed, so callers can tell that from an empty result.
+        """
+        current_look_description = await self.describe_look(image_data)
+
+        tasks = [
+            asyncio.create_task(self._generate_option(current_look_description, user_prompt, option_id))
+            for option_id in range(1, len(STYLE_DIRECTIONS) + 1)
+        ]
+        yielded = 0
+        last_error: Optional[Exception] = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    option = await next_done
+                except Exception as e:
+                    # One failed option shouldn't take down the ones that are still coming
+                    logger.warning("Tara option failed", exc_info=True)
+                    last_error = e
+                    continue
+                yielded += 1
+                yield option
+            if yielded == 0 and last_error is not None:
+                raise RuntimeError(f"All {len(tasks)} Tara options failed: {last_error}") from last_error
+        finally:
+            # Client went away or the consumer stopped early: don't leave calls running
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _generate_option(self, current_look_description: str, user_prompt: str, option_id: int) -> TaraRecommendationOption:
+        direction = STYLE_DIRECTIONS[option_id - 1]
+        generation_prompt = f"""
+        You are Tara, an expert AI stylist.
+        
+        Current Look Description:
+        {current_look_description}
         
+        User's Request:
+        "{user_prompt}"
+        
+        Style Direction for this option:
+        {direction}
+        
+        Generate ONE recommendation option (id {option_id}) that follows the style direction above
+        while staying true to the user's request.
+        
+        Provide:
+        1. A summary title and description.
+        2. Detailed recommendations for the following categories:
+           - Jewelleries: What changes or additions?
+           - Tops: What changes or additions?
+           - Lower: What changes or additions?
+           - Color Palettes: Suggested colors.
+           - 2-3 other relevant categories (e.g., Shoes, Accessories, Hairstyle, Makeup) - Choose yourself based on the style.
+           
+        Ensure the recommendations are actionable, creative, and strictly align with the user's request.
+        """
+
+        with track_stage("tara.option"):
+            option: TaraRecommendationOption = await self.option_llm.ainvoke(generation_prompt)
+        # The model doesn't always echo the id it was given
+        option.id = option_id
+        logger.debug("Tara option generated", extra={"option_id": option_id})
+        return option
+
+    async def get_visual_suggestions(self, original_image_data: str, category: str, keywords: List[str], description: str) -> VisualSuggestionsResponse:
         # 1. Search Unsplash
         query = f"{' '.join(keywords)} {category} fashion"
-        print(f"🔍 Searching Unsplash for: {query}")
+        logger.info("Searching Unsplash", extra={"category": category, "query": query})
         
         unsplash_url = "https://api.unsplash.com/search/photos"
         headers = {"Authorization": f"Client-ID {self.unsplash_access_key}"}
         params = {"query": query, "per_page": 3, "orientation": "portrait"}
         
         try:
-            async with httpx.AsyncClient() as client:
-                resp = await client.get(unsplash_url, headers=headers, params=params)
-                resp.raise_for_status()
-                data = resp.json()
+            with track_stage("tara.unsplash_search"):
+                async with httpx.AsyncClient() as client:
+                    resp = await client.get(unsplash_url, headers=headers, params=params)
+                    resp.raise_for_status()
+                    data = resp.json()
                 
             image_results = data.get("results", [])
             suggestions = []
@@ -149,8 +279,8 @@ class TaraStylistService:
                     {"type": "image_url", "image_url": {"url": img_url}}
                 ])
                 
-                print(f"🧠 Analyzing suitability for image...")
-                llm_response = await self.vision_llm.ainvoke([message])
+                with track_stage("tara.visual_reasoning"):
+                    llm_response = await self.vision_llm.ainvoke([message])
                 reasoning = llm_response.content
                 
                 suggestions.append(VisualSuggestion(
@@ -161,6 +291,6 @@ class TaraStylistService:
             return VisualSuggestionsResponse(suggestions=suggestions)
             
         except Exception as e:
-            print(f"❌ Error fetching visual suggestions: {str(e)}")
+            logger.error("Error fetching visual suggestions", exc_info=True)
             # Return empty list on error to avoid breaking UI
             return VisualSuggestionsResponse(suggestions=[])
@@ -0,0 +1,287 @@
+"""
+Try-on result images: streamed from Pixazo, transcoded on demand, cached.
+
+A finished try-on is registered under a result id that points at Pixazo's
+output URL. The first request for the original streams Pixazo's response
+straight through, chunk by chunk, instead of downloading it completely before
+answering; the bytes are kept as they pass so later requests (and variants)
+don't go back upstream.
+
+Variants (WebP or progressive JPEG, downscaled to one of VARIANT_WIDTHS) are
+encoded in a small thread pool (Pillow releases the GIL while it decodes,
+resizes and encodes) and kept in a byte-bounded LRU cache with a strong ETag,
+so gallery thumbnails are one encode per result and size, then 304s and Range
+requests from memory.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import secrets
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from ..utils.metrics import registry, track_stage
+from ..utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+TRY_ON_RESULT_REQUESTS = registry.counter(
+    "fashion_try_on_result_requests_total", "Try-on result image requests by variant and how they were served", ["format", "source"]
+)
+TRY_ON_RESULT_CACHE_BYTES = registry.gauge(
+    "fashion_try_on_result_cache_bytes", "Bytes of try-on originals and variants held in memory"
+)
+
+RESULT_FORMATS = ("original", "webp", "jpeg", "auto")
+# requested widths snap up to one of these, so each result has a handful of variants at most
+VARIANT_WIDTHS = (160, 320, 480, 640, 960, 1280, 1920)
+_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class ResultNotFound(Exception):
+    pass
+
+
+class UpstreamError(Exception):
+    pass
+
+
+@dataclass
+class CachedImage:
+    data: bytes
+    media_type: str
+    etag: str
+
+
+@dataclass
+class _Result:
+    url: str
+    created_at: float
+
+
+def snap_width(width: Optional[int]) -> Optional[int]:
+    if width is None:
+        return None
+    for candidate in VARIANT_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return VARIANT_WIDTHS[-1]
+
+
+def transcode(data: bytes, fmt: str, width: Optional[int], quality: int) -> bytes:
+    """Re-encode an image as WebP or progressive JPEG, downscaled (never upscaled) to `width`."""
+    image = Image.open(io.BytesIO(data))
+    image.draft("RGB", (width, width * 4) if width else image.size)
+    if width and image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    if fmt == "webp":
+        image.save(out, "WEBP", quality=quality, method=4)
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(out, "JPEG", quality=quality, progressive=True, optimize=True)
+    return out.getvalue()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single `bytes=` range; None to serve the whole
+    body (no header, or several ranges). Raises ValueError if unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            start, end = max(0, size - int(end_text)), size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(f"range not satisfiable for {size} bytes")
+    return start, end
+
+
+class TryOnResultStore:
+    def __init__(
+        self,
+        ttl_seconds: float = 3600.0,
+        max_results: int = 1000,
+        max_cache_bytes: int = 256 * 1024 * 1024,
+        workers: int = 2,
+        quality: int = 82,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_results = max_results
+        self.max_cache_bytes = max_cache_bytes
+        self.quality = quality
+        self._results: "OrderedDict[str, _Result]" = OrderedDict()
+        self._cache: "OrderedDict[Tuple[str, str, Optional[int]], CachedImage]" = OrderedDict()
+        self._cache_bytes = 0
+        self._inflight: Dict[Tuple[str, str, Optional[int]], asyncio.Future] = {}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="try-on-transcode")
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def from_env(cls) -> "TryOnResultStore":
+        """
+        TRY_ON_RESULT_TTL_SECONDS (default 3600), TRY_ON_RESULT_MAX (default 1000 results),
+        TRY_ON_CACHE_MAX_MB (default 256), TRY_ON_TRANSCODE_WORKERS (default 2),
+        TRY_ON_TRANSCODE_QUALITY (default 82).
+        """
+        return cls(
+            ttl_seconds=float(os.environ.get("TRY_ON_RESULT_TTL_SECONDS", "3600")),
+            max_results=int(os.environ.get("TRY_ON_RESULT_MAX", "1000")),
+            max_cache_bytes=int(float(os.environ.get("TRY_ON_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            workers=int(os.environ.get("TRY_ON_TRANSCODE_WORKERS", "2")),
+            quality=int(os.environ.get("TRY_ON_TRANSCODE_QUALITY", "82")),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0))
+        return self._client
+
+    def register(self, output_url: str) -> str:
+        result_id = secrets.token_urlsafe(12)
+        self._results[result_id] = _Result(output_url, time.time())
+        while len(self._results) > self.max_results:
+            oldest, _ = self._results.popitem(last=False)
+            self._drop_cached(oldest)
+        return result_id
+
+    def _result(self, result_id: str) -> _Result:
+        result = self._results.get(result_id)
+        if result is None:
+            raise ResultNotFound(result_id)
+        if time.time() - result.created_at > self.ttl_seconds:
+            del self._results[result_id]
+            self._drop_cached(result_id)
+            raise ResultNotFound(result_id)
+        return result
+
+    def _drop_cached(self, result_id: str) -> None:
+        for key in [key for key in self._cache if key[0] == result_id]:
+            self._cache_bytes -= len(self._cache.pop(key).data)
+        TRY_ON_RESULT_CACHE_BYTES.set(self._cache_bytes)
+
+    def _cached(self, key) -> Optional[CachedImage]:
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+        return image
+
+    def _store(self, key, data: bytes, media_type: str) -> CachedImage:
+        image = CachedImage(data, media_type, '"' + hashlib.sha1(data).hexdigest()[:32] + '"')
+        if len(data) > self.max_cache_bytes:
+            return image
+        if key not in self._cache:
+            self._cache[key] = image
+            self._cache_bytes += len(data)
+        while self._cache_bytes > self.max_cache_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= len(evicted.data)
+        TRY_ON_RESULT_CACHE_BYTES.set(self._cache_bytes)
+        return image
+
+    def cached_original(self, result_id: str) -> Optional[CachedImage]:
+        self._result(result_id)
+        return self._cached((result_id, "original", None))
+
+    async def open_original(self, result_id: str) -> Tuple[str, Optional[int], AsyncIterator[bytes]]:
+        """
+        Start streaming the original from upstream: (media type, content length if
+        known, chunk iterator). The upstream status is checked before returning, so
+        the caller can still answer with an error; the bytes are cached once the
+        stream completes.
+        """
+        result = self._result(result_id)
+        request = self.client.build_request("GET", result.url)
+        with track_stage("try_on.download"):
+            response = await self.client.send(request, stream=True)
+        if response.status_code != 200:
+            await response.aclose()
+            raise UpstreamError(f"Failed to download result image: {response.status_code}")
+        media_type = response.headers.get("content-type", "image/png").split(";")[0]
+        length = response.headers.get("content-length")
+        TRY_ON_RESULT_REQUESTS.inc(format="original", source="stream")
+
+        async def chunks() -> AsyncIterator[bytes]:
+            received = bytearray()
+            try:
+                async for chunk in response.aiter_bytes():
+                    received.extend(chunk)
+                    yield chunk
+            finally:
+                await response.aclose()
+            # only reached if the whole body went through
+            self._store((result_id, "original", None), bytes(received), media_type)
+
+        return media_type, int(length) if length else None, chunks()
+
+    async def original(self, result_id: str) -> CachedImage:
+        """The complete original, from the cache or downloaded into it."""
+        key = (result_id, "original", None)
+        image = self._cached(key)
+        if image is not None:
+            return image
+        media_type, _, chunks = await self.open_original(result_id)
+        data = b"".join([chunk async for chunk in chunks])
+        return self._cached(key) or CachedImage(data, media_type, '"' + hashlib.sha1(data).hexdigest()[:32] + '"')
+
+    async def variant(self, result_id: str, fmt: str, width: Optional[int]) -> CachedImage:
+        """A WebP / progressive JPEG rendition at a snapped width, encoded once and cached."""
+        self._result(result_id)
+        width = snap_width(width)
+        key = (result_id, fmt, width)
+        image = self._cached(key)
+        if image is not None:
+            TRY_ON_RESULT_REQUESTS.inc(format=fmt, source="cache")
+            return image
+        # concurrent requests for the same variant share one encode
+        pending = self._inflight.get(key)
+        if pending is not None:
+            TRY_ON_RESULT_REQUESTS.inc(format=fmt, source="cache")
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            original = await self.original(result_id)
+            with track_stage("try_on.transcode"):
+                data = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, transcode, original.data, fmt, width, self.quality
+                )
+            image = self._store(key, data, _MEDIA_TYPES[fmt])
+            TRY_ON_RESULT_REQUESTS.inc(format=fmt, source="transcode")
+            future.set_result(image)
+            return image
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark it retrieved: often nobody else was waiting on it
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "results": len(self._results),
+            "cached_images": len(self._cache),
+            "cache_bytes": self._cache_bytes,
+            "cache_limit_bytes": self.max_cache_bytes,
+        }
@@ -3,29 +3,87 @@ import io
 import base64
 import httpx
 import json
-from typing import List, Optional, Dict, Any
+import re
+from typing import List, Optional, Dict, Any, Tuple, Union
 from PIL import Image
+from pydantic import BaseModel, Field
 from .garment_analyzer import GarmentAnalyzer
-from ..utils.langchain_groq import get_groq_chat_llm
+from ..models import GarmentAnalysis
+from ..utils.model_routing import routed_llm
+from ..utils.metrics import registry, track_stage
+from ..utils.structured_logging import get_logger
+from ..utils.uploads import ImagePayload, as_payload
+from ..utils.usage import usage_tracker
 from langchain_core.messages import HumanMessage
 
+logger = get_logger(__name__)
+
+TRY_ON_SUGGESTIONS = registry.counter(
+    "fashion_try_on_suggestions_total", "Try-on suggestion requests by the mode that served them", ["mode"]
+)
+
+SUGGESTION_MODES = ("direct", "tags", "full")
+
+QUICK_TAGS_PROMPT = """Look at the garment in this photo and return only:
+- category: e.g. Tops, Bottoms, Outerwear, Dress, Accessories
+- primary_color: its main colour, named descriptively (e.g. "Midnight Blue")
+- aesthetic: one style word or two (e.g. "Minimalist", "Bohemian")"""
+
+DIRECT_PROMPTS_PROMPT = """You are a creative fashion stylist. Look at the garment in this photo and generate 4 distinct, creative, and specific descriptions for it that could be used in a virtual try-on prompt.
+Focus on describing the garment itself (color, material, style), one sentence each, e.g.:
+- "A flowy red silk evening gown with spaghetti straps"
+- "A vintage blue denim jacket with patches"
+"""
+
+
+class GarmentTags(BaseModel):
+    """The three tags try-on suggestions need, instead of a full GarmentAnalysis."""
+    category: str = Field(..., description="Main category, e.g. Tops, Dress")
+    primary_color: str = Field(..., description="Main colour of the garment")
+    aesthetic: str = Field(..., description="One short style aesthetic")
+
+
+class DirectPrompts(BaseModel):
+    """The try-on prompts themselves, straight from the vision call."""
+    prompts: List[str] = Field(..., description="4 distinct try-on garment descriptions, one sentence each")
+
+# leading "1.", "2)", "-", "*" or "•" the model sometimes adds despite being asked not to
+_LIST_MARKER = re.compile(r"^\s*(?:\d+[.)]|[-*\u2022])\s*")
+
+
+def parse_suggestions(text: str, limit: int = 4) -> List[str]:
+    """One try-on prompt per non-empty line, with list markers and wrapping quotes removed."""
+    suggestions = []
+    for line in text.split("\n"):
+        line = _LIST_MARKER.sub("", line).strip().strip('"').strip()
+        if line:
+            suggestions.append(line)
+            if len(suggestions) == limit:
+                break
+    return suggestions
+
+
 class VirtualTryOnService:
-    def __init__(self):
-        print("🎨 Initializing VirtualTryOnService (Pixazo)...")
+    def __init__(self, garment_analyzer: Optional[GarmentAnalyzer] = None):
         # Initialize Pixazo API Key
         self.api_key = os.environ.get("PRIMARY_KEY")
         if not self.api_key:
-            print("⚠️ WARNING: PRIMARY_KEY not found in environment variables. Virtual Try-On will fail.")
+            logger.warning("PRIMARY_KEY not found in environment variables. Virtual Try-On will fail.")
             
-        # Initialize GarmentAnalyzer for understanding the image
-        self.garment_analyzer = GarmentAnalyzer()
+        # Initialize GarmentAnalyzer for understanding the image; sharing the app's
+        # analyzer lets suggestions reuse analyses cached by /api/analyze-garment
+        self.garment_analyzer = garment_analyzer or GarmentAnalyzer()
+        self.vision_llm = routed_llm("try_on.vision")
+        self.tags_llm = self.vision_llm.with_structured_output(GarmentTags)
+        self.direct_llm = self.vision_llm.with_structured_output(DirectPrompts)
+        self.suggestion_mode = os.environ.get("TRY_ON_SUGGESTION_MODE", "direct")
+        if self.suggestion_mode not in SUGGESTION_MODES:
+            raise ValueError(f"TRY_ON_SUGGESTION_MODE must be one of: {', '.join(SUGGESTION_MODES)}")
+        self.suggestion_counts: Dict[str, int] = {mode: 0 for mode in SUGGESTION_MODES + ("cached",)}
         
-        # Initialize Text LLM for generating suggestions
-        self.text_llm = get_groq_chat_llm(
-            model_name="llama-3.3-70b-versatile",
-            temperature=0.8
-        )
-        print("✅ VirtualTryOnService ready")
+        # Initialize Text LLM for generating suggestions (model chosen by the routing policy)
+        self.text_llm = routed_llm("try_on.text")
+        logger.info("VirtualTryOnService ready")
 
     async def _upload_temp_image(self, image_bytes: bytes) -> str:
         """
@@ -47,24 +105,37 @@ class VirtualTryOnService:
                         direct_url = page_url.replace('tmpfiles.org/', 'tmpfiles.org/dl/')
                         return direct_url
                 
-                print(f"⚠️ Failed to upload to tmpfiles.org: {response.text}")
+                logger.warning("Failed to upload to tmpfiles.org", extra={"status": response.status_code, "body": response.text[:500]})
                 raise Exception("Failed to upload temporary image")
         except Exception as e:
-            print(f"❌ Error uploading temp image: {str(e)}")
+            logger.error("Error uploading temp image", exc_info=True)
             raise e
 
     async def try_on(self, human_image_bytes: bytes, garment_image_bytes: bytes, description: str, category: str = "upper_body") -> bytes:
         """
-        Perform Virtual Try-On using Pixazo AI.
+        Perform Virtual Try-On using Pixazo AI and download the whole result.
+        """
+        output_url = await self.generate(human_image_bytes, garment_image_bytes, description, category)
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            with track_stage("try_on.download"):
+                image_response = await client.get(output_url)
+        if image_response.status_code == 200:
+            return image_response.content
+        raise Exception(f"Failed to download result image: {image_response.status_code}")
+
+    async def generate(self, human_image_bytes: bytes, garment_image_bytes: bytes, description: str, category: str = "upper_body") -> str:
+        """
+        Perform Virtual Try-On using Pixazo AI; returns the URL of the result image
+        (streamed to the client by TryOnResultStore rather than downloaded here).
         """
         try:
-            print(f"🎨 Starting Virtual Try-On with description: {description}")
+            logger.info("Starting virtual try-on", extra={"description": description, "garment_category": category})
             
             # 1. Upload images to get public URLs
-            print("📤 Uploading images to temporary storage...")
-            human_url = await self._upload_temp_image(human_image_bytes)
-            garm_url = await self._upload_temp_image(garment_image_bytes)
-            print(f"✅ Images uploaded: Human={human_url}, Garment={garm_url}")
+            with track_stage("try_on.upload"):
+                human_url = await self._upload_temp_image(human_image_bytes)
+                garm_url = await self._upload_temp_image(garment_image_bytes)
+            logger.debug("Images uploaded", extra={"human_url": human_url, "garment_url": garm_url})
             
             # 2. Prepare Pixazo API request
             url = "https://gateway.pixazo.ai/virtual-tryon/v1/r-vton"
@@ -91,17 +162,18 @@ class VirtualTryOnService:
                 "garment_des": description
             }
             
-            print("🚀 Calling Pixazo API...")
             async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(url, headers=headers, json=data)
+                with track_stage("try_on.pixazo"):
+                    response = await client.post(url, headers=headers, json=data)
                 
                 if response.status_code != 200:
-                    print(f"❌ Pixazo API Error: {response.status_code} - {response.text}")
+                    logger.error("Pixazo API error", extra={"status": response.status_code, "body": response.text[:500]})
                     raise Exception(f"Pixazo API failed: {response.text}")
                 
                 # 3. Parse Response
                 result = response.json()
-                print(f"✅ Pixazo Response received: {result}")
+                # The raw Pixazo payload is only worth keeping for a sample of requests
+                logger.debug("Pixazo response received", extra={"pixazo_response": result})
                 
                 # Extract output URL
                 output_url = None
@@ -121,32 +193,18 @@ class VirtualTryOnService:
                     else:
                         raise Exception(f"Could not find output URL in response: {result}")
 
-                # 4. Download Result Image
-                print(f"⬇️ Downloading result from {output_url}...")
-                image_response = await client.get(output_url)
-                if image_response.status_code == 200:
-                    return image_response.content
-                else:
-                    raise Exception(f"Failed to download result image: {image_response.status_code}")
+                return output_url
 
         except Exception as e:
-            print(f"❌ Error in try_on: {str(e)}")
+            logger.error("Error in try_on", exc_info=True)
             raise e
 
-    async def generate_suggestions(self, image_data_base64: str) -> List[str]:
-        """
-        Analyze the image and generate creative try-on prompts.
-        """
-        try:
-            print("🤔 Generating try-on suggestions...")
-            
-            # 1. Analyze the current garment using the existing analyzer
-            analysis = await self.garment_analyzer.analyze(image_data_base64, session_id="suggestion-gen")
-            
-            # 2. Generate creative transformation prompts based on the analysis
-            current_desc = f"{analysis.colors[0]} {analysis.style_aesthetic[0]} {analysis.category}"
-            
-            prompt = f"""You are a creative fashion stylist. A user has uploaded a photo of a garment described as: "{current_desc}".
+    def _description_of(self, analysis: GarmentAnalysis) -> str:
+        return f"{analysis.colors[0]} {analysis.style_aesthetic[0]} {analysis.category}"
+
+    async def _prompts_from_description(self, current_desc: str) -> List[str]:
+        """Second, text-only call: 4 try-on prompts for a garment already described in a few words."""
+        prompt = f"""You are a creative fashion stylist. A user has uploaded a photo of a garment described as: "{current_desc}".
             
             Generate 4 distinct, creative, and specific descriptions for this garment that could be used in a virtual try-on prompt.
             Focus on describing the garment itself (color, material, style).
@@ -158,19 +216,105 @@ class VirtualTryOnService:
             - "A casual oversized beige hoodie"
             
             Return ONLY a raw list of 4 prompts, separated by newlines. No numbering, no bullets."""
-            
+        
+        with track_stage("try_on.suggestion_prompts"):
             response = await self.text_llm.ainvoke([HumanMessage(content=prompt)])
-            suggestions = [s.strip() for s in response.content.split('\n') if s.strip()]
-            
-            # Ensure we have at least 4 suggestions
-            return suggestions[:4]
+        return parse_suggestions(response.content)
+
+    async def _quick_tags(self, image: ImagePayload) -> str:
+        with track_stage("try_on.quick_tags"):
+            tags: GarmentTags = await self.tags_llm.ainvoke([HumanMessage(content=[
+                {"type": "text", "text": QUICK_TAGS_PROMPT},
+                image.message_part()
+            ])])
+        return f"{tags.primary_color} {tags.aesthetic} {tags.category}"
+
+    async def _direct_prompts(self, image: ImagePayload) -> List[str]:
+        with track_stage("try_on.direct_prompts"):
+            result: DirectPrompts = await self.direct_llm.ainvoke([HumanMessage(content=[
+                {"type": "text", "text": DIRECT_PROMPTS_PROMPT},
+                image.message_part()
+            ])])
+        suggestions = parse_suggestions("\n".join(result.prompts))
+        if not suggestions:
+            raise ValueError("Vision model returned no usable prompts")
+        return suggestions
+
+    async def generate_suggestions(self, image_data_base64: Union[str, ImagePayload], mode: Optional[str] = None) -> Tuple[List[str], str]:
+        """
+        Analyze the image and generate creative try-on prompts.
+
+        mode: "direct" (prompts straight from one vision call), "tags" (a minimal
+        tags call, then the text prompt call) or "full" (full GarmentAnalysis,
+        then the text prompt call). A full analysis already cached for the image
+        is always reused instead, with only the text call ("cached").
+        Returns (suggestions, mode actually used).
+        """
+        mode = mode or self.suggestion_mode
+        image = as_payload(image_data_base64)
+        try:
+            cached = await self.garment_analyzer.cached_analysis(image)
+            if cached is not None:
+                mode = "cached"
+                suggestions = await self._prompts_from_description(self._description_of(cached))
+            elif mode == "direct":
+                suggestions = await self._direct_prompts(image)
+            elif mode == "tags":
+                suggestions = await self._prompts_from_description(await self._quick_tags(image))
+            else:
+                analysis = await self.garment_analyzer.analyze(image, session_id="suggestion-gen")
+                suggestions = await self._prompts_from_description(self._description_of(analysis))
+            self.suggestion_counts[mode] += 1
+            TRY_ON_SUGGESTIONS.inc(mode=mode)
+            return suggestions, mode
             
         except Exception as e:
-            print(f"❌ Error generating suggestions: {str(e)}")
+            logger.error("Error generating suggestions, using fallback", exc_info=True)
+            TRY_ON_SUGGESTIONS.inc(mode="fallback")
             # Fallback suggestions
             return [
                 "A stylish black cocktail dress",
                 "A casual blue denim jacket",
                 "A professional white shirt",
                 "A cozy beige sweater"
-            ]
+            ], "fallback"
+
+    def suggestion_savings(self) -> Dict[str, Any]:
+        """
+        Per-request latency and tokens of each suggestion mode against the full
+        path (garment.analyze + try_on.suggestion_prompts), from the per-stage
+        averages in usage_tracker. Stages with no calls yet count as unknown.
+        """
+        by_stage = usage_tracker.summary(top_sessions=0)["by_stage"]
+
+        def average(stage: str) -> Optional[Dict[str, float]]:
+            totals = by_stage.get(stage)
+            if not totals or not totals["calls"]:
+                return None
+            return {
+                "latency_seconds": totals["latency_seconds"] / totals["calls"],
+                "total_tokens": totals["total_tokens"] / totals["calls"],
+            }
+
+        def combined(*stages: str) -> Optional[Dict[str, float]]:
+            averages = [average(stage) for stage in stages]
+            if any(a is None for a in averages):
+                return None
+            return {key: round(sum(a[key] for a in averages), 4) for key in ("latency_seconds", "total_tokens")}
+
+        baseline = combined("garment.analyze", "try_on.suggestion_prompts")
+        per_mode = {
+            "full": baseline,
+            "tags": combined("try_on.quick_tags", "try_on.suggestion_prompts"),
+            "direct": combined("try_on.direct_prompts"),
+            "cached": combined("try_on.suggestion_prompts"),
+        }
+        report: Dict[str, Any] = {"default_mode": self.suggestion_mode, "baseline_per_request": baseline, "modes": {}}
+        for mode, cost in per_mode.items():
+            entry: Dict[str, Any] = {"requests": self.suggestion_counts[mode], "per_request": cost}
+            if mode != "full" and cost is not None and baseline is not None:
+                saved = {key: round(baseline[key] - cost[key], 4) for key in cost}
+                entry["saved_per_request"] = saved
+                entry["saved_total"] = {key: round(value * entry["requests"], 4) for key, value in saved.items()}
+            report["modes"][mode] = entry
+        return report
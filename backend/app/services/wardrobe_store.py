@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from ..models import GarmentAnalysis
+from ..utils.structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+INDEXED_FIELDS = ("category", "type", "colors", "patterns", "style_aesthetic", "vibe_mood")
+LIST_FIELDS = ("style_aesthetic", "cultural_elements", "vibe_mood", "colors", "patterns", "body_shape_tips", "styling_suggestions")
+
+# compact the append log into the snapshot once it holds this many operations
+COMPACT_AFTER_OPS = 200
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def index_terms(field: str, value: str) -> Set[str]:
+    """
+    Terms a value is indexed under. Aesthetics come back as "Minimalist: Clean
+    lines...", so only the part before the colon counts. Multi-word values are
+    also indexed per word, so "Midnight Navy" matches a query for "navy", and
+    plurals are folded so "Tops" matches "top".
+    """
+    if field == "style_aesthetic":
+        value = value.split(":", 1)[0]
+    value = re.sub(r"[^\w\s-]", " ", value.lower()).strip()
+    value = re.sub(r"\s+", " ", value)
+    if not value:
+        return set()
+    terms = {value, _singular(value)}
+    words = value.replace("-", " ").split()
+    if len(words) > 1:
+        terms.update(_singular(word) for word in words if len(word) > 2)
+    return terms
+
+
+def query_term(field: str, value: str) -> str:
+    """Normalize a query value the same way indexed values are."""
+    value = value.split(":", 1)[0] if field == "style_aesthetic" else value
+    value = re.sub(r"\s+", " ", re.sub(r"[^\w\s-]", " ", value.lower())).strip()
+    return _singular(value)
+
+
+class WardrobeIndex:
+    """
+    One user's wardrobe: the stored analyses plus an inverted index
+    field -> term -> item ids. Queries are set intersections, smallest first.
+    """
+
+    def __init__(self):
+        self.items: Dict[int, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in INDEXED_FIELDS}
+        self.next_id = 1
+
+    def _values(self, item: Dict[str, Any], field: str) -> Iterable[str]:
+        value = item.get(field)
+        if value is None:
+            return ()
+        return value if isinstance(value, list) else (value,)
+
+    def add(self, item: Dict[str, Any], item_id: Optional[int] = None) -> int:
+        if item_id is None:
+            item_id = self.next_id
+        self.next_id = max(self.next_id, item_id + 1)
+        item = {**item, "item_id": item_id}
+        self.items[item_id] = item
+        for field in INDEXED_FIELDS:
+            for value in self._values(item, field):
+                for term in index_terms(field, value):
+                    self.postings[field].setdefault(term, set()).add(item_id)
+        return item_id
+
+    def remove(self, item_id: int) -> bool:
+        item = self.items.pop(item_id, None)
+        if item is None:
+            return False
+        for field in INDEXED_FIELDS:
+            for value in self._values(item, field):
+                for term in index_terms(field, value):
+                    ids = self.postings[field].get(term)
+                    if ids is not None:
+                        ids.discard(item_id)
+                        if not ids:
+                            del self.postings[field][term]
+        return True
+
+    def query(self, filters: Dict[str, List[str]]) -> List[int]:
+        """
+        AND across fields, OR within a field:
+            {"colors": ["navy"], "patterns": ["solid"], "category": ["tops"]}
+        """
+        candidate_sets: List[Set[int]] = []
+        for field, values in filters.items():
+            if not values:
+                continue
+            if field not in self.postings:
+                raise KeyError(f"{field} is not an indexed field")
+            matches: Set[int] = set()
+            for value in values:
+                matches |= self.postings[field].get(query_term(field, value), set())
+            if not matches:
+                return []
+            candidate_sets.append(matches)
+
+        if not candidate_sets:
+            return sorted(self.items)
+        candidate_sets.sort(key=len)
+        result = set(candidate_sets[0])
+        for other in candidate_sets[1:]:
+            result &= other
+            if not result:
+                break
+        return sorted(result)
+
+
+class WardrobeStore:
+    """
+    Persistent per-user wardrobes.
+
+    On disk each user has a snapshot (zlib-compressed JSON where every string is
+    replaced by an index into a shared vocabulary, so repeated values like
+    "Casual" or "Navy" are stored once) and an append-only JSONL log of changes
+    since that snapshot. Indexes are rebuilt on load rather than stored, and
+    only the `max_loaded` most recently used wardrobes are kept in memory.
+
+    Methods do file I/O and (de)compression under a lock; async callers run
+    them with `asyncio.to_thread`.
+    """
+
+    def __init__(self, directory: str, max_loaded: int = 1000):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self._indexes: "OrderedDict[str, WardrobeIndex]" = OrderedDict()
+        self._log_ops: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._directory_ready = False
+
+    @classmethod
+    def from_env(cls) -> "WardrobeStore":
+        """WARDROBE_DIR (default ./wardrobe_data), WARDROBE_MAX_LOADED (default 1000 wardrobes in memory)."""
+        return cls(
+            os.environ.get("WARDROBE_DIR", "./wardrobe_data"),
+            max_loaded=int(os.environ.get("WARDROBE_MAX_LOADED", "1000")),
+        )
+
+    def _ensure_directory(self) -> None:
+        # created on first write, not when the app imports the store
+        if not self._directory_ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._directory_ready = True
+
+    def _paths(self, user_id: str):
+        # hash the id so arbitrary session ids are safe as file names
+        key = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:20]
+        base = os.path.join(self.directory, key)
+        return base + ".snapshot", base + ".log"
+
+    def _index(self, user_id: str) -> WardrobeIndex:
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._indexes.move_to_end(user_id)
+            return index
+        index = self._indexes[user_id] = self._load(user_id)
+        while len(self._indexes) > self.max_loaded:
+            # everything is on disk already; an evicted wardrobe is reloaded on next use
+            evicted, _ = self._indexes.popitem(last=False)
+            self._log_ops.pop(evicted, None)
+        return index
+
+    def _load(self, user_id: str) -> WardrobeIndex:
+        snapshot_path, log_path = self._paths(user_id)
+        index = WardrobeIndex()
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as f:
+                snapshot = json.loads(zlib.decompress(f.read()))
+            vocab = snapshot["vocab"]
+            fields = snapshot["fields"]
+            for row in snapshot["items"]:
+                item_id, added_at, score, encoded = row
+                item: Dict[str, Any] = {"added_at": added_at, "preference_score": score}
+                for field, value in zip(fields, encoded):
+                    item[field] = [vocab[i] for i in value] if isinstance(value, list) else vocab[value]
+                index.add(item, item_id)
+            index.next_id = max(index.next_id, snapshot["next_id"])
+
+        ops = 0
+        if os.path.exists(log_path):
+            with open(log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    op = json.loads(line)
+                    ops += 1
+                    if op["op"] == "add":
+                        index.add(op["item"], op["item_id"])
+                    elif op["op"] == "remove":
+                        index.remove(op["item_id"])
+        self._log_ops[user_id] = ops
+        return index
+
+    def _append_log(self, user_id: str, op: Dict[str, Any]) -> None:
+        _, log_path = self._paths(user_id)
+        self._ensure_directory()
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, separators=(",", ":")) + "\n")
+        self._log_ops[user_id] = self._log_ops.get(user_id, 0) + 1
+        if self._log_ops[user_id] >= COMPACT_AFTER_OPS:
+            self._compact(user_id)
+
+    def _compact(self, user_id: str) -> None:
+        index = self._index(user_id)
+        snapshot_path, log_path = self._paths(user_id)
+        fields = [f for f in GarmentAnalysis.model_fields if f != "preference_score"]
+        vocab: List[str] = []
+        vocab_ids: Dict[str, int] = {}
+
+        def encode(value: str) -> int:
+            if value not in vocab_ids:
+                vocab_ids[value] = len(vocab)
+                vocab.append(value)
+            return vocab_ids[value]
+
+        rows = []
+        for item_id, item in index.items.items():
+            encoded = []
+            for field in fields:
+                value = item.get(field, [] if field in LIST_FIELDS else "")
+                encoded.append([encode(v) for v in value] if isinstance(value, list) else encode(value))
+            rows.append([item_id, item.get("added_at"), item.get("preference_score"), encoded])
+
+        payload = json.dumps({"next_id": index.next_id, "fields": fields, "vocab": vocab, "items": rows}, separators=(",", ":"))
+        tmp_path = snapshot_path + ".tmp"
+        self._ensure_directory()
+        with open(tmp_path, "wb") as f:
+            f.write(zlib.compress(payload.encode("utf-8"), 6))
+        os.replace(tmp_path, snapshot_path)
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        self._log_ops[user_id] = 0
+
+    def add(self, user_id: str, analysis: GarmentAnalysis) -> int:
+        item = {**analysis.model_dump(), "added_at": time.time()}
+        with self._lock:
+            index = self._index(user_id)
+            item_id = index.add(item)
+            self._append_log(user_id, {"op": "add", "item_id": item_id, "item": item})
+        return item_id
+
+    def remove(self, user_id: str, item_id: int) -> bool:
+        with self._lock:
+            removed = self._index(user_id).remove(item_id)
+            if removed:
+                self._append_log(user_id, {"op": "remove", "item_id": item_id})
+        return removed
+
+    def query(self, user_id: str, filters: Dict[str, List[str]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            index = self._index(user_id)
+            return [index.items[item_id] for item_id in index.query(filters)]
+
+    def items(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._index(user_id).items.values())
+
+    def compact(self, user_id: str) -> None:
+        with self._lock:
+            self._compact(user_id)
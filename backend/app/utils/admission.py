@@ -0,0 +1,340 @@
+"""
+Admission control for the expensive, image-heavy endpoints.
+
+Each gate allows a fixed number of requests to run at once and holds a
+bounded FIFO queue behind them. Requests past the queue bound are rejected
+immediately with 503 + Retry-After instead of piling up decoded images and
+upstream calls. The queue itself is managed CoDel-style: when the time
+requests spend waiting stays above a target for a whole interval, waiters are
+shed at an increasing rate until the queue drains back below target. Target
+and interval scale with the gate's measured service time, so a gate in front
+of 20s try-on calls tolerates a longer queue than one in front of 2s analyses.
+
+Routes without a gate (health, chat, wardrobe CRUD, admin) are never queued.
+"""
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+from .env import env_flag
+from .metrics import registry
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "fashion_admission_in_flight", "Requests admitted and running, per gate", ["gate"]
+)
+ADMISSION_QUEUED = registry.gauge(
+    "fashion_admission_queued", "Requests waiting for admission, per gate", ["gate"]
+)
+ADMISSION_WAIT = registry.histogram(
+    "fashion_admission_wait_seconds", "Time admitted requests spent queued", ["gate"]
+)
+ADMISSION_REJECTED = registry.counter(
+    "fashion_admission_rejected_total", "Requests shed by admission control", ["gate", "reason"]
+)
+
+# gate name -> routes ("METHOD /path", "{param}" matches one path segment), concurrent requests, queued requests.
+# Override per gate with ADMISSION_GATES='{"try_on": {"concurrency": 2, "queue": 4}}'.
+DEFAULT_GATES: Dict[str, Dict[str, Any]] = {
+    "try_on": {
+        "routes": ["POST /api/try-on/edit"],
+        "concurrency": 4,
+        "queue": 8,
+    },
+    "tara": {
+        "routes": ["POST /api/tara/analyze", "POST /api/tara/analyze/stream", "POST /api/tara/visualize"],
+        "concurrency": 8,
+        "queue": 16,
+    },
+    "garment_analysis": {
+        "routes": [
+            "POST /api/analyze-garment",
+            "POST /api/compare-garments",
+            "POST /api/try-on/suggestions",
+        ],
+        "concurrency": 8,
+        "queue": 32,
+    },
+    # one request fans out into many upstream calls (a batch of images; up to
+    # 10 hybrid-recommendation LLM calls explaining the top outfits), so a few
+    # of them must not take every garment_analysis slot
+    "bulk": {
+        "routes": ["POST /api/analyze-garments/batch", "GET /api/wardrobe/{user_id}/outfits"],
+        "concurrency": 2,
+        "queue": 8,
+    },
+}
+
+# assumed service time until a gate has measured some
+_INITIAL_SERVICE_SECONDS = 1.0
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """
+    A concurrency limit with a bounded, CoDel-managed wait queue.
+
+    target: queue wait considered acceptable, `target_factor` x the average
+    service time (at least `min_target` seconds).
+    interval: how long the wait must stay above target before shedding starts,
+    2 x the average service time (at least 1s).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        concurrency: int,
+        queue: int,
+        max_wait: float = 30.0,
+        target_factor: float = 0.5,
+        min_target: float = 0.05,
+    ):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = queue
+        self.max_wait = max_wait
+        self.target_factor = target_factor
+        self.min_target = min_target
+        self.in_flight = 0
+        self.service_seconds: Optional[float] = None
+        self._waiters: Deque[Tuple[asyncio.Future, float]] = deque()
+        # CoDel state
+        self._first_above: Optional[float] = None
+        self._dropping = False
+        self._drop_next = 0.0
+        self._drop_count = 0
+
+    def _service_estimate(self) -> float:
+        return self.service_seconds if self.service_seconds is not None else _INITIAL_SERVICE_SECONDS
+
+    def target(self) -> float:
+        return max(self.min_target, self.target_factor * self._service_estimate())
+
+    def interval(self) -> float:
+        return max(1.0, 2.0 * self._service_estimate())
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue should have drained, for the Retry-After header."""
+        backlog = (len(self._waiters) + 1) / self.concurrency
+        return min(60, max(1, math.ceil(backlog * self._service_estimate())))
+
+    def _publish(self) -> None:
+        ADMISSION_IN_FLIGHT.set(self.in_flight, gate=self.name)
+        ADMISSION_QUEUED.set(len(self._waiters), gate=self.name)
+
+    def _reject(self, reason: str) -> Overloaded:
+        ADMISSION_REJECTED.inc(gate=self.name, reason=reason)
+        return Overloaded(reason, self.retry_after())
+
+    async def acquire(self) -> None:
+        """Wait for a slot; raises Overloaded if the request is shed."""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            ADMISSION_WAIT.observe(0.0, gate=self.name)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+
+        enqueued = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((future, enqueued))
+        self._publish()
+        try:
+            admitted = await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done():
+                # decided in the same instant the wait timed out
+                admitted = future.result()
+            else:
+                future.cancel()
+                self._remove(future)
+                raise self._reject("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.result():
+                self.release(None)
+            else:
+                future.cancel()
+                self._remove(future)
+            raise
+        if not admitted:
+            raise self._reject("codel")
+        ADMISSION_WAIT.observe(time.perf_counter() - enqueued, gate=self.name)
+
+    def release(self, service_seconds: Optional[float]) -> None:
+        """Give the slot back; `service_seconds` (None if the request never ran) feeds the service-time average."""
+        if service_seconds is not None:
+            if self.service_seconds is None:
+                self.service_seconds = service_seconds
+            else:
+                self.service_seconds = 0.8 * self.service_seconds + 0.2 * service_seconds
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _remove(self, future: asyncio.Future) -> None:
+        for entry in self._waiters:
+            if entry[0] is future:
+                self._waiters.remove(entry)
+                break
+        self._publish()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the oldest waiters, shedding the ones CoDel says to drop."""
+        while self._waiters and self.in_flight < self.concurrency:
+            future, enqueued = self._waiters.popleft()
+            if future.done():
+                continue
+            now = time.perf_counter()
+            if self._should_drop(now - enqueued, now):
+                future.set_result(False)
+                continue
+            self.in_flight += 1
+            future.set_result(True)
+        if not self._waiters:
+            self._first_above = None
+            self._dropping = False
+        self._publish()
+
+    def _should_drop(self, sojourn: float, now: float) -> bool:
+        interval = self.interval()
+        if sojourn < self.target():
+            self._first_above = None
+            self._dropping = False
+            return False
+        if self._first_above is None:
+            self._first_above = now + interval
+            return False
+        if now < self._first_above:
+            return False
+        if not self._dropping:
+            self._dropping = True
+            # resume close to the previous drop rate if the queue went bad again soon after
+            recently = now - self._drop_next < 8 * interval
+            self._drop_count = max(1, self._drop_count - 2) if recently else 1
+            self._drop_next = now + interval / math.sqrt(self._drop_count)
+            return True
+        if now >= self._drop_next:
+            self._drop_count += 1
+            self._drop_next = now + interval / math.sqrt(self._drop_count)
+            return True
+        return False
+
+    def oldest_wait(self) -> float:
+        """How long the request at the head of the queue has been waiting (0 if none is)."""
+        for future, enqueued in self._waiters:
+            if not future.done():
+                return time.perf_counter() - enqueued
+        return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "queue_limit": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "service_seconds": round(self.service_seconds, 4) if self.service_seconds is not None else None,
+            "target_seconds": round(self.target(), 4),
+            "interval_seconds": round(self.interval(), 4),
+            "dropping": self._dropping,
+        }
+
+
+def gates_from_env() -> Tuple[Dict[str, AdmissionGate], Dict[str, str]]:
+    """
+    ADMISSION_CONTROL_ENABLED (default on), ADMISSION_GATES (JSON overrides of
+    DEFAULT_GATES, merged per gate), ADMISSION_MAX_WAIT_SECONDS (default 30),
+    ADMISSION_TARGET_FACTOR (default 0.5).
+    Returns the gates by name and "METHOD /path" -> gate name.
+    """
+    if not env_flag("ADMISSION_CONTROL_ENABLED", default=True):
+        return {}, {}
+    config = {name: dict(gate) for name, gate in DEFAULT_GATES.items()}
+    for name, override in json.loads(os.environ.get("ADMISSION_GATES", "{}")).items():
+        config.setdefault(name, {"routes": [], "concurrency": 4, "queue": 8}).update(override)
+    max_wait = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", "30"))
+    target_factor = float(os.environ.get("ADMISSION_TARGET_FACTOR", "0.5"))
+    return {
+        name: AdmissionGate(
+            name,
+            concurrency=int(gate["concurrency"]),
+            queue=int(gate["queue"]),
+            max_wait=max_wait,
+            target_factor=target_factor,
+        )
+        for name, gate in config.items()
+        if gate.get("routes") and int(gate["concurrency"]) > 0
+    }, {route: name for name, gate in config.items() for route in gate.get("routes", [])}
+
+
+admission_gates, admission_routes = gates_from_env()
+
+
+def current_queue_delay() -> float:
+    """Longest current queue wait across all gates, in seconds."""
+    return max((gate.oldest_wait() for gate in admission_gates.values()), default=0.0)
+
+
+class AdmissionControlMiddleware:
+    """
+    Pure ASGI middleware, so a streaming response keeps its slot until the
+    last chunk is sent. Routes are matched on "METHOD /path" before routing.
+    """
+
+    def __init__(self, app, gates: Dict[str, AdmissionGate], routes: Dict[str, str]):
+        self.app = app
+        self.gates = gates
+        self.routes = {route: gates[name] for route, name in routes.items() if name in gates and "{" not in route}
+        self.templates = [
+            (re.compile("[^/]+".join(re.escape(part) for part in re.split(r"\{[^/]+?\}", route)) + "$"), gates[name])
+            for route, name in routes.items() if name in gates and "{" in route
+        ]
+
+    def _gate(self, method: str, path: str) -> Optional[AdmissionGate]:
+        route = f"{method} {path}"
+        gate = self.routes.get(route)
+        if gate is None:
+            gate = next((gate for pattern, gate in self.templates if pattern.match(route)), None)
+        return gate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"].rstrip("/") or "/"
+        gate = self._gate(scope["method"], path)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await gate.acquire()
+        except Overloaded as e:
+            logger.warning("Request shed by admission control", extra={"gate": gate.name, "reason": e.reason, "retry_after": e.retry_after})
+            response = JSONResponse(
+                {"detail": "Server is busy, please retry shortly", "reason": e.reason},
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - start)
@@ -0,0 +1,101 @@
+"""
+Request-scoped cancellation on client disconnect.
+
+Once a request body has been read, nothing in the app listens to the
+connection again until the response is sent, so a user closing the tab during
+a try-on or a Tara call leaves uploads, Pixazo and vision calls running for a
+response nobody reads. This middleware keeps listening: on `http.disconnect`
+it cancels the task running the request, and the CancelledError propagates
+through every awaited `ainvoke` / httpx call (httpx closes its connection on
+the way out). Services only need to let CancelledError through, which
+`except Exception` already does.
+
+Cancelled stages show up as `fashion_stage_calls_total{outcome="cancelled"}`
+and LLM calls cut off mid-flight as `fashion_llm_calls_abandoned_total`.
+"""
+import asyncio
+import time
+
+from .metrics import registry
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+REQUESTS_CANCELLED = registry.counter(
+    "fashion_requests_cancelled_total", "Requests cancelled because the client disconnected", ["route"]
+)
+CANCELLED_WORK_SECONDS = registry.counter(
+    "fashion_cancelled_work_seconds_total", "Time requests had been running when their client disconnected", ["route"]
+)
+
+# nginx's "client closed request"; never seen by the client, but keeps access metrics honest
+CLIENT_CLOSED_REQUEST = 499
+
+
+class DisconnectCancellationMiddleware:
+    """Pure ASGI middleware; runs each HTTP request in a task it can cancel."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # `receive` is read by a single pump task; the app reads from this queue.
+        # One slot keeps upload backpressure, and once the body is queued the pump
+        # is left waiting on the connection, where a disconnect shows up.
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+        response_started = False
+        response_complete = False
+
+        async def wrapped_receive():
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            return await messages.get()
+
+        async def wrapped_send(message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    break
+                await messages.put(message)
+            disconnected.set()
+            if messages.empty():
+                messages.put_nowait(message)
+            if not response_complete:
+                request_task.cancel()
+
+        start = time.perf_counter()
+        request_task = asyncio.create_task(self.app(scope, wrapped_receive, wrapped_send))
+        watcher = asyncio.create_task(pump())
+        try:
+            await request_task
+        except asyncio.CancelledError:
+            # our own task being cancelled (server shutdown) is not a disconnect: pass it on
+            if not (disconnected.is_set() and request_task.cancelled()) or asyncio.current_task().cancelling():
+                raise
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUESTS_CANCELLED.inc(route=route)
+            CANCELLED_WORK_SECONDS.inc(elapsed, route=route)
+            logger.info("Client disconnected, request cancelled", extra={"route": route, "elapsed_seconds": round(elapsed, 3)})
+            if not response_started:
+                try:
+                    await send({"type": "http.response.start", "status": CLIENT_CLOSED_REQUEST, "headers": []})
+                    await send({"type": "http.response.body", "body": b""})
+                except OSError:
+                    # the connection is already gone
+                    pass
+        finally:
+            watcher.cancel()
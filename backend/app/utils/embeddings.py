@@ -0,0 +1,249 @@
+"""
+One shared sentence-embedding model for the whole process.
+
+The model is loaded on first use (or by `warm_up()` at startup), never at
+import. Concurrent `embed()` calls from different requests are collected into
+micro-batches: a batch is encoded as soon as it holds `max_batch` texts or
+`max_wait_ms` after its first text arrived, whichever comes first, on a single
+worker thread, so callers share one forward pass instead of each running their
+own. Duplicate texts within a batch are encoded once.
+
+EMBEDDING_BACKEND=onnx runs the model through ONNX Runtime (optionally a
+quantized export via EMBEDDING_ONNX_FILE) instead of PyTorch, and
+EMBEDDING_THREADS bounds the CPU threads either backend uses.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .metrics import registry
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+EMBED_TEXTS = registry.counter(
+    "fashion_embedding_texts_total", "Texts embedded by the shared embedding service"
+)
+EMBED_BATCH_SIZE = registry.histogram(
+    "fashion_embedding_batch_size", "Texts per encoded micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+EMBED_ENCODE_SECONDS = registry.histogram(
+    "fashion_embedding_encode_seconds", "Model time per encoded micro-batch"
+)
+EMBED_LATENCY = registry.histogram(
+    "fashion_embedding_request_seconds", "Time an embed() call took, including waiting for its batch"
+)
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingService:
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        backend: str = "torch",
+        onnx_file: Optional[str] = None,
+        threads: Optional[int] = None,
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+        normalize: bool = True,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.onnx_file = onnx_file
+        self.threads = threads
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.normalize = normalize
+        self._model = None
+        self._load_lock = threading.Lock()
+        # one encoder thread: batches queue behind each other instead of fighting over cores
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_texts = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # running batches; the loop only keeps weak references to tasks
+        self._tasks = set()
+        self._stats_lock = threading.Lock()
+        self._texts = 0
+        self._batches = 0
+        self._encode_seconds = 0.0
+        self._requests = 0
+        self._request_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingService":
+        """
+        EMBEDDING_MODEL, EMBEDDING_BACKEND (torch|onnx, default torch), EMBEDDING_ONNX_FILE
+        (e.g. onnx/model_qint8_avx2.onnx for a quantized export), EMBEDDING_THREADS,
+        EMBEDDING_MAX_BATCH (default 64), EMBEDDING_MAX_WAIT_MS (default 5).
+        """
+        threads = os.environ.get("EMBEDDING_THREADS")
+        return cls(
+            model_name=os.environ.get("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL),
+            backend=os.environ.get("EMBEDDING_BACKEND", "torch"),
+            onnx_file=os.environ.get("EMBEDDING_ONNX_FILE") or None,
+            threads=int(threads) if threads else None,
+            max_batch=int(os.environ.get("EMBEDDING_MAX_BATCH", "64")),
+            max_wait_ms=float(os.environ.get("EMBEDDING_MAX_WAIT_MS", "5")),
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def _load(self):
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            from sentence_transformers import SentenceTransformer
+
+            start = time.perf_counter()
+            kwargs: Dict[str, Any] = {"device": "cpu"}
+            if self.backend == "onnx":
+                import onnxruntime
+
+                model_kwargs: Dict[str, Any] = {"provider": "CPUExecutionProvider"}
+                if self.onnx_file:
+                    model_kwargs["file_name"] = self.onnx_file
+                if self.threads:
+                    options = onnxruntime.SessionOptions()
+                    options.intra_op_num_threads = self.threads
+                    options.inter_op_num_threads = 1
+                    model_kwargs["session_options"] = options
+                kwargs.update(backend="onnx", model_kwargs=model_kwargs)
+            elif self.threads:
+                import torch
+
+                torch.set_num_threads(self.threads)
+            self._model = SentenceTransformer(self.model_name, **kwargs)
+            logger.info("Embedding model loaded", extra={
+                "model": self.model_name, "backend": self.backend, "onnx_file": self.onnx_file,
+                "threads": self.threads, "load_seconds": round(time.perf_counter() - start, 2),
+            })
+            return self._model
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        model = self._load()
+        start = time.perf_counter()
+        vectors = model.encode(
+            texts,
+            batch_size=self.max_batch,
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+        elapsed = time.perf_counter() - start
+        EMBED_TEXTS.inc(len(texts))
+        EMBED_BATCH_SIZE.observe(len(texts))
+        EMBED_ENCODE_SECONDS.observe(elapsed)
+        with self._stats_lock:
+            self._texts += len(texts)
+            self._batches += 1
+            self._encode_seconds += elapsed
+        return vectors
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        """Blocking encode for scripts and other code without an event loop (no micro-batching)."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._executor.submit(self._encode, list(texts)).result()
+
+    async def warm_up(self) -> None:
+        """Load the model and run one tiny batch, so the first real request doesn't pay for it."""
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, ["warm up"])
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 vectors, encoded together with whatever other callers sent meanwhile."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((list(texts), future))
+        self._pending_texts += len(texts)
+        if self._pending_texts >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        try:
+            return await future
+        finally:
+            elapsed = time.perf_counter() - start
+            EMBED_LATENCY.observe(elapsed)
+            with self._stats_lock:
+                self._requests += 1
+                self._request_seconds += elapsed
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending, self._pending_texts = self._pending, [], 0
+        batch = [(texts, future) for texts, future in batch if not future.cancelled()]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[List[str], asyncio.Future]]) -> None:
+        unique: Dict[str, int] = {}
+        for texts, _ in batch:
+            for text in texts:
+                unique.setdefault(text, len(unique))
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self._encode, list(unique))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for texts, future in batch:
+            if not future.done():
+                future.set_result(vectors[[unique[text] for text in texts]])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "backend": self.backend,
+                "onnx_file": self.onnx_file,
+                "threads": self.threads,
+                "loaded": self.loaded,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "texts": self._texts,
+                "batches": self._batches,
+                "avg_batch_size": self._texts / self._batches if self._batches else None,
+                "texts_per_second": self._texts / self._encode_seconds if self._encode_seconds else None,
+                "avg_request_seconds": self._request_seconds / self._requests if self._requests else None,
+            }
+
+
+class ServiceEmbeddings(Embeddings):
+    """LangChain adapter (e.g. for Chroma) over an EmbeddingService, so vector stores share its model."""
+
+    def __init__(self, service: "EmbeddingService"):
+        self.service = service
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.service.embed_sync(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.service.embed_sync([text])[0].tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return (await self.service.embed(texts)).tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.service.embed([text]))[0].tolist()
+
+
+embedding_service = EmbeddingService.from_env()
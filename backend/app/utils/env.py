@@ -0,0 +1,9 @@
+import os
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """An on/off environment variable: "1", "true" or "yes" (any case) is on; unset means `default`."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes")
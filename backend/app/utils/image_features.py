@@ -0,0 +1,245 @@
+"""
+Local, CPU-only garment features: dominant colors and a solid/striped/patterned
+estimate, computed from pixels with Pillow + NumPy in a few milliseconds.
+
+They are used as hints in the vision prompt and as the whole colour/pattern
+answer when the analysis runs in "local" mode or the vision model is unavailable.
+"""
+import io
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Fashion colour vocabulary. Matching happens in Lab space, so perceptually
+# close shades map to the nearest name rather than the nearest RGB triple.
+NAMED_COLORS = {
+    "Black": "#111111",
+    "Charcoal": "#36454f",
+    "Grey": "#8e8e8e",
+    "Light Grey": "#cfcfcf",
+    "White": "#f7f7f5",
+    "Ivory": "#fffff0",
+    "Cream": "#f3e9d2",
+    "Beige": "#d8c3a5",
+    "Khaki": "#b9a77a",
+    "Camel": "#c19a6b",
+    "Tan": "#a67b5b",
+    "Brown": "#6f4e37",
+    "Chocolate": "#3f2a1e",
+    "Navy": "#1f2a44",
+    "Royal Blue": "#2850ad",
+    "Denim Blue": "#4a6a8c",
+    "Sky Blue": "#87ceeb",
+    "Teal": "#12797a",
+    "Mint": "#a8e4c6",
+    "Sage Green": "#9caf88",
+    "Olive": "#6b6b3a",
+    "Forest Green": "#228b22",
+    "Emerald": "#1f8f5f",
+    "Mustard": "#d4a017",
+    "Yellow": "#f5d90a",
+    "Gold": "#c9a43b",
+    "Orange": "#f28c28",
+    "Burnt Orange": "#cc5500",
+    "Rust": "#a0452d",
+    "Coral": "#ff7f62",
+    "Red": "#c8102e",
+    "Burgundy": "#800020",
+    "Maroon": "#5c1a1b",
+    "Blush Pink": "#f4c2c2",
+    "Pink": "#f49ac2",
+    "Hot Pink": "#ff3ea5",
+    "Lavender": "#b7a6d9",
+    "Purple": "#6a3d9a",
+    "Plum": "#5e2750",
+}
+
+
+def _srgb_to_linear(rgb: np.ndarray) -> np.ndarray:
+    return np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """(..., 3) uint8/float RGB in 0-255 -> (..., 3) CIE Lab (D65)."""
+    linear = _srgb_to_linear(np.asarray(rgb, dtype=np.float32) / 255.0)
+    matrix = np.array([
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ], dtype=np.float32)
+    xyz = linear @ matrix.T / np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    return np.stack([
+        116.0 * f[..., 1] - 16.0,
+        500.0 * (f[..., 0] - f[..., 1]),
+        200.0 * (f[..., 1] - f[..., 2]),
+    ], axis=-1)
+
+
+def _hex_to_rgb(value: str) -> Tuple[int, int, int]:
+    value = value.lstrip("#")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+_PALETTE_NAMES = list(NAMED_COLORS)
+_PALETTE_LAB = rgb_to_lab(np.array([_hex_to_rgb(NAMED_COLORS[n]) for n in _PALETTE_NAMES], dtype=np.float32))
+
+
+def nearest_color_names(lab: np.ndarray) -> List[str]:
+    distances = np.linalg.norm(lab[:, None, :] - _PALETTE_LAB[None, :, :], axis=-1)
+    return [_PALETTE_NAMES[i] for i in distances.argmin(axis=1)]
+
+
+@dataclass
+class ColorHint:
+    name: str
+    hex: str
+    fraction: float
+
+
+@dataclass
+class PatternHint:
+    label: str          # "Solid", "Striped" or "Patterned"
+    confidence: float
+
+
+@dataclass
+class GarmentHints:
+    colors: List[ColorHint] = field(default_factory=list)
+    pattern: PatternHint = None
+
+    def color_names(self, min_fraction: float = 0.08) -> List[str]:
+        return [c.name for c in self.colors if c.fraction >= min_fraction] or [c.name for c in self.colors[:1]]
+
+    def as_prompt(self) -> str:
+        colors = ", ".join(f"{c.name} (~{round(c.fraction * 100)}%)" for c in self.colors)
+        return (
+            "Local pixel analysis (a hint, may include some background): "
+            f"dominant colors {colors}; pattern looks {self.pattern.label} "
+            f"(confidence {self.pattern.confidence:.2f}). Use these hints, but trust what you see if the image clearly disagrees."
+        )
+
+
+def load_rgb(image_bytes: bytes, max_side: int = 128) -> np.ndarray:
+    """Decode and downsample to at most `max_side` px. JPEG draft mode decodes at reduced scale directly."""
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("RGB", (max_side, max_side))
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side))
+    return np.asarray(image, dtype=np.uint8)
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = 12, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized Lloyd's k-means with k-means++ seeding.
+    Returns (centers (k, d), labels (n,)).
+    """
+    rng = np.random.default_rng(seed)
+    n = len(points)
+    k = min(k, n)
+    centers = np.empty((k, points.shape[1]), dtype=np.float32)
+    centers[0] = points[rng.integers(n)]
+    closest = np.sum((points - centers[0]) ** 2, axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        index = rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)
+        centers[i] = points[index]
+        closest = np.minimum(closest, np.sum((points - centers[i]) ** 2, axis=1))
+
+    labels = np.zeros(n, dtype=np.int64)
+    for iteration in range(iterations):
+        # squared distances via |p|^2 - 2 p.c + |c|^2, one matrix product for all points
+        distances = (points ** 2).sum(1)[:, None] - 2 * points @ centers.T + (centers ** 2).sum(1)[None, :]
+        new_labels = distances.argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k).astype(np.float32)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        nonempty = counts > 0
+        centers[nonempty] = sums[nonempty] / counts[nonempty, None]
+    return centers, labels
+
+
+def _foreground_mask(lab: np.ndarray) -> np.ndarray:
+    """
+    Product photos are usually shot on a plain backdrop: treat pixels close to
+    the border's median colour as background, unless that would drop almost
+    everything (a full-frame fabric close-up).
+    """
+    border = np.concatenate([lab[0], lab[-1], lab[:, 0], lab[:, -1]])
+    backdrop = np.median(border, axis=0)
+    border_spread = np.median(np.linalg.norm(border - backdrop, axis=1))
+    if border_spread > 10:
+        # busy border: no uniform backdrop to remove
+        return np.ones(lab.shape[:2], dtype=bool)
+    mask = np.linalg.norm(lab - backdrop, axis=-1) > 12
+    return mask if mask.mean() > 0.1 else np.ones(lab.shape[:2], dtype=bool)
+
+
+def extract_colors(rgb: np.ndarray, k: int = 5) -> List[ColorHint]:
+    lab = rgb_to_lab(rgb)
+    mask = _foreground_mask(lab)
+    pixels = lab[mask].astype(np.float32)
+    rgb_pixels = rgb[mask].astype(np.float32)
+    centers, labels = kmeans(pixels, k)
+    counts = np.bincount(labels, minlength=len(centers))
+    names = nearest_color_names(centers)
+
+    merged = {}
+    for cluster, name in enumerate(names):
+        if counts[cluster] == 0:
+            continue
+        entry = merged.setdefault(name, [0, np.zeros(3)])
+        entry[0] += counts[cluster]
+        entry[1] += rgb_pixels[labels == cluster].sum(axis=0)
+
+    total = counts.sum()
+    hints = []
+    for name, (count, rgb_sum) in merged.items():
+        mean = (rgb_sum / count).round().astype(int)
+        hints.append(ColorHint(name=name, hex="#%02x%02x%02x" % tuple(mean), fraction=round(float(count / total), 3)))
+    return sorted(hints, key=lambda c: c.fraction, reverse=True)
+
+
+def detect_pattern(rgb: np.ndarray) -> PatternHint:
+    """
+    Frequency-domain pattern heuristic on the central crop:
+    - low luminance variance                          -> Solid
+    - spectral energy concentrated in one orientation -> Striped
+    - lots of mid/high-frequency energy otherwise     -> Patterned
+    Gentle shading (folds, lighting) lives in the lowest frequencies and is ignored.
+    """
+    gray = rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    h, w = gray.shape
+    crop = gray[h // 6: h - h // 6, w // 6: w - w // 6]
+    if crop.std() < 10:
+        return PatternHint("Solid", round(float(1.0 - crop.std() / 20), 2))
+
+    crop = crop - crop.mean()
+    window = np.outer(np.hanning(crop.shape[0]), np.hanning(crop.shape[1]))
+    spectrum = np.abs(np.fft.fftshift(np.fft.fft2(crop * window))) ** 2
+
+    cy, cx = np.array(spectrum.shape) // 2
+    yy, xx = np.indices(spectrum.shape)
+    radius = np.hypot(yy - cy, xx - cx)
+    band = (radius >= 3) & (radius <= min(cy, cx))
+    total_energy = spectrum.sum()
+    band_energy = spectrum[band]
+    texture_ratio = float(band_energy.sum() / total_energy) if total_energy else 0.0
+
+    # orientation histogram over the band; stripes put their energy in one direction
+    angles = (np.degrees(np.arctan2(yy - cy, xx - cx)) % 180)[band]
+    hist, _ = np.histogram(angles, bins=18, range=(0, 180), weights=band_energy)
+    # best pair of adjacent bins, so an orientation sitting on a bin edge still counts as one direction
+    paired = hist + np.roll(hist, 1)
+    directionality = float(paired.max() / hist.sum()) if hist.sum() else 0.0
+
+    if texture_ratio < 0.15:
+        return PatternHint("Solid", round(1.0 - texture_ratio / 0.15 * 0.5, 2))
+    if directionality > 0.6:
+        return PatternHint("Striped", round(min(1.0, directionality), 2))
+    return PatternHint("Patterned", round(min(1.0, texture_ratio), 2))
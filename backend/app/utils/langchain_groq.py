@@ -2,6 +2,10 @@ import os
 from langchain_core.language_models.base import BaseLanguageModel
 from langchain_groq import ChatGroq
 from dotenv import load_dotenv
+from .structured_logging import get_logger
+from .usage import usage_callback
+
+logger = get_logger(__name__)
 
 
 def get_groq_chat_llm(model_name: str = "llama-3.3-70b-versatile", temperature: float = 0.7) -> BaseLanguageModel:
@@ -16,15 +20,16 @@ def get_groq_chat_llm(model_name: str = "llama-3.3-70b-versatile", temperature:
     api_key = os.environ.get("GROQ_API_KEY")
 
     if not api_key:
-        print("--- ERROR: GROQ_API_KEY environment variable not set. ---")
+        logger.error("GROQ_API_KEY environment variable not set")
         raise ValueError("GROQ_API_KEY not found. Please set it in your environment.")
 
-    print(f"--- Initializing Groq LLM ({model_name}) ---")
+    logger.info("Initializing Groq LLM", extra={"model": model_name, "temperature": temperature})
 
     llm = ChatGroq(
         groq_api_key=api_key,
         model_name=model_name,
-        temperature=temperature
+        temperature=temperature,
+        callbacks=[usage_callback]  # token/cost accounting, see utils/usage.py
     )
 
     return llm
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Event-loop lag monitor.
+
+A background task asks to be woken every `interval` seconds and records how
+late it actually woke up. Lag means something ran on the loop without
+yielding (a sync decode, a JSON dump of a large payload, a blocking client):
+every request in flight on this worker waited that long, whatever its route.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from .env import env_flag
+from .metrics import registry
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+LOOP_LAG = registry.histogram(
+    "fashion_event_loop_lag_seconds", "How late the event loop ran a timer scheduled to fire on time",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+LOOP_LAG_MAX = registry.gauge(
+    "fashion_event_loop_lag_max_seconds", "Worst event-loop lag in the last reporting window"
+)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.1, window: float = 5.0, warn_after: float = 0.25):
+        self.interval = interval
+        self.window = window
+        self.warn_after = warn_after
+        self._task: Optional[asyncio.Task] = None
+        self._window_max = 0.0
+        self._last_window_max = 0.0
+        self._worst = 0.0
+        self._samples = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["LoopLagMonitor"]:
+        """
+        LOOP_LAG_MONITOR (default on), LOOP_LAG_INTERVAL_MS (default 100),
+        LOOP_LAG_WARN_MS (default 250: lag worth a warning log).
+        """
+        if not env_flag("LOOP_LAG_MONITOR", default=True):
+            return None
+        return cls(
+            interval=float(os.environ.get("LOOP_LAG_INTERVAL_MS", "100")) / 1000.0,
+            warn_after=float(os.environ.get("LOOP_LAG_WARN_MS", "250")) / 1000.0,
+        )
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        window_end = time.perf_counter() + self.window
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            LOOP_LAG.observe(lag)
+            self._samples += 1
+            self._window_max = max(self._window_max, lag)
+            self._worst = max(self._worst, lag)
+            if lag >= self.warn_after:
+                logger.warning("Event loop blocked", extra={"lag_seconds": round(lag, 4)})
+            if now >= window_end:
+                self._last_window_max, self._window_max = self._window_max, 0.0
+                LOOP_LAG_MAX.set(self._last_window_max)
+                window_end = now + self.window
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval,
+            "samples": self._samples,
+            "avg_lag_seconds": LOOP_LAG.total() / LOOP_LAG.count() if LOOP_LAG.count() else None,
+            "last_window_max_seconds": self._last_window_max,
+            "worst_seconds": self._worst,
+        }
+
+
+loop_lag_monitor = LoopLagMonitor.from_env()
@@ -0,0 +1,327 @@
+"""
+Central model routing: which Groq model each LLM call site uses.
+
+Call sites ask for `routed_llm("<site>")` instead of naming a model. The policy
+maps each site to a tier (a model) and a temperature, plus ordered rules that
+send a call to another tier depending on its input size, whether the session
+is over its token budget, or how long requests are currently queued by
+admission control. The first matching rule wins.
+
+A site can also shadow a sample of its calls on another tier: the same input
+runs in the background after the real call returned, and the latency and
+output similarity of the pair are recorded, so cheaper tiers can be evaluated
+on real traffic before traffic is moved to them.
+
+The built-in policy matches the models the services used before routing.
+MODEL_ROUTING_POLICY points to a JSON or YAML file merged over it:
+
+    {
+      "tiers": {"small": {"model": "llama-3.1-8b-instant"}},
+      "routes": {
+        "try_on.text": {
+          "tier": "large",
+          "rules": [{"when": {"min_queue_seconds": 2}, "tier": "small"}],
+          "shadow": {"tier": "small", "sample_rate": 0.1}
+        }
+      }
+    }
+
+Rule conditions: min_input_chars, max_input_chars, over_budget (true/false),
+min_queue_seconds.
+"""
+import asyncio
+import copy
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel
+
+from .admission import current_queue_delay
+from .langchain_groq import get_groq_chat_llm
+from .metrics import registry, track_stage
+from .structured_logging import get_logger
+from .usage import bind_session, current_session, usage_tracker
+
+logger = get_logger(__name__)
+
+ROUTING_DECISIONS = registry.counter(
+    "fashion_model_routing_total", "LLM calls by call site, chosen tier and the rule that chose it", ["site", "tier", "reason"]
+)
+SHADOW_LATENCY = registry.histogram(
+    "fashion_model_shadow_latency_seconds", "Latency of shadow calls", ["site", "tier"]
+)
+SHADOW_SIMILARITY = registry.histogram(
+    "fashion_model_shadow_similarity",
+    "Similarity (0-1) between a shadow call's output and the served output",
+    ["site", "tier"],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0),
+)
+
+DEFAULT_POLICY: Dict[str, Any] = {
+    "tiers": {
+        "large": {"model": "llama-3.3-70b-versatile"},
+        "small": {"model": "llama-3.1-8b-instant"},
+        "reasoning": {"model": "openai/gpt-oss-120b"},
+        "reasoning_small": {"model": "openai/gpt-oss-20b"},
+        "vision": {"model": "meta-llama/llama-4-maverick-17b-128e-instruct"},
+        "vision_small": {"model": "meta-llama/llama-4-scout-17b-16e-instruct"},
+    },
+    "routes": {
+        # sessions over SESSION_TOKEN_BUDGET chat on the small model (economy mode)
+        "agent.chat": {"tier": "large", "temperature": 0.7, "rules": [{"when": {"over_budget": True}, "tier": "small"}]},
+        "agent.profiler": {"tier": "large", "temperature": 0.7},
+        "agent.vision": {"tier": "vision", "temperature": 0.3},
+        "garment.vision": {"tier": "vision", "temperature": 0.3},
+        "garment.text": {"tier": "reasoning", "temperature": 0.7},
+        "tara.vision": {"tier": "vision", "temperature": 0.5},
+        "tara.text": {"tier": "reasoning", "temperature": 0.7},
+        "try_on.vision": {"tier": "vision", "temperature": 0.3},
+        "try_on.text": {"tier": "large", "temperature": 0.8},
+    },
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def input_chars(value: Any) -> int:
+    """Text size of an LLM input (string, messages, prompt value or template variables); images count as 0."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, PromptValue):
+        return input_chars(value.to_messages())
+    if isinstance(value, BaseMessage):
+        return input_chars(value.content)
+    if isinstance(value, dict):
+        if "type" in value:
+            # a content block: only text blocks count
+            return len(value.get("text", "")) if value["type"] == "text" else 0
+        return sum(input_chars(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(input_chars(v) for v in value)
+    return 0
+
+
+def _words(text: str) -> set:
+    return set(_WORD.findall(text.lower()))
+
+
+def output_similarity(a: Any, b: Any) -> float:
+    """
+    0-1 agreement between two outputs: word-set Jaccard for text, relative
+    difference for numbers, averaged over fields for structured outputs.
+    """
+    if isinstance(a, BaseMessage):
+        a = a.content
+    if isinstance(b, BaseMessage):
+        b = b.content
+    if isinstance(a, BaseModel):
+        a = a.model_dump()
+    if isinstance(b, BaseModel):
+        b = b.model_dump()
+    if a is None or b is None:
+        return 1.0 if a is b else 0.0
+    if isinstance(a, dict) and isinstance(b, dict):
+        keys = set(a) | set(b)
+        return sum(output_similarity(a.get(k), b.get(k)) for k in keys) / len(keys) if keys else 1.0
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        if all(isinstance(x, str) for x in list(a) + list(b)):
+            a, b = " ".join(a), " ".join(b)
+        else:
+            if not a and not b:
+                return 1.0
+            paired = sum(output_similarity(x, y) for x, y in zip(a, b))
+            return paired / max(len(a), len(b))
+    if isinstance(a, bool) or isinstance(b, bool):
+        return 1.0 if a == b else 0.0
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return 1.0 - min(1.0, abs(a - b) / max(abs(a), abs(b), 1))
+    if isinstance(a, str) and isinstance(b, str):
+        words_a, words_b = _words(a), _words(b)
+        union = words_a | words_b
+        return len(words_a & words_b) / len(union) if union else 1.0
+    return 1.0 if a == b else 0.0
+
+
+def load_policy(path: Optional[str] = None) -> Dict[str, Any]:
+    """DEFAULT_POLICY with the file at `path` (JSON, or YAML for .yaml/.yml) merged over it per tier and per route."""
+    policy = copy.deepcopy(DEFAULT_POLICY)
+    if not path:
+        return policy
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            overrides = yaml.safe_load(f) or {}
+        else:
+            overrides = json.load(f)
+    for section in ("tiers", "routes"):
+        for name, value in (overrides.get(section) or {}).items():
+            policy[section].setdefault(name, {}).update(value)
+    return policy
+
+
+class ModelRouter:
+    def __init__(self, policy: Dict[str, Any]):
+        self.tiers: Dict[str, Dict[str, Any]] = policy["tiers"]
+        self.routes: Dict[str, Dict[str, Any]] = policy["routes"]
+        for site, route in self.routes.items():
+            tiers = [route.get("tier")] + [rule.get("tier") for rule in route.get("rules", [])]
+            if route.get("shadow"):
+                tiers.append(route["shadow"].get("tier"))
+            unknown = [tier for tier in tiers if tier not in self.tiers]
+            if unknown:
+                raise ValueError(f"Model routing policy: route {site!r} uses unknown tier(s) {unknown}")
+        self._models: Dict[Tuple, Runnable] = {}
+        self._lock = threading.Lock()
+        # (site, shadow tier) -> running totals
+        self._shadow: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._shadow_tasks: set = set()
+
+    @classmethod
+    def from_env(cls) -> "ModelRouter":
+        """MODEL_ROUTING_POLICY: optional JSON/YAML policy file merged over DEFAULT_POLICY."""
+        path = os.environ.get("MODEL_ROUTING_POLICY")
+        router = cls(load_policy(path))
+        if path:
+            logger.info("Model routing policy loaded", extra={"path": path, "routes": sorted(router.routes)})
+        return router
+
+    def route(self, site: str) -> Dict[str, Any]:
+        try:
+            return self.routes[site]
+        except KeyError:
+            raise ValueError(f"No model route configured for call site {site!r}") from None
+
+    def choose(self, site: str, value: Any) -> Tuple[str, str]:
+        """(tier, reason) for one call."""
+        route = self.route(site)
+        rules = route.get("rules", [])
+        if rules:
+            chars = input_chars(value)
+            over_budget = usage_tracker.is_over_budget(current_session())
+            queued = current_queue_delay()
+            for index, rule in enumerate(rules):
+                when = rule.get("when", {})
+                if "min_input_chars" in when and chars < when["min_input_chars"]:
+                    continue
+                if "max_input_chars" in when and chars > when["max_input_chars"]:
+                    continue
+                if "over_budget" in when and over_budget != when["over_budget"]:
+                    continue
+                if "min_queue_seconds" in when and queued < when["min_queue_seconds"]:
+                    continue
+                return rule["tier"], rule.get("name", f"rule{index}")
+        return route["tier"], "default"
+
+    def model(self, site: str, tier: str, schema: Any = None, structured_kwargs: Optional[Dict[str, Any]] = None) -> Runnable:
+        """The chat model (or structured-output chain) for a tier at the site's temperature, built once."""
+        temperature = self.route(site).get("temperature", 0.7)
+        model_name = self.tiers[tier]["model"]
+        key = (model_name, temperature, schema, tuple(sorted((structured_kwargs or {}).items())))
+        with self._lock:
+            runnable = self._models.get(key)
+            if runnable is None:
+                runnable = get_groq_chat_llm(model_name=model_name, temperature=temperature)
+                if schema is not None:
+                    runnable = runnable.with_structured_output(schema, **(structured_kwargs or {}))
+                self._models[key] = runnable
+            return runnable
+
+    def maybe_shadow(self, llm: "RoutedChatModel", value: Any, tier: str, output: Any, latency: float) -> None:
+        shadow = self.route(llm.site).get("shadow")
+        if not shadow or shadow["tier"] == tier or random.random() >= shadow.get("sample_rate", 0.0):
+            return
+        task = asyncio.create_task(self._run_shadow(llm, value, shadow["tier"], output, latency))
+        self._shadow_tasks.add(task)
+        task.add_done_callback(self._shadow_tasks.discard)
+
+    async def _run_shadow(self, llm: "RoutedChatModel", value: Any, tier: str, served: Any, served_latency: float) -> None:
+        # the user didn't ask for this call: keep it out of their session's token budget
+        bind_session(None)
+        stats = self._shadow.setdefault((llm.site, tier), {
+            "runs": 0, "errors": 0, "served_latency_seconds": 0.0, "shadow_latency_seconds": 0.0, "similarity": 0.0,
+        })
+        start = time.perf_counter()
+        try:
+            with track_stage(f"shadow.{llm.site}"):
+                output = await self.model(llm.site, tier, llm.schema, llm.structured_kwargs).ainvoke(value)
+        except Exception:
+            logger.warning("Shadow call failed", extra={"site": llm.site, "tier": tier}, exc_info=True)
+            stats["errors"] += 1
+            return
+        latency = time.perf_counter() - start
+        similarity = output_similarity(served, output)
+        stats["runs"] += 1
+        stats["served_latency_seconds"] += served_latency
+        stats["shadow_latency_seconds"] += latency
+        stats["similarity"] += similarity
+        SHADOW_LATENCY.observe(latency, site=llm.site, tier=tier)
+        SHADOW_SIMILARITY.observe(similarity, site=llm.site, tier=tier)
+        logger.debug("Shadow call compared", extra={"site": llm.site, "tier": tier, "similarity": round(similarity, 3), "shadow_latency": round(latency, 3)})
+
+    def stats(self) -> Dict[str, Any]:
+        shadows = {}
+        for (site, tier), totals in self._shadow.items():
+            runs = totals["runs"]
+            shadows[f"{site}->{tier}"] = {
+                "runs": runs,
+                "errors": totals["errors"],
+                "served_tier": self.routes[site]["tier"],
+                "avg_served_latency_seconds": round(totals["served_latency_seconds"] / runs, 4) if runs else None,
+                "avg_shadow_latency_seconds": round(totals["shadow_latency_seconds"] / runs, 4) if runs else None,
+                "avg_similarity": round(totals["similarity"] / runs, 4) if runs else None,
+            }
+        return {
+            "tiers": {name: tier["model"] for name, tier in self.tiers.items()},
+            "routes": self.routes,
+            "shadows": shadows,
+        }
+
+
+class RoutedChatModel(Runnable):
+    """
+    Stands in for a chat model at one call site: each call is sent to the
+    model the policy picks for it. Supports `ainvoke`, `invoke`, chaining with
+    `|` and `with_structured_output`.
+    """
+
+    def __init__(self, router: ModelRouter, site: str, schema: Any = None, structured_kwargs: Optional[Dict[str, Any]] = None):
+        self.router = router
+        self.site = site
+        self.schema = schema
+        self.structured_kwargs = structured_kwargs
+        # build the default model now, so a missing API key fails at startup as before
+        router.model(site, router.route(site)["tier"], schema, structured_kwargs)
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> "RoutedChatModel":
+        return RoutedChatModel(self.router, self.site, schema, kwargs)
+
+    def _select(self, value: Any) -> Tuple[str, Runnable]:
+        tier, reason = self.router.choose(self.site, value)
+        ROUTING_DECISIONS.inc(site=self.site, tier=tier, reason=reason)
+        return tier, self.router.model(self.site, tier, self.schema, self.structured_kwargs)
+
+    def invoke(self, input: Any, config=None, **kwargs: Any) -> Any:
+        return self._select(input)[1].invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config=None, **kwargs: Any) -> Any:
+        tier, runnable = self._select(input)
+        start = time.perf_counter()
+        output = await runnable.ainvoke(input, config, **kwargs)
+        self.router.maybe_shadow(self, input, tier, output, time.perf_counter() - start)
+        return output
+
+
+model_router = ModelRouter.from_env()
+
+
+def routed_llm(site: str) -> RoutedChatModel:
+    """The chat model for a call site, as chosen per call by `model_router`."""
+    return RoutedChatModel(model_router, site)
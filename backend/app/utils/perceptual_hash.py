@@ -0,0 +1,223 @@
+"""
+Perceptual image hashes and a Hamming-distance index for near-duplicate lookup.
+
+Byte hashes change whenever a photo is re-encoded, resized or screenshotted;
+these 64-bit hashes are computed from a tiny grayscale version of the image,
+so such copies land within a few bits of the original. A 4x4 colour layout
+is kept alongside, since grayscale alone can't tell colourways apart.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .env import env_flag
+from .metrics import registry
+
+PHASH_LOOKUPS = registry.counter(
+    "fashion_phash_lookups_total", "Near-duplicate image lookups by index and result", ["index", "result"]
+)
+
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+
+
+def _grayscale(image: Any, size: Tuple[int, int]) -> np.ndarray:
+    """Accepts raw bytes, a PIL image or an RGB array; returns a float32 (h, w) array."""
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+        image.draft("L", (size[0] * 4, size[1] * 4))
+    elif isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return np.asarray(image.convert("L").resize(size, Image.BILINEAR), dtype=np.float32)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image: Any) -> int:
+    """Difference hash: whether each pixel is brighter than its right neighbour on a 9x8 thumbnail."""
+    gray = _grayscale(image, (9, 8))
+    return _pack(gray[:, 1:] > gray[:, :-1])
+
+
+def phash(image: Any) -> int:
+    """
+    DCT hash: the 8x8 lowest frequencies of a 32x32 thumbnail, each compared to
+    their median (the DC term is left out of the median, it only tracks brightness).
+    """
+    gray = _grayscale(image, (_DCT_SIZE, _DCT_SIZE))
+    low = (_DCT @ gray @ _DCT.T)[:8, :8]
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def colour_layout(image: Any) -> np.ndarray:
+    """
+    4x4 RGB thumbnail. The hashes are computed on grayscale, so the same cut in
+    navy and in black hashes alike; comparing layouts keeps those apart.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+    elif isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    return np.asarray(image.convert("RGB").resize((4, 4), Image.BILINEAR), dtype=np.uint8)
+
+
+def colour_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Mean absolute per-channel difference between two layouts (0-255), after
+    letting `b` absorb an exposure change of up to 25% either way, so a re-lit
+    copy still matches while white vs. grey of the same cut does not.
+    """
+    a = a.astype(np.float32)
+    b = b.astype(np.float32)
+    energy = float((b * b).sum())
+    gain = float(np.clip((a * b).sum() / energy, 0.8, 1.25)) if energy else 1.0
+    return float(np.abs(a - np.clip(b * gain, 0, 255)).mean())
+
+
+@dataclass
+class ImageFingerprint:
+    phash: int
+    layout: np.ndarray
+
+
+def fingerprint(image: Any) -> ImageFingerprint:
+    """pHash plus colour layout; decodes raw bytes once."""
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(io.BytesIO(image))
+        image.draft("RGB", (128, 128))
+        image = image.convert("RGB")
+    return ImageFingerprint(phash=phash(image), layout=colour_layout(image))
+
+
+class MultiIndexHashTable:
+    """
+    Exact "everything within Hamming distance d" search over 64-bit hashes.
+
+    Each hash is split into d + 1 chunks and indexed under every chunk value.
+    Two hashes that differ in at most d bits must agree on at least one whole
+    chunk (pigeonhole), so only entries sharing a chunk with the query are
+    compared, instead of every stored hash.
+    """
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        self._chunks = [(i * 64 // chunks, (i + 1) * 64 // chunks - i * 64 // chunks) for i in range(chunks)]
+        self._tables: List[Dict[int, set]] = [{} for _ in self._chunks]
+        self._hashes: Dict[Any, int] = {}
+
+    def _chunk_values(self, value: int):
+        return [(value >> shift) & ((1 << width) - 1) for shift, width in self._chunks]
+
+    def add(self, value: int, key: Any) -> None:
+        self._hashes[key] = value
+        for table, chunk in zip(self._tables, self._chunk_values(value)):
+            table.setdefault(chunk, set()).add(key)
+
+    def remove(self, key: Any) -> None:
+        value = self._hashes.pop(key, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, self._chunk_values(value)):
+            bucket = table.get(chunk)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[chunk]
+
+    def search(self, value: int) -> List[Tuple[int, Any]]:
+        """(distance, key) pairs within max_distance, closest first."""
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunk_values(value)):
+            candidates.update(table.get(chunk, ()))
+        found = []
+        for key in candidates:
+            distance = hamming(value, self._hashes[key])
+            if distance <= self.max_distance:
+                found.append((distance, key))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+
+class NearDuplicateIndex:
+    """
+    Bounded map from an image to a stored value (an analysis, a description),
+    found again for perceptual near-duplicates: pHash within `max_distance`
+    bits and a colour layout within `max_colour_distance`. The least recently
+    used entries are evicted past `max_entries`.
+    """
+
+    def __init__(self, name: str, max_distance: int = 6, max_colour_distance: float = 12.0, max_entries: int = 5000):
+        self.name = name
+        self.max_distance = max_distance
+        self.max_colour_distance = max_colour_distance
+        self.max_entries = max_entries
+        self._table = MultiIndexHashTable(max_distance)
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, Any]]" = OrderedDict()  # key -> (colour layout, value)
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, name: str) -> Optional["NearDuplicateIndex"]:
+        """
+        PHASH_DEDUP_ENABLED (default on), PHASH_MAX_DISTANCE (bits out of 64, default 6),
+        PHASH_MAX_COLOUR_DISTANCE (default 12), PHASH_CACHE_SIZE (default 5000).
+        """
+        if not env_flag("PHASH_DEDUP_ENABLED", default=True):
+            return None
+        return cls(
+            name,
+            max_distance=int(os.environ.get("PHASH_MAX_DISTANCE", "6")),
+            max_colour_distance=float(os.environ.get("PHASH_MAX_COLOUR_DISTANCE", "12")),
+            max_entries=int(os.environ.get("PHASH_CACHE_SIZE", "5000")),
+        )
+
+    def lookup(self, image: ImageFingerprint) -> Optional[Tuple[int, Any]]:
+        """(hamming distance, stored value) of the closest matching entry, or None."""
+        with self._lock:
+            for distance, key in self._table.search(image.phash):
+                layout, stored = self._entries[key]
+                if colour_distance(layout, image.layout) <= self.max_colour_distance:
+                    self._entries.move_to_end(key)
+                    PHASH_LOOKUPS.inc(index=self.name, result="hit")
+                    return distance, stored
+        PHASH_LOOKUPS.inc(index=self.name, result="miss")
+        return None
+
+    def add(self, image: ImageFingerprint, stored: Any) -> None:
+        with self._lock:
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (image.layout, stored)
+            self._table.add(image.phash, key)
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._table.remove(oldest)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,11 +1,15 @@
-import os
+"""
+Seed the local Chroma inventory store.
+
+    python -m app.utils.seed_inventory
+
+Embeds through the shared embedding service (same model, backend and thread
+settings as the server) instead of loading a second copy of the model.
+"""
 from langchain_chroma import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 
-print("--- Loading Embedding Model (This might take a minute)... ---")
-
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+from .embeddings import ServiceEmbeddings, embedding_service
 
 
 products = [
@@ -17,21 +21,26 @@ products = [
     {"id": "6", "name": "Running Sneakers", "category": "shoes", "desc": "Lightweight blue running shoes with high arch support.", "price": 70.00},
 ]
 
-docs = []
-for product in products:
-    content = f"{product['name']}: {product['desc']} Category: {product['category']} Price: ${product['price']}"
-    doc = Document(
-        page_content=content,
-        metadata={"product_id": product["id"], "price": product["price"], "name": product["name"]}
+
+def seed(persist_directory: str = "./chroma_db_data") -> Chroma:
+    docs = []
+    for product in products:
+        content = f"{product['name']}: {product['desc']} Category: {product['category']} Price: ${product['price']}"
+        doc = Document(
+            page_content=content,
+            metadata={"product_id": product["id"], "price": product["price"], "name": product["name"]}
+        )
+        docs.append(doc)
+
+    # saving this to chromadb(locally for now)
+    print(f"--- Seeding {len(docs)} products into Vector DB... ---")
+    return Chroma.from_documents(
+        documents=docs,
+        embedding=ServiceEmbeddings(embedding_service),
+        persist_directory=persist_directory
     )
-    docs.append(doc)
 
-# saving this to chromadb(locally for now)
-print(f"--- Seeding {len(docs)} products into Vector DB... ---")
 
-db = Chroma.from_documents(
-    documents=docs,
-    embedding=embeddings,
-    persist_directory="./chroma_db_data"
-)
-print("--- ✅ Inventory Seeded Successfully! ---")
\ No newline at end of file
+if __name__ == "__main__":
+    seed()
+    print("--- ✅ Inventory Seeded Successfully! ---")
@@ -0,0 +1,101 @@
+"""
+Response encoding for the whole app: orjson by default, MessagePack when the
+client asks for it with `Accept: application/msgpack`.
+
+The Accept header is read once per request in middleware and kept in a
+ContextVar, so handlers and FastAPI's own response path only need to use
+NegotiatedResponse (the app's default response class). Pydantic models are
+encoded directly by pydantic-core / ormsgpack, without an intermediate dict.
+"""
+import contextvars
+from typing import Any, Mapping, Optional
+
+import orjson
+import ormsgpack
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_ALIASES = (MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+_MSGPACK_OPTIONS = ormsgpack.OPT_SERIALIZE_PYDANTIC | ormsgpack.OPT_NON_STR_KEYS | ormsgpack.OPT_SERIALIZE_NUMPY
+
+_wants_msgpack: contextvars.ContextVar[bool] = contextvars.ContextVar("wants_msgpack", default=False)
+
+
+def _accept_quality(accept: str, media_types) -> float:
+    best = 0.0
+    for media_range in accept.split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type.lower() not in media_types:
+            continue
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        best = max(best, quality)
+    return best
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """True if the Accept header lists MessagePack at least as highly as JSON."""
+    if not accept or "msgpack" not in accept:
+        return False
+    msgpack_q = _accept_quality(accept, _MSGPACK_ALIASES)
+    return msgpack_q > 0 and msgpack_q >= _accept_quality(accept, ("application/json",))
+
+
+def negotiate_response_format(accept: Optional[str]) -> contextvars.Token:
+    """Called by middleware for each request; the token can reset the choice afterwards."""
+    return _wants_msgpack.set(prefers_msgpack(accept))
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes. Top-level models go through pydantic-core's serializer, everything else through orjson."""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+def packb(content: Any) -> bytes:
+    return ormsgpack.packb(content, default=_default, option=_MSGPACK_OPTIONS)
+
+
+class NegotiatedResponse(Response):
+    """
+    JSON (orjson) or MessagePack, following the request's Accept header.
+    Content can be plain data or pydantic models, at any depth.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        if media_type is None and _wants_msgpack.get():
+            media_type = MSGPACK_MEDIA_TYPE
+        headers = {**(headers or {}), "Vary": "Accept"}
+        super().__init__(content, status_code, headers, media_type, background)
+
+    def render(self, content: Any) -> bytes:
+        if self.media_type == MSGPACK_MEDIA_TYPE:
+            return packb(content)
+        return dumps(content)
@@ -0,0 +1,160 @@
+"""
+Non-blocking structured logging.
+
+Request handlers only pay for building a LogRecord and a `put_nowait` onto an
+in-memory queue; a background QueueListener thread does the JSON formatting and
+the (possibly slow) write to stdout. Every record carries the current request's
+correlation id, and DEBUG records are sampled so high-volume events such as
+full upstream responses don't flood the output under load.
+
+Usage:
+    logger = get_logger(__name__)
+    logger.info("Analysis complete", extra={"category": analysis.category})
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+import atexit
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+from .metrics import registry
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# [seconds spent in logging calls, number of records] for the current request
+_log_overhead: ContextVar[Optional[List[float]]] = ContextVar("log_overhead", default=None)
+
+LOG_OVERHEAD = registry.histogram(
+    "fashion_log_overhead_seconds", "Time request handlers spent inside logging calls",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+LOG_OVERHEAD_EXCEEDED = registry.counter(
+    "fashion_log_overhead_budget_exceeded_total", "Requests whose logging overhead exceeded LOG_OVERHEAD_BUDGET_MS"
+)
+LOG_DROPPED = registry.counter(
+    "fashion_log_records_dropped_total", "Records dropped because the log queue was full or sampled out", ["reason"]
+)
+
+# Attributes every LogRecord has; anything else came in through `extra=` and is emitted as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample_rate"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller: the record is stamped with the
+    request id, sampled if it is DEBUG, and dropped if the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, debug_sample_rate: float):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        start = time.perf_counter()
+        try:
+            if record.levelno <= logging.DEBUG:
+                rate = getattr(record, "sample_rate", self.debug_sample_rate)
+                if rate < 1.0 and random.random() >= rate:
+                    LOG_DROPPED.inc(reason="sampled")
+                    return False
+            record.request_id = request_id_var.get()
+            return super().handle(record)
+        finally:
+            overhead = _log_overhead.get()
+            if overhead is not None:
+                overhead[0] += time.perf_counter() - start
+                overhead[1] += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now (args may be mutated later) but leave exc_info
+        # intact so the traceback is formatted on the listener thread, not here.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc(reason="queue_full")
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging() -> None:
+    """
+    Install the queue-backed JSON handler on the root logger. Idempotent.
+
+    Environment:
+        LOG_LEVEL               minimum level (default INFO)
+        LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept (default 0.1)
+        LOG_QUEUE_SIZE          records buffered before new ones are dropped (default 10000)
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+    handler = _NonBlockingQueueHandler(log_queue, float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.1")))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+
+
+def shutdown_logging() -> None:
+    """Flush whatever is still queued and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(name)
+
+
+def start_request_log_context(request_id: str) -> List[float]:
+    request_id_var.set(request_id)
+    overhead = [0.0, 0]
+    _log_overhead.set(overhead)
+    return overhead
+
+
+def record_log_overhead(overhead: List[float]) -> None:
+    """Feed one request's logging overhead into the metrics and check it against the budget."""
+    LOG_OVERHEAD.observe(overhead[0])
+    budget_ms = float(os.environ.get("LOG_OVERHEAD_BUDGET_MS", "1.0"))
+    if overhead[0] * 1000 > budget_ms:
+        LOG_OVERHEAD_EXCEEDED.inc()
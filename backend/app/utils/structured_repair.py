@@ -0,0 +1,445 @@
+"""
+Local repair and partial re-asking for structured LLM outputs.
+
+`with_structured_output` turns any schema slip into an exception: a
+`preference_score` of 105, a comma-separated string where a list was asked
+for, a tool call cut off mid-JSON, one malformed option out of four. The
+caller then throws the whole (slow, paid-for) answer away. `RepairingStructuredOutput`
+asks for the raw output alongside the parsed one and, when parsing fails:
+
+1. recovers the JSON the model produced (tool-call arguments, Groq's
+   `failed_generation`, or text), closing truncated JSON where possible;
+2. repairs it against the schema: numbers clamped to their bounds, strings
+   and lists coerced into each other, invalid items dropped from lists of
+   objects;
+3. if required fields are still missing or invalid, asks the model again for
+   only those fields, with the valid rest as context;
+4. only if nothing can be recovered, repeats the full call once.
+
+Outcomes per call site go to `fashion_structured_outputs_total`, the fixes
+applied to `fashion_structured_repairs_total`, and the estimated time saved
+against repeating the full call to `fashion_structured_latency_saved_seconds_total`.
+"""
+import json
+import re
+import time
+import typing
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable
+from pydantic import BaseModel, ValidationError, create_model
+
+from .metrics import registry
+from .structured_logging import get_logger
+
+logger = get_logger(__name__)
+
+STRUCTURED_OUTPUTS = registry.counter(
+    "fashion_structured_outputs_total",
+    "Structured LLM outputs by how they were obtained (valid, repaired, partial_retry, full_retry, failed)",
+    ["site", "outcome"],
+)
+STRUCTURED_REPAIRS = registry.counter(
+    "fashion_structured_repairs_total", "Local fixes applied to structured outputs", ["site", "fix"]
+)
+STRUCTURED_LATENCY_SAVED = registry.counter(
+    "fashion_structured_latency_saved_seconds_total",
+    "Estimated time saved by repairing or partially re-asking instead of repeating the full call",
+    ["site"],
+)
+
+OUTCOMES = ("valid", "repaired", "partial_retry", "full_retry", "failed")
+
+
+class StructuredOutputError(ValueError):
+    """The model's output could not be parsed, repaired or re-asked into the schema."""
+
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def complete_json(text: str) -> Optional[Any]:
+    """
+    Parse JSON that may be wrapped in prose or a code fence, or cut off: open
+    strings, arrays and objects are closed, and if that isn't enough the
+    incomplete trailing member is dropped. None if nothing parses.
+    """
+    text = _FENCE.sub("", text.strip())
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None
+    text = text[min(starts):]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+
+    closers = {"{": "}", "[": "]"}
+    stack: List[str] = []
+    cuts: List[Tuple[int, List[str]]] = []   # (index of a separating comma, open brackets there)
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in closers:
+            stack.append(char)
+        elif char in "}]":
+            if not stack:
+                # trailing text after the top-level value
+                text = text[:index]
+                break
+            stack.pop()
+            if not stack:
+                text = text[:index + 1]
+                break
+        elif char == ",":
+            cuts.append((index, list(stack)))
+
+    def close(prefix: str, open_brackets: List[str]) -> str:
+        return prefix.rstrip().rstrip(",") + "".join(closers[b] for b in reversed(open_brackets))
+
+    candidates = [close(text + ('"' if in_string else ""), stack)]
+    candidates += [close(text[:index], open_brackets) for index, open_brackets in reversed(cuts)]
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _strip_optional(annotation: Any) -> Any:
+    if typing.get_origin(annotation) is typing.Union:
+        args = [a for a in typing.get_args(annotation) if a is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+def _bounds(field) -> Tuple[Optional[float], Optional[float]]:
+    low = high = None
+    for item in field.metadata:
+        low = getattr(item, "ge", None) if getattr(item, "ge", None) is not None else low
+        high = getattr(item, "le", None) if getattr(item, "le", None) is not None else high
+    return low, high
+
+
+def _is_model(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def _repair_value(annotation: Any, value: Any, field, fixes: List[str]) -> Any:
+    annotation = _strip_optional(annotation)
+    origin = typing.get_origin(annotation)
+
+    if origin in (list, List):
+        (item_type,) = typing.get_args(annotation) or (Any,)
+        item_type = _strip_optional(item_type)
+        if value is None:
+            fixes.append("default_list")
+            return []
+        if isinstance(value, str) and not _is_model(item_type):
+            fixes.append("coerce")
+            return [part.strip(" -*•") for part in re.split(r"[\n,;]", value) if part.strip(" -*•")]
+        if isinstance(value, dict):
+            fixes.append("coerce")
+            value = [value]
+        if not isinstance(value, list):
+            return value
+        if _is_model(item_type):
+            kept = []
+            for item in value:
+                repaired = repair_model(item_type, item, fixes)[0] if isinstance(item, dict) else None
+                if repaired is None:
+                    fixes.append("drop_item")
+                    continue
+                kept.append(repaired.model_dump())
+            if value and not kept and field is not None and field.is_required():
+                # every item was invalid: an empty required list isn't an answer, leave the field failed
+                return value
+            return kept
+        if item_type is str:
+            coerced = [item if isinstance(item, str) else json.dumps(item) if isinstance(item, (dict, list)) else str(item) for item in value if item is not None]
+            if coerced != value:
+                fixes.append("coerce")
+            return coerced
+        return value
+
+    if _is_model(annotation):
+        if isinstance(value, dict):
+            repaired = repair_model(annotation, value, fixes)[0]
+            return repaired.model_dump() if repaired is not None else value
+        return value
+
+    if annotation in (int, float):
+        number = value
+        if isinstance(value, str):
+            match = _NUMBER.search(value)
+            if match is None:
+                return value
+            number = float(match.group())
+            fixes.append("coerce")
+        if isinstance(number, bool) or not isinstance(number, (int, float)):
+            return value
+        low, high = _bounds(field) if field is not None else (None, None)
+        clamped = min(max(number, low) if low is not None else number, high) if high is not None else (max(number, low) if low is not None else number)
+        if clamped != number:
+            fixes.append("clamp")
+        if annotation is int:
+            if clamped != int(clamped):
+                fixes.append("coerce")
+            return int(round(clamped))
+        return float(clamped)
+
+    if annotation is str:
+        if isinstance(value, list):
+            fixes.append("coerce")
+            return ", ".join(str(v) for v in value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            fixes.append("coerce")
+            return str(value)
+    return value
+
+
+def repair_model(schema: Type[BaseModel], data: Dict[str, Any], fixes: List[str]) -> Tuple[Optional[BaseModel], Dict[str, Any], List[str]]:
+    """
+    (validated model or None, repaired data, top-level fields still invalid).
+    `fixes` collects the names of the repairs applied.
+    """
+    repaired = {}
+    for name, field in schema.model_fields.items():
+        key = name if name in data else field.alias if field.alias in data else None
+        if key is None:
+            continue
+        repaired[name] = _repair_value(field.annotation, data[key], field, fixes)
+    try:
+        return schema.model_validate(repaired), repaired, []
+    except ValidationError as e:
+        failed = sorted({str(error["loc"][0]) for error in e.errors() if error["loc"]})
+        return None, repaired, failed
+
+
+def _messages(value: Any) -> List[BaseMessage]:
+    if isinstance(value, PromptValue):
+        return value.to_messages()
+    if isinstance(value, str):
+        return [HumanMessage(content=value)]
+    if isinstance(value, list):
+        return list(value)
+    raise TypeError(f"Can't re-ask with input of type {type(value).__name__}")
+
+
+def _raw_payload(output: Dict[str, Any]) -> Optional[Any]:
+    """The arguments the model meant to send, from whatever form they came back in."""
+    raw = output.get("raw")
+    if raw is None:
+        return None
+    for call in getattr(raw, "tool_calls", None) or []:
+        if isinstance(call.get("args"), dict):
+            return call["args"]
+    for call in getattr(raw, "invalid_tool_calls", None) or []:
+        if call.get("args"):
+            parsed = complete_json(call["args"])
+            if parsed is not None:
+                return parsed
+    if isinstance(raw.content, str) and raw.content:
+        return complete_json(raw.content)
+    return None
+
+
+def _failed_generation(error: Exception) -> Optional[Any]:
+    """Groq rejects malformed tool calls (400 tool_use_failed) but returns what the model generated."""
+    body = getattr(error, "body", None)
+    if isinstance(body, dict):
+        body = body.get("error", body)
+        generation = body.get("failed_generation") if isinstance(body, dict) else None
+        if generation:
+            parsed = complete_json(generation)
+            # the failed generation is sometimes the whole tool call, arguments nested inside
+            if isinstance(parsed, dict) and isinstance(parsed.get("arguments"), (dict, str)):
+                arguments = parsed["arguments"]
+                return arguments if isinstance(arguments, dict) else complete_json(arguments)
+            return parsed
+    return None
+
+
+class RepairingStructuredOutput(Runnable):
+    """
+    Drop-in for `llm.with_structured_output(schema)` on a RoutedChatModel; the
+    call site's name labels the metrics.
+    """
+
+    def __init__(self, llm, schema: Type[BaseModel], site: Optional[str] = None):
+        self.schema = schema
+        self.site = site or getattr(llm, "site", schema.__name__)
+        self.llm = llm
+        self.raw_llm = llm.with_structured_output(schema, include_raw=True)
+        # running average of a full call, what a repair saves over repeating it
+        self._full_call_seconds: Optional[float] = None
+        self.counts: Dict[str, int] = {outcome: 0 for outcome in OUTCOMES}
+        self.saved_seconds = 0.0
+        # one subset schema and runnable per set of failed fields; the router caches a model per schema class
+        self._partial_llms: Dict[frozenset, Runnable] = {}
+
+    def _record(self, outcome: str, fixes: List[str] = (), saved: float = 0.0) -> None:
+        self.counts[outcome] += 1
+        STRUCTURED_OUTPUTS.inc(site=self.site, outcome=outcome)
+        for fix in set(fixes):
+            STRUCTURED_REPAIRS.inc(site=self.site, fix=fix)
+        if saved > 0:
+            self.saved_seconds += saved
+            STRUCTURED_LATENCY_SAVED.inc(saved, site=self.site)
+
+    def _observe_full_call(self, seconds: float) -> None:
+        if self._full_call_seconds is None:
+            self._full_call_seconds = seconds
+        else:
+            self._full_call_seconds = 0.8 * self._full_call_seconds + 0.2 * seconds
+
+    def _partial_llm(self, failed: List[str]) -> Runnable:
+        key = frozenset(failed)
+        runnable = self._partial_llms.get(key)
+        if runnable is None:
+            fields = {name: (self.schema.model_fields[name].annotation, self.schema.model_fields[name]) for name in failed}
+            partial_schema = create_model(f"{self.schema.__name__}Fields", **fields)
+            runnable = self._partial_llms[key] = self.llm.with_structured_output(partial_schema)
+        return runnable
+
+    def _first_attempt(self, output: Optional[Dict[str, Any]], error: Optional[Exception], seconds: float) -> Tuple[Optional[Dict[str, Any]], Any, List[str]]:
+        """(output, recovered payload, fixes) from the first call; re-raises errors with nothing to recover."""
+        if error is not None:
+            payload = _failed_generation(error)
+            if payload is None:
+                raise error
+            return {"raw": None, "parsed": None, "parsing_error": error}, payload, ["failed_generation"]
+        self._observe_full_call(seconds)
+        return output, _raw_payload(output), []
+
+    def _repaired(self, model: BaseModel, outcome: str, fixes: List[str], repair_start: float, **extra: Any) -> BaseModel:
+        self._record(outcome, fixes, saved=(self._full_call_seconds or 0.0) - (time.perf_counter() - repair_start))
+        logger.info("Structured output repaired", extra={"site": self.site, "outcome": outcome, "fixes": sorted(set(fixes)), **extra})
+        return model
+
+    def _reask_messages(self, input: Any, data: Dict[str, Any], failed: List[str]) -> List[BaseMessage]:
+        valid = {name: value for name, value in data.items() if name not in failed}
+        return _messages(input) + [HumanMessage(content=(
+            f"Your previous answer was missing or had invalid values for: {', '.join(failed)}. "
+            f"These parts were fine and are kept: {json.dumps(valid, ensure_ascii=False)[:4000]}. "
+            f"Return only {', '.join(failed)}, consistent with them."
+        ))]
+
+    def _merge_partial(self, data: Dict[str, Any], partial: BaseModel) -> Optional[BaseModel]:
+        return repair_model(self.schema, {**data, **partial.model_dump()}, [])[0]
+
+    def _from_retry(self, output: Dict[str, Any], retry: Dict[str, Any], fixes: List[str]) -> BaseModel:
+        if retry.get("parsed") is not None:
+            self._record("full_retry", fixes)
+            return retry["parsed"]
+        payload = _raw_payload(retry)
+        if isinstance(payload, dict):
+            model = repair_model(self.schema, payload, fixes)[0]
+            if model is not None:
+                self._record("full_retry", fixes)
+                return model
+        self._record("failed", fixes)
+        raise StructuredOutputError(f"{self.schema.__name__}: {retry.get('parsing_error')}")
+
+    def _log_unrecoverable(self, output: Dict[str, Any]) -> None:
+        # nothing usable came back: one more full call, which is what the caller would have fallen back to
+        logger.warning("Structured output unrecoverable, repeating the call", extra={"site": self.site, "error": str(output.get("parsing_error"))[:300]})
+
+    def invoke(self, input: Any, config=None, **kwargs: Any) -> BaseModel:
+        start = time.perf_counter()
+        output = error = None
+        try:
+            output = self.raw_llm.invoke(input, config, **kwargs)
+        except Exception as e:
+            error = e
+        if output is not None and output.get("parsed") is not None:
+            self._observe_full_call(time.perf_counter() - start)
+            self._record("valid")
+            return output["parsed"]
+        output, payload, fixes = self._first_attempt(output, error, time.perf_counter() - start)
+
+        repair_start = time.perf_counter()
+        if isinstance(payload, dict):
+            model, data, failed = repair_model(self.schema, payload, fixes)
+            if model is not None:
+                return self._repaired(model, "repaired", fixes, repair_start)
+            if failed and len(failed) < len(self.schema.model_fields):
+                try:
+                    model = self._merge_partial(data, self._partial_llm(failed).invoke(self._reask_messages(input, data, failed), config))
+                except Exception:
+                    logger.warning("Re-asking failed fields failed", extra={"site": self.site, "fields": failed}, exc_info=True)
+                    model = None
+                if model is not None:
+                    return self._repaired(model, "partial_retry", fixes, repair_start, fields=failed)
+
+        self._log_unrecoverable(output)
+        return self._from_retry(output, self.raw_llm.invoke(input, config, **kwargs), fixes)
+
+    async def ainvoke(self, input: Any, config=None, **kwargs: Any) -> BaseModel:
+        start = time.perf_counter()
+        output = error = None
+        try:
+            output = await self.raw_llm.ainvoke(input, config, **kwargs)
+        except Exception as e:
+            error = e
+        if output is not None and output.get("parsed") is not None:
+            self._observe_full_call(time.perf_counter() - start)
+            self._record("valid")
+            return output["parsed"]
+        output, payload, fixes = self._first_attempt(output, error, time.perf_counter() - start)
+
+        repair_start = time.perf_counter()
+        if isinstance(payload, dict):
+            model, data, failed = repair_model(self.schema, payload, fixes)
+            if model is not None:
+                return self._repaired(model, "repaired", fixes, repair_start)
+            if failed and len(failed) < len(self.schema.model_fields):
+                try:
+                    model = self._merge_partial(data, await self._partial_llm(failed).ainvoke(self._reask_messages(input, data, failed), config))
+                except Exception:
+                    logger.warning("Re-asking failed fields failed", extra={"site": self.site, "fields": failed}, exc_info=True)
+                    model = None
+                if model is not None:
+                    return self._repaired(model, "partial_retry", fixes, repair_start, fields=failed)
+
+        self._log_unrecoverable(output)
+        return self._from_retry(output, await self.raw_llm.ainvoke(input, config, **kwargs), fixes)
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            "schema": self.schema.__name__,
+            "calls": dict(self.counts),
+            "repair_rate": round((self.counts["repaired"] + self.counts["partial_retry"]) / total, 4) if total else None,
+            "retry_rate": round(self.counts["full_retry"] / total, 4) if total else None,
+            "avg_full_call_seconds": round(self._full_call_seconds, 3) if self._full_call_seconds is not None else None,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+        }
+
+
+_instances: List[RepairingStructuredOutput] = []
+
+
+def repairing_structured_output(llm, schema: Type[BaseModel], site: Optional[str] = None) -> RepairingStructuredOutput:
+    """`llm.with_structured_output(schema)` with local repair; registered for `structured_output_stats()`."""
+    runnable = RepairingStructuredOutput(llm, schema, site)
+    _instances.append(runnable)
+    return runnable
+
+
+def structured_output_stats() -> Dict[str, Any]:
+    return {f"{r.site}:{r.schema.__name__}": r.stats() for r in _instances}
@@ -0,0 +1,117 @@
+"""
+Bounded, low-copy image uploads.
+
+Starlette already spools multipart files to a temporary file past 1MB. These
+helpers read that file in fixed-size chunks (rejecting it with 413 once it
+exceeds MAX_UPLOAD_BYTES) and base64-encode each chunk straight into the data
+URL the vision model receives, so the raw upload is never held in memory in
+one piece and the encoded image exists as a single string.
+"""
+import binascii
+import hashlib
+import os
+from typing import Union
+
+from fastapi import HTTPException, UploadFile
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# a multiple of 3, so per-chunk base64 output concatenates without padding in between
+_CHUNK_BYTES = 3 * 64 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    """Short digest of an upload's raw bytes, for exact-duplicate detection."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class ImagePayload:
+    """
+    An image as the `data:<type>;base64,...` URL sent to the vision model.
+    Services take this instead of a bare base64 string so every consumer
+    shares the one encoded copy.
+    """
+
+    __slots__ = ("data_url", "_offset")
+
+    def __init__(self, data_url: str):
+        self.data_url = data_url
+        self._offset = data_url.index(",") + 1
+
+    @classmethod
+    def from_base64(cls, image_base64: str, media_type: str = "image/jpeg") -> "ImagePayload":
+        return cls(f"data:{media_type};base64,{image_base64}")
+
+    @classmethod
+    def from_bytes(cls, image_bytes: bytes, media_type: str = "image/jpeg") -> "ImagePayload":
+        return cls(f"data:{media_type};base64," + binascii.b2a_base64(image_bytes, newline=False).decode("ascii"))
+
+    @property
+    def media_type(self) -> str:
+        return self.data_url[5:self._offset - 1].split(";", 1)[0]
+
+    @property
+    def b64(self) -> str:
+        """Bare base64 (a new string; only for responses that echo the image back)."""
+        return self.data_url[self._offset:]
+
+    @property
+    def encoded_size(self) -> int:
+        return len(self.data_url) - self._offset
+
+    def raw(self) -> bytes:
+        """Decoded image bytes, for local pixel work. Transient: callers shouldn't keep them."""
+        return binascii.a2b_base64(self.data_url[self._offset:])
+
+    def message_part(self) -> dict:
+        """The image_url content block for a multimodal HumanMessage."""
+        return {"type": "image_url", "image_url": {"url": self.data_url}}
+
+
+def as_payload(image: Union[str, ImagePayload], media_type: str = "image/jpeg") -> ImagePayload:
+    """Accept an ImagePayload, a data URL or bare base64."""
+    if isinstance(image, ImagePayload):
+        return image
+    if image.startswith("data:"):
+        return ImagePayload(image)
+    return ImagePayload.from_base64(image, media_type)
+
+
+def _too_large(file: UploadFile, max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{file.filename or 'upload'} is larger than the {max_bytes // (1024 * 1024)}MB limit",
+    )
+
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Raw bytes of an upload, raising 413 past `max_bytes` without reading the rest."""
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(file, max_bytes)
+    chunks = []
+    total = 0
+    while chunk := await file.read(_CHUNK_BYTES):
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(file, max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def read_image(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> ImagePayload:
+    """
+    Encode an upload chunk by chunk into an ImagePayload, raising 413 past
+    `max_bytes`. The raw bytes are never all in memory; the encoded image
+    exists twice only for the final bytes -> str conversion.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(file, max_bytes)
+    media_type = file.content_type if (file.content_type or "").startswith("image/") else "image/jpeg"
+    buffer = bytearray(f"data:{media_type};base64,".encode("ascii"))
+    total = 0
+    while chunk := await file.read(_CHUNK_BYTES):
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(file, max_bytes)
+        buffer += binascii.b2a_base64(chunk, newline=False)
+    return ImagePayload(buffer.decode("ascii"))
@@ -0,0 +1,253 @@
+"""
+Token and cost accounting for every Groq call.
+
+`get_groq_chat_llm` attaches `usage_callback` to each ChatGroq instance, so every
+`ainvoke` (including `with_structured_output` chains) reports prompt/completion
+tokens, latency and model from the response metadata. Records are attributed to
+the current endpoint, session and service stage and aggregated along each of
+those dimensions for the admin API.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from .metrics import registry, current_stage
+
+# USD per 1M tokens (input, output). Override with MODEL_PRICING='{"model": [in, out], ...}'.
+DEFAULT_MODEL_PRICING: Dict[str, List[float]] = {
+    "llama-3.3-70b-versatile": [0.59, 0.79],
+    "llama-3.1-8b-instant": [0.05, 0.08],
+    "openai/gpt-oss-120b": [0.15, 0.75],
+    "openai/gpt-oss-20b": [0.10, 0.50],
+    "meta-llama/llama-4-maverick-17b-128e-instruct": [0.20, 0.60],
+    "meta-llama/llama-4-scout-17b-16e-instruct": [0.11, 0.34],
+}
+
+LLM_TOKENS = registry.counter("fashion_llm_tokens_total", "LLM tokens consumed", ["model", "kind"])
+LLM_CALLS = registry.counter("fashion_llm_calls_total", "LLM calls made", ["model", "endpoint"])
+LLM_LATENCY = registry.histogram("fashion_llm_call_duration_seconds", "Latency of individual LLM calls", ["model"])
+LLM_ABANDONED = registry.counter(
+    "fashion_llm_calls_abandoned_total", "LLM calls cancelled before they finished (client disconnects)", ["stage"]
+)
+
+# The request scope is stored rather than the route path: routing happens after
+# the middleware runs, but the scope dict is shared and gets the route added to it.
+_request_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("usage_request_scope", default=None)
+_session_id: ContextVar[Optional[str]] = ContextVar("usage_session_id", default=None)
+
+
+def bind_request(scope: Dict[str, Any]) -> None:
+    _request_scope.set(scope)
+
+
+def bind_session(session_id: Optional[str]) -> None:
+    _session_id.set(session_id)
+
+
+def current_endpoint() -> str:
+    scope = _request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", scope.get("path", "unknown"))
+
+
+def current_session() -> Optional[str]:
+    return _session_id.get()
+
+
+def _empty_totals() -> Dict[str, float]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "total_tokens": 0,
+        "latency_seconds": 0.0,
+        "cost_usd": 0.0,
+    }
+
+
+class UsageTracker:
+    """
+    Aggregates LLM usage per endpoint, session, model and stage.
+
+    Sessions are kept in an LRU of at most `max_sessions` entries so long-running
+    servers don't grow without bound; the other dimensions are naturally small.
+    """
+
+    def __init__(self, max_sessions: int = 10000, session_token_budget: Optional[int] = None):
+        self.max_sessions = max_sessions
+        self.session_token_budget = session_token_budget
+        self.pricing = dict(DEFAULT_MODEL_PRICING)
+        if os.environ.get("MODEL_PRICING"):
+            self.pricing.update(json.loads(os.environ["MODEL_PRICING"]))
+        self._lock = threading.Lock()
+        self._totals = _empty_totals()
+        self._by_endpoint: Dict[str, Dict[str, float]] = {}
+        self._by_model: Dict[str, Dict[str, float]] = {}
+        self._by_stage: Dict[str, Dict[str, float]] = {}
+        self._by_session: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price_in, price_out = self.pricing.get(model, (0.0, 0.0))
+        return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        latency: float,
+        endpoint: str,
+        session_id: Optional[str] = None,
+        stage: Optional[str] = None,
+    ) -> None:
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            buckets = [
+                self._totals,
+                self._by_endpoint.setdefault(endpoint, _empty_totals()),
+                self._by_model.setdefault(model, _empty_totals()),
+                self._by_stage.setdefault(stage or "unstaged", _empty_totals()),
+            ]
+            if session_id:
+                session = self._by_session.get(session_id)
+                if session is None:
+                    session = self._by_session[session_id] = _empty_totals()
+                    if len(self._by_session) > self.max_sessions:
+                        self._by_session.popitem(last=False)
+                else:
+                    self._by_session.move_to_end(session_id)
+                buckets.append(session)
+            for bucket in buckets:
+                bucket["calls"] += 1
+                bucket["prompt_tokens"] += prompt_tokens
+                bucket["completion_tokens"] += completion_tokens
+                bucket["total_tokens"] += prompt_tokens + completion_tokens
+                bucket["latency_seconds"] += latency
+                bucket["cost_usd"] += cost
+
+        LLM_TOKENS.inc(prompt_tokens, model=model, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model, kind="completion")
+        LLM_CALLS.inc(model=model, endpoint=endpoint)
+        LLM_LATENCY.observe(latency, model=model)
+
+    def session_usage(self, session_id: str) -> Optional[Dict[str, float]]:
+        with self._lock:
+            usage = self._by_session.get(session_id)
+            return dict(usage) if usage else None
+
+    def session_tokens(self, session_id: str) -> int:
+        usage = self._by_session.get(session_id)
+        return int(usage["total_tokens"]) if usage else 0
+
+    def is_over_budget(self, session_id: Optional[str]) -> bool:
+        if not session_id or not self.session_token_budget:
+            return False
+        return self.session_tokens(session_id) >= self.session_token_budget
+
+    def summary(self, top_sessions: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            sessions = sorted(self._by_session.items(), key=lambda kv: kv[1]["total_tokens"], reverse=True)
+            return {
+                "totals": dict(self._totals),
+                "by_endpoint": {k: dict(v) for k, v in self._by_endpoint.items()},
+                "by_model": {k: dict(v) for k, v in self._by_model.items()},
+                "by_stage": {k: dict(v) for k, v in self._by_stage.items()},
+                "top_sessions": {k: dict(v) for k, v in sessions[:top_sessions]},
+                "tracked_sessions": len(self._by_session),
+                "session_token_budget": self.session_token_budget,
+            }
+
+
+def _read_budget() -> Optional[int]:
+    value = os.environ.get("SESSION_TOKEN_BUDGET")
+    return int(value) if value else None
+
+
+usage_tracker = UsageTracker(session_token_budget=_read_budget())
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Captures token usage from each chat model call and feeds `usage_tracker`."""
+
+    # Run in the caller's task so the endpoint/session/stage context vars are visible
+    run_inline = True
+
+    def __init__(self, tracker: UsageTracker):
+        self.tracker = tracker
+        self._pending: Dict[UUID, Dict[str, Any]] = {}
+
+    def _start(self, run_id: UUID) -> None:
+        self._drop_abandoned()
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        self._pending[run_id] = {
+            "start": time.perf_counter(),
+            "endpoint": current_endpoint(),
+            "session_id": current_session(),
+            "stage": current_stage(),
+            "task": task,
+        }
+
+    def _drop_abandoned(self) -> None:
+        """
+        A call cancelled mid-flight (its request's client went away) gets neither
+        on_llm_end nor on_llm_error; forget it once the task that started it is done.
+        """
+        abandoned = [run_id for run_id, pending in self._pending.items() if pending["task"] is not None and pending["task"].done()]
+        for run_id in abandoned:
+            LLM_ABANDONED.inc(stage=self._pending.pop(run_id)["stage"] or "unstaged")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._pending.pop(run_id, None)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        latency = time.perf_counter() - pending["start"]
+        llm_output = response.llm_output or {}
+        token_usage = llm_output.get("token_usage") or {}
+        model = llm_output.get("model_name", "unknown")
+        prompt_tokens = token_usage.get("prompt_tokens")
+        completion_tokens = token_usage.get("completion_tokens")
+
+        if prompt_tokens is None:
+            # Fall back to the per-message usage metadata LangChain attaches
+            prompt_tokens = completion_tokens = 0
+            for generations in response.generations:
+                for generation in generations:
+                    usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+
+        self.tracker.record(
+            model=model,
+            prompt_tokens=int(prompt_tokens or 0),
+            completion_tokens=int(completion_tokens or 0),
+            latency=latency,
+            endpoint=pending["endpoint"],
+            session_id=pending["session_id"],
+            stage=pending["stage"],
+        )
+
+
+usage_callback = UsageCallbackHandler(usage_tracker)
@@ -0,0 +1,189 @@
+"""
+Near-duplicate detection benchmark for the perceptual hashes in
+app/utils/perceptual_hash.py.
+
+Half of the corpus is indexed; every indexed image is then queried as several
+re-encoded/resized/cropped copies (should match), and the other half is
+queried as-is (should not match). Reports precision/recall per hash and
+distance threshold (pHash alone and with the colour-layout check used in
+production), and multi-index vs linear-scan lookup latency.
+
+    cd backend
+    python benchmarks/bench_phash.py --corpus path/to/photos
+    python benchmarks/bench_phash.py            # synthetic corpus
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageEnhance
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils.perceptual_hash import (  # noqa: E402
+    MultiIndexHashTable, colour_distance, dhash, fingerprint, hamming, phash,
+)
+
+THRESHOLDS = (2, 4, 6, 8, 10, 12)
+MAX_COLOUR_DISTANCE = 12.0
+
+
+def _dhash(data: bytes):
+    return dhash(data), None
+
+
+def _phash(data: bytes):
+    return phash(data), None
+
+
+def _phash_colour(data: bytes):
+    fp = fingerprint(data)
+    return fp.phash, fp.layout
+
+
+MATCHERS = {"dhash": _dhash, "phash": _phash, "phash+colour": _phash_colour}
+
+
+def synthetic_corpus(count: int, seed: int = 0):
+    """Garment-like product shots: a coloured shape on a light backdrop, plain, striped or dotted."""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        backdrop = tuple(rng.randint(200, 255) for _ in range(3))
+        image = Image.new("RGB", (480, 640), backdrop)
+        draw = ImageDraw.Draw(image)
+        color = tuple(rng.randint(0, 200) for _ in range(3))
+        box = [rng.randint(40, 140), rng.randint(40, 160), rng.randint(340, 440), rng.randint(480, 600)]
+        if rng.random() < 0.5:
+            draw.rectangle(box, fill=color)
+        else:
+            draw.ellipse(box, fill=color)
+        style = rng.choice(["plain", "stripes", "dots"])
+        accent = tuple(rng.randint(0, 255) for _ in range(3))
+        if style == "stripes":
+            step = rng.randint(12, 40)
+            for x in range(box[0], box[2], step):
+                draw.rectangle([x, box[1], x + step // 2, box[3]], fill=accent)
+        elif style == "dots":
+            for _ in range(rng.randint(10, 60)):
+                x, y = rng.randint(box[0], box[2]), rng.randint(box[1], box[3])
+                r = rng.randint(4, 14)
+                draw.ellipse([x - r, y - r, x + r, y + r], fill=accent)
+        images.append(image)
+    return images
+
+
+def load_corpus(directory: str):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            images.append(Image.open(os.path.join(directory, name)).convert("RGB"))
+    return images
+
+
+def encode(image: Image.Image, fmt: str = "JPEG", **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def variants(image: Image.Image):
+    """The ways the same photo tends to come back: re-saved, resized, screenshotted, re-lit."""
+    w, h = image.size
+    crop = max(2, int(min(w, h) * 0.03))
+    return {
+        "jpeg_q40": encode(image, quality=40),
+        "resized_50": encode(image.resize((w // 2, h // 2)), quality=85),
+        "screenshot": encode(image.crop((crop, crop, w - crop, h - crop)).resize((w, h)), "PNG"),
+        "brighter": encode(ImageEnhance.Brightness(image).enhance(1.15), quality=85),
+    }
+
+
+def precision_recall(corpus):
+    split = len(corpus) // 2
+    indexed, held_out = corpus[:split], corpus[split:]
+    originals = [encode(image, quality=90) for image in indexed]
+    queries = [(i, data) for i, image in enumerate(indexed) for data in variants(image).values()]
+    distractors = [encode(image, quality=90) for image in held_out]
+
+    print(f"indexed={len(originals)} positive_queries={len(queries)} negative_queries={len(distractors)}")
+    print(f"{'matcher':12} {'dist':>4} {'precision':>9} {'recall':>7} {'false_pos':>9}")
+    for name, fn in MATCHERS.items():
+        index_prints = [fn(data) for data in originals]
+        positive = [(i, fn(data)) for i, data in queries]
+        negative = [fn(data) for data in distractors]
+
+        def nearest(query, threshold):
+            """Index of the closest accepted entry within threshold, or None."""
+            value, layout = query
+            best, best_distance = None, threshold + 1
+            for i, (stored, stored_layout) in enumerate(index_prints):
+                distance = hamming(value, stored)
+                if distance < best_distance and (layout is None or colour_distance(layout, stored_layout) <= MAX_COLOUR_DISTANCE):
+                    best, best_distance = i, distance
+            return best
+
+        for threshold in THRESHOLDS:
+            tp = fp = 0
+            for i, query in positive:
+                match = nearest(query, threshold)
+                tp += match == i
+                fp += match is not None and match != i
+            fp += sum(1 for query in negative if nearest(query, threshold) is not None)
+            precision = tp / (tp + fp) if tp + fp else 1.0
+            print(f"{name:12} {threshold:>4} {precision:>9.3f} {tp / len(positive):>7.3f} {fp:>9}")
+
+
+def lookup_latency(sizes, max_distance: int, queries: int = 500, seed: int = 0):
+    rng = random.Random(seed)
+    print(f"\nlookup latency, max_distance={max_distance}")
+    print(f"{'entries':>8} {'multi_index_us':>14} {'linear_us':>10}")
+    for size in sizes:
+        values = [rng.getrandbits(64) for _ in range(size)]
+        table = MultiIndexHashTable(max_distance)
+        for key, value in enumerate(values):
+            table.add(value, key)
+        # half the probes are near-copies of stored hashes, half are unrelated
+        probes = []
+        for _ in range(queries):
+            value = rng.choice(values)
+            if rng.random() < 0.5:
+                for bit in rng.sample(range(64), rng.randint(0, max_distance)):
+                    value ^= 1 << bit
+            else:
+                value = rng.getrandbits(64)
+            probes.append(value)
+
+        start = time.perf_counter()
+        for value in probes:
+            table.search(value)
+        multi_index = (time.perf_counter() - start) / queries * 1e6
+
+        start = time.perf_counter()
+        for value in probes:
+            [key for key, stored in enumerate(values) if hamming(value, stored) <= max_distance]
+        linear = (time.perf_counter() - start) / queries * 1e6
+        print(f"{size:>8} {multi_index:>14.1f} {linear:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of garment photos (default: synthetic images)")
+    parser.add_argument("--synthetic", type=int, default=200, help="synthetic corpus size")
+    parser.add_argument("--max-distance", type=int, default=6)
+    parser.add_argument("--sizes", default="1000,10000,50000", help="index sizes for the latency run")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    start = time.perf_counter()
+    precision_recall(corpus)
+    print(f"(accuracy run took {time.perf_counter() - start:.1f}s)")
+    lookup_latency([int(s) for s in args.sizes.split(",")], args.max_distance)
+
+
+if __name__ == "__main__":
+    main()
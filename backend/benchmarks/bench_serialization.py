@@ -0,0 +1,183 @@
+"""
+Response serialization benchmark for the large payloads: CompareResponse
+(two analyses with embedded base64 images plus the hybrid recommendation)
+and TaraResponse.
+
+"before" replays the previous path: copying every GarmentAnalysis field
+into AnalysisResponse, then FastAPI's response_model handling (dump,
+re-validate, serialize to JSON-able data) and stdlib json via JSONResponse.
+"after" is NegotiatedResponse rendering the models directly, as JSON
+(pydantic-core/orjson) and MessagePack (ormsgpack).
+
+    cd backend
+    python benchmarks/bench_serialization.py --image-mb 2
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+from typing import Optional
+
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+
+from app.models import GarmentAnalysis  # noqa: E402
+from app.routes.chat import AnalysisResponse, CompareResponse  # noqa: E402
+from app.services.garment_analyzer import HybridRecommendation  # noqa: E402
+from app.services.tara_stylist import TaraRecommendationCategory, TaraRecommendationOption, TaraResponse  # noqa: E402
+from app.utils.serialization import MSGPACK_MEDIA_TYPE, NegotiatedResponse  # noqa: E402
+
+
+class OldAnalysisResponse(BaseModel):
+    category: str
+    type: str
+    style_aesthetic: list[str]
+    cultural_elements: list[str]
+    vibe_mood: list[str]
+    colors: list[str]
+    patterns: list[str]
+    preference_score: int
+    body_shape_tips: list[str]
+    styling_suggestions: list[str]
+    image_data: str
+    wardrobe_item_id: Optional[int] = None
+
+
+class OldCompareResponse(BaseModel):
+    analysis1: OldAnalysisResponse
+    analysis2: OldAnalysisResponse
+    hybrid: dict
+
+
+def sample_analysis(seed: int) -> GarmentAnalysis:
+    return GarmentAnalysis(
+        category="Tops",
+        type=f"Relaxed Linen Shirt {seed}",
+        style_aesthetic=[f"Aesthetic {i}: clean lines with a relaxed, breathable drape" for i in range(5)],
+        cultural_elements=["Mediterranean resort wear"],
+        vibe_mood=["Effortlessly Chic", "Coastal Calm", "Quiet Luxury", "Sunlit Ease"],
+        colors=["Sage Green", "Ivory", "Sand"],
+        patterns=["Solid"],
+        preference_score=82,
+        body_shape_tips=[f"Tip {i}: tuck loosely to define the waist without adding bulk" for i in range(5)],
+        styling_suggestions=[f"Idea {i}: pair with tailored trousers and leather sandals" for i in range(5)],
+    )
+
+
+def sample_hybrid() -> HybridRecommendation:
+    return HybridRecommendation(
+        combined_style="Soft tailoring meets relaxed resort",
+        best_features_garment1=["Breathable linen", "Relaxed collar"],
+        best_features_garment2=["Sharp shoulders", "Structured hem"],
+        hybrid_suggestions=[f"Suggestion {i}: layer the structure over the soft base" for i in range(5)],
+        recommended_search_terms=["linen blazer", "relaxed tailoring", "resort suit"],
+        style_score=88,
+    )
+
+
+def sample_tara() -> TaraResponse:
+    return TaraResponse(options=[
+        TaraRecommendationOption(
+            id=option,
+            summary_title=f"Direction {option}",
+            summary_description="A refined take on the current look with premium finishes. " * 3,
+            categories=[
+                TaraRecommendationCategory(
+                    category_name=name,
+                    keywords=["gold", "minimal", "layered", "statement"],
+                    description="Swap the chunky pieces for delicate layered chains.\nKeep metals consistent.",
+                )
+                for name in ("Jewellery", "Tops", "Lower", "Color Palette", "Shoes", "Accessories")
+            ],
+        )
+        for option in range(1, 5)
+    ])
+
+
+def compare_before(analysis1, analysis2, hybrid, image1, image2) -> bytes:
+    def copy(analysis, image):
+        return OldAnalysisResponse(
+            category=analysis.category, type=analysis.type, style_aesthetic=analysis.style_aesthetic,
+            cultural_elements=analysis.cultural_elements, vibe_mood=analysis.vibe_mood, colors=analysis.colors,
+            patterns=analysis.patterns, preference_score=analysis.preference_score,
+            body_shape_tips=analysis.body_shape_tips, styling_suggestions=analysis.styling_suggestions,
+            image_data=image,
+        )
+    response = OldCompareResponse(analysis1=copy(analysis1, image1), analysis2=copy(analysis2, image2), hybrid={
+        "combined_style": hybrid.combined_style,
+        "best_features_garment1": hybrid.best_features_garment1,
+        "best_features_garment2": hybrid.best_features_garment2,
+        "hybrid_suggestions": hybrid.hybrid_suggestions,
+        "recommended_search_terms": hybrid.recommended_search_terms,
+        "style_score": hybrid.style_score,
+    })
+    content = asyncio.run(serialize_response(field=OLD_COMPARE_FIELD, response_content=response))
+    return JSONResponse(content).body
+
+
+def compare_after(analysis1, analysis2, hybrid, image1, image2, media_type=None) -> bytes:
+    response = CompareResponse.model_construct(
+        analysis1=AnalysisResponse.from_analysis(analysis1, image1),
+        analysis2=AnalysisResponse.from_analysis(analysis2, image2),
+        hybrid=hybrid,
+    )
+    return NegotiatedResponse(response, media_type=media_type).body
+
+
+def tara_before(tara) -> bytes:
+    content = asyncio.run(serialize_response(field=TARA_FIELD, response_content=tara))
+    return JSONResponse(content).body
+
+
+def tara_after(tara, media_type=None) -> bytes:
+    return NegotiatedResponse(tara, media_type=media_type).body
+
+
+OLD_COMPARE_FIELD = create_model_field("Response_compare", OldCompareResponse)
+TARA_FIELD = create_model_field("Response_tara", TaraResponse)
+
+
+def timed(fn, repeat: int):
+    fn()  # warm-up
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-mb", type=float, default=2.0, help="size of each embedded image before base64")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    image1 = base64.b64encode(os.urandom(int(args.image_mb * 1024 * 1024))).decode()
+    image2 = base64.b64encode(os.urandom(int(args.image_mb * 1024 * 1024))).decode()
+    analysis1, analysis2, hybrid, tara = sample_analysis(1), sample_analysis(2), sample_hybrid(), sample_tara()
+
+    cases = [
+        ("compare", "before (json)", lambda: compare_before(analysis1, analysis2, hybrid, image1, image2)),
+        ("compare", "after (orjson)", lambda: compare_after(analysis1, analysis2, hybrid, image1, image2)),
+        ("compare", "after (msgpack)", lambda: compare_after(analysis1, analysis2, hybrid, image1, image2, MSGPACK_MEDIA_TYPE)),
+        ("tara", "before (json)", lambda: tara_before(tara)),
+        ("tara", "after (orjson)", lambda: tara_after(tara)),
+        ("tara", "after (msgpack)", lambda: tara_after(tara, MSGPACK_MEDIA_TYPE)),
+    ]
+    print(f"{'payload':8} {'path':16} {'ms':>9} {'bytes':>10}")
+    for payload, path, fn in cases:
+        ms, size = timed(fn, args.repeat)
+        print(f"{payload:8} {path:16} {ms:>9.3f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
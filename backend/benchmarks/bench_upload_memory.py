@@ -0,0 +1,90 @@
+"""
+Peak Python heap per request for the image upload paths, measured with
+tracemalloc: the old read() -> b64encode -> f-string data URL path against
+app/utils/uploads.py (chunked encode into a single ImagePayload).
+
+Each run covers what a handler does before the LLM call and after it:
+reading the spooled upload, building the multimodal message, and the
+response field echoing the image back.
+
+    cd backend
+    python benchmarks/bench_upload_memory.py --sizes 1,5,10
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from langchain_core.messages import HumanMessage
+from starlette.datastructures import Headers, UploadFile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils.uploads import read_image  # noqa: E402
+
+PROMPT = "Analyze this garment image in detail."
+
+
+def make_upload(data: bytes) -> UploadFile:
+    # what Starlette's multipart parser hands the endpoint: a spooled file that rolled to disk past 1MB
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(data)
+    spooled.seek(0)
+    return UploadFile(spooled, size=len(data), filename="photo.jpg", headers=Headers({"content-type": "image/jpeg"}))
+
+
+async def before(files):
+    kept = []
+    for file in files:
+        contents = await file.read()
+        image_data = base64.b64encode(contents).decode("utf-8")
+        message = HumanMessage(content=[
+            {"type": "text", "text": PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}},
+        ])
+        kept.append((contents, image_data, message))
+    # the response echoes each image back
+    return [{"image_data": image_data} for _, image_data, _ in kept]
+
+
+async def after(files):
+    kept = []
+    for file in files:
+        image = await read_image(file)
+        message = HumanMessage(content=[{"type": "text", "text": PROMPT}, image.message_part()])
+        kept.append((image, message))
+    return [{"image_data": image.b64} for image, _ in kept]
+
+
+def measure(path, data: bytes, images: int) -> float:
+    files = [make_upload(data) for _ in range(images)]
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    response = asyncio.run(path(files))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del response
+    for file in files:
+        file.file.close()
+    return peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,5,10", help="upload sizes in MB")
+    args = parser.parse_args()
+
+    print(f"{'endpoint':16} {'upload_mb':>9} {'before_mb':>10} {'after_mb':>9} {'saved':>6}")
+    for size in (float(s) for s in args.sizes.split(",")):
+        data = os.urandom(int(size * 1024 * 1024))
+        for endpoint, images in (("analyze-garment", 1), ("compare-garments", 2)):
+            old = measure(before, data, images)
+            new = measure(after, data, images)
+            print(f"{endpoint:16} {size:>9.1f} {old:>10.1f} {new:>9.1f} {1 - new / old:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+Load generator for a locally running API, with latency/error SLO reports.
+
+    cd backend
+    uvicorn app.main:app --port 8000                       # in another shell
+    python benchmarks/loadgen.py --routes chat --closed 1,2,4,8,16 --duration 30
+    python benchmarks/loadgen.py --routes chat=4,analyze-garment=1 --open 0.5,1,2 --duration 60
+    python benchmarks/loadgen.py --list-routes
+
+Closed loop (--closed N,...): N virtual users, each sending its next request
+when the previous one returns (plus --think-ms). This answers "how many
+concurrent users does one worker sustain": the report names the highest
+level whose SLOs all held.
+
+Open loop (--open R,...): requests arrive at R per second (Poisson) whether or
+not earlier ones finished, the way real traffic does. Latency is measured from
+each request's scheduled start, so a stalled server isn't hidden by the
+generator slowing down with it (coordinated omission).
+
+Payloads are realistic: synthetic garment JPEGs (--image-px, pre-encoded so
+generation doesn't load the client) sent as multipart uploads or base64 JSON
+as each route expects. These routes call Groq and Pixazo for real, so a run
+costs what its requests cost.
+
+Each level reports throughput, p50/p95/p99 latency and error rates per route
+against SLOs (defaults in DEFAULT_SLOS, override with --slo chat.p95_ms=2000
+or --slo-file), plus event-loop lag: the generator's own (if it is high, the
+client was the bottleneck) and the server's, read from
+fashion_event_loop_lag_* on /metrics. Exits 1 if no level met its SLOs.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+@dataclass
+class Payloads:
+    images: List[bytes]
+    rng: random.Random
+
+    def image(self) -> bytes:
+        return self.rng.choice(self.images)
+
+    def image_b64(self) -> str:
+        return "data:image/jpeg;base64," + base64.b64encode(self.image()).decode("ascii")
+
+
+CHAT_MESSAGES = [
+    "What should I wear to a summer wedding?",
+    "I love navy and olive, what jacket goes with grey chinos?",
+    "Help me build a capsule wardrobe for work",
+    "My name is Sam and I'm on a tight budget, any ideas for date night?",
+    "How do I style white sneakers with a dress?",
+    "What colours suit a warm skin tone?",
+    "Is a linen blazer too casual for an office?",
+    "Suggest three outfits for a rainy autumn weekend",
+]
+TRY_ON_PROMPTS = [
+    "Put this garment on the person, keep the pose and background",
+    "Replace the top with this garment, natural fit",
+]
+TARA_PROMPTS = [
+    "Make this look more minimalist",
+    "Give me a streetwear version of this outfit",
+    "How would this work for a formal dinner?",
+]
+
+
+def _chat(p: Payloads, session: str) -> Dict[str, Any]:
+    data = {"session_id": session, "message": p.rng.choice(CHAT_MESSAGES)}
+    if p.rng.random() < 0.2:
+        return {"data": data, "files": {"image": ("photo.jpg", p.image(), "image/jpeg")}}
+    return {"data": data}
+
+
+# route name -> (method, path, request builder)
+ROUTES: Dict[str, Tuple[str, str, Callable[[Payloads, str], Dict[str, Any]]]] = {
+    "health": ("GET", "/api/health", lambda p, s: {}),
+    "chat": ("POST", "/api/chat", _chat),
+    "analyze-garment": ("POST", "/api/analyze-garment", lambda p, s: {
+        "data": {"session_id": s},
+        "files": {"image": ("garment.jpg", p.image(), "image/jpeg")},
+    }),
+    "compare-garments": ("POST", "/api/compare-garments", lambda p, s: {
+        "data": {"session_id": s},
+        "files": [("image1", ("a.jpg", p.image(), "image/jpeg")), ("image2", ("b.jpg", p.image(), "image/jpeg"))],
+    }),
+    "try-on-edit": ("POST", "/api/try-on/edit", lambda p, s: {
+        "data": {"prompt": p.rng.choice(TRY_ON_PROMPTS)},
+        "files": [("human_image", ("person.jpg", p.image(), "image/jpeg")), ("garment_image", ("garment.jpg", p.image(), "image/jpeg"))],
+    }),
+    "try-on-suggestions": ("POST", "/api/try-on/suggestions", lambda p, s: {
+        "files": {"file": ("garment.jpg", p.image(), "image/jpeg")},
+    }),
+    "tara-analyze": ("POST", "/api/tara/analyze", lambda p, s: {
+        "json": {"image": p.image_b64(), "prompt": p.rng.choice(TARA_PROMPTS)},
+    }),
+    "tara-visualize": ("POST", "/api/tara/visualize", lambda p, s: {
+        "json": {
+            "original_image": p.image_b64(),
+            "category": p.rng.choice(["Minimalist", "Streetwear", "Formal", "Bohemian"]),
+            "keywords": ["linen", "neutral", "relaxed"],
+            "description": "A relaxed take on the outfit with neutral tones",
+        },
+    }),
+}
+
+# p95/p99 latency in milliseconds and the tolerated share of failed requests
+DEFAULT_SLOS: Dict[str, Dict[str, float]] = {
+    "health": {"p95_ms": 50, "p99_ms": 200, "error_rate": 0.001},
+    "chat": {"p95_ms": 4000, "p99_ms": 8000, "error_rate": 0.01},
+    "analyze-garment": {"p95_ms": 6000, "p99_ms": 10000, "error_rate": 0.01},
+    "compare-garments": {"p95_ms": 12000, "p99_ms": 20000, "error_rate": 0.01},
+    "try-on-edit": {"p95_ms": 45000, "p99_ms": 60000, "error_rate": 0.02},
+    "try-on-suggestions": {"p95_ms": 6000, "p99_ms": 10000, "error_rate": 0.01},
+    "tara-analyze": {"p95_ms": 10000, "p99_ms": 20000, "error_rate": 0.01},
+    "tara-visualize": {"p95_ms": 8000, "p99_ms": 15000, "error_rate": 0.01},
+}
+
+
+def synthetic_garment(px: int, seed: int) -> bytes:
+    """A JPEG that looks enough like a product photo: light background, a coloured, sometimes striped garment shape."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", (px, px), tuple(rng.randint(215, 250) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    color = tuple(rng.randint(20, 230) for _ in range(3))
+    m = px // 6
+    body = [(2 * m, m), (4 * m, m), (5 * m, 2 * m), (4 * m, 5 * m), (2 * m, 5 * m), (m, 2 * m)]
+    draw.polygon(body, fill=color)
+    if rng.random() < 0.4:
+        stripe = tuple(255 - c for c in color)
+        for y in range(m, 5 * m, max(4, px // 40)):
+            draw.line([(m, y), (5 * m, y)], fill=stripe, width=max(1, px // 160))
+    # sensor noise keeps JPEG sizes realistic
+    pixels = np.asarray(image, dtype=np.int16) + np.random.default_rng(seed).integers(-6, 7, (px, px, 3))
+    out = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(out, "JPEG", quality=88)
+    return out.getvalue()
+
+
+@dataclass
+class RouteStats:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    exceptions: Counter = field(default_factory=Counter)
+
+    @property
+    def count(self) -> int:
+        return sum(self.statuses.values()) + sum(self.exceptions.values())
+
+    @property
+    def errors(self) -> int:
+        return sum(n for status, n in self.statuses.items() if status >= 400) + sum(self.exceptions.values())
+
+
+class LagProbe:
+    """Event-loop lag of this process: a timer that should fire every `interval`."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def _server_lag(client: httpx.AsyncClient) -> Optional[Dict[str, float]]:
+    """The server's loop-lag histogram sum/count and last-window max from /metrics; None if unavailable."""
+    try:
+        response = await client.get("/metrics", timeout=5)
+    except httpx.HTTPError:
+        return None
+    values = {}
+    for line in response.text.splitlines():
+        for name in ("fashion_event_loop_lag_seconds_sum", "fashion_event_loop_lag_seconds_count", "fashion_event_loop_lag_max_seconds"):
+            if line.startswith(name + " "):
+                values[name] = float(line.split()[-1])
+    return values or None
+
+
+class LoadRun:
+    def __init__(self, client: httpx.AsyncClient, payloads: Payloads, weights: Dict[str, float], timeout: float, warmup: float):
+        self.client = client
+        self.payloads = payloads
+        self.routes = list(weights)
+        self.weights = [weights[r] for r in self.routes]
+        self.timeout = timeout
+        self.warmup = warmup
+        self.stats: Dict[str, RouteStats] = {route: RouteStats() for route in self.routes}
+        self.measure_from = 0.0
+        self.dropped = 0
+
+    async def request(self, session: str, scheduled: Optional[float] = None) -> None:
+        route = self.payloads.rng.choices(self.routes, self.weights)[0]
+        method, path, build = ROUTES[route]
+        start = scheduled if scheduled is not None else time.perf_counter()
+        status, error = None, None
+        try:
+            response = await self.client.request(
+                method, path, timeout=self.timeout,
+                headers={"X-Request-ID": f"load-{session}-{random.getrandbits(32):08x}"},
+                **build(self.payloads, session),
+            )
+            status = response.status_code
+        except httpx.TimeoutException:
+            error = "timeout"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if start < self.measure_from:
+            return
+        stats = self.stats[route]
+        stats.latencies.append(time.perf_counter() - start)
+        if error is not None:
+            stats.exceptions[error] += 1
+        else:
+            stats.statuses[status] += 1
+
+    async def closed(self, users: int, duration: float, think: float) -> float:
+        begin = time.perf_counter()
+        self.measure_from = begin + self.warmup
+        end = self.measure_from + duration
+
+        async def user(n: int):
+            while time.perf_counter() < end:
+                await self.request(f"user{n}")
+                if think:
+                    await asyncio.sleep(self.payloads.rng.expovariate(1.0 / think))
+
+        await asyncio.gather(*(user(n) for n in range(users)))
+        return time.perf_counter() - self.measure_from
+
+    async def open(self, rate: float, duration: float, sessions: int, max_in_flight: int) -> float:
+        begin = time.perf_counter()
+        self.measure_from = begin + self.warmup
+        end = self.measure_from + duration
+        tasks = set()
+        next_at = begin
+        while next_at < end:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(tasks) >= max_in_flight:
+                # the client's own limit, not the server's: counted, not sent
+                if next_at >= self.measure_from:
+                    self.dropped += 1
+            else:
+                task = asyncio.create_task(self.request(f"s{self.payloads.rng.randrange(sessions)}", scheduled=next_at))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            next_at += self.payloads.rng.expovariate(rate)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return time.perf_counter() - self.measure_from
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1)}
+
+
+def route_report(stats: RouteStats, elapsed: float, slo: Dict[str, float]) -> Dict[str, Any]:
+    count = stats.count
+    report = {
+        "requests": count,
+        "throughput_rps": round(count / elapsed, 3) if elapsed > 0 else None,
+        **_percentiles(stats.latencies),
+        "error_rate": round(stats.errors / count, 4) if count else None,
+        "shed_503": stats.statuses.get(503, 0),
+        "statuses": {str(k): v for k, v in sorted(stats.statuses.items())},
+        "exceptions": dict(stats.exceptions),
+    }
+    violations = []
+    for key, limit in slo.items():
+        value = report.get(key)
+        if value is None or value > limit:
+            violations.append(f"{key} {value} > {limit}")
+    report["slo"] = slo
+    report["slo_violations"] = violations
+    return report
+
+
+def _lag_report(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p99 = np.percentile(np.asarray(samples) * 1000, [50, 99])
+    return {"p50_ms": round(float(p50), 2), "p99_ms": round(float(p99), 2), "max_ms": round(max(samples) * 1000, 2)}
+
+
+def print_level(label: str, level: Dict[str, Any]) -> None:
+    print(f"\n== {label} ({level['elapsed_seconds']:.1f}s) ==")
+    print(f"{'route':<20}{'reqs':>7}{'rps':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'err%':>7}{'503':>6}  SLO")
+    for route, r in level["routes"].items():
+        err = f"{r['error_rate'] * 100:.1f}" if r["error_rate"] is not None else "-"
+        verdict = "ok" if not r["slo_violations"] else "FAIL: " + "; ".join(r["slo_violations"])
+        cells = [r["p50_ms"], r["p95_ms"], r["p99_ms"]]
+        print(f"{route:<20}{r['requests']:>7}{r['throughput_rps'] or 0:>8.2f}"
+              + "".join(f"{c if c is not None else '-':>9}" for c in cells)
+              + f"{err:>7}{r['shed_503']:>6}  {verdict}")
+    client, server = level["client_loop_lag"], level["server_loop_lag"]
+    print(f"client loop lag p50/p99/max: {client['p50_ms']}/{client['p99_ms']}/{client['max_ms']} ms"
+          + (f"  (client dropped {level['client_dropped']} arrivals at --max-in-flight)" if level.get("client_dropped") else ""))
+    if server:
+        print(f"server loop lag avg {server['avg_ms']} ms, worst window max {server['max_ms']} ms")
+    else:
+        print("server loop lag: unavailable (no fashion_event_loop_lag_* on /metrics)")
+
+
+async def run_level(args, client: httpx.AsyncClient, payloads: Payloads, weights: Dict[str, float], slos, mode: str, value: float) -> Dict[str, Any]:
+    run = LoadRun(client, payloads, weights, args.timeout, args.warmup)
+    probe = LagProbe()
+    probe.start()
+    server_before = await _server_lag(client)
+    server_max = []
+
+    async def poll_server():
+        while True:
+            await asyncio.sleep(1.0)
+            lag = await _server_lag(client)
+            if lag and "fashion_event_loop_lag_max_seconds" in lag:
+                server_max.append(lag["fashion_event_loop_lag_max_seconds"])
+
+    poller = asyncio.create_task(poll_server())
+    try:
+        if mode == "closed":
+            elapsed = await run.closed(int(value), args.duration, args.think_ms / 1000.0)
+        else:
+            elapsed = await run.open(value, args.duration, args.sessions, args.max_in_flight)
+    finally:
+        poller.cancel()
+        await probe.stop()
+    server_after = await _server_lag(client)
+
+    server = None
+    if server_after and "fashion_event_loop_lag_seconds_count" in server_after:
+        # the histogram isn't rendered before its first sample
+        before = server_before or {}
+        count = server_after["fashion_event_loop_lag_seconds_count"] - before.get("fashion_event_loop_lag_seconds_count", 0.0)
+        total = server_after["fashion_event_loop_lag_seconds_sum"] - before.get("fashion_event_loop_lag_seconds_sum", 0.0)
+        server = {
+            "avg_ms": round(total / count * 1000, 2) if count else None,
+            "max_ms": round(max(server_max) * 1000, 2) if server_max else None,
+        }
+    routes = {route: route_report(stats, elapsed, slos.get(route, {})) for route, stats in run.stats.items()}
+    return {
+        "mode": mode,
+        "level": value,
+        "elapsed_seconds": elapsed,
+        "routes": routes,
+        "client_dropped": run.dropped,
+        "client_loop_lag": _lag_report(probe.samples),
+        "server_loop_lag": server,
+        "slo_met": all(not r["slo_violations"] for r in routes.values()),
+    }
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ROUTES:
+            raise SystemExit(f"unknown route {name!r}; see --list-routes")
+        weights[name] = float(weight) if weight else 1.0
+    return weights
+
+
+def parse_slos(args) -> Dict[str, Dict[str, float]]:
+    slos = {route: dict(slo) for route, slo in DEFAULT_SLOS.items()}
+    if args.slo_file:
+        with open(args.slo_file) as f:
+            for route, slo in json.load(f).items():
+                slos.setdefault(route, {}).update(slo)
+    for item in args.slo:
+        key, _, value = item.partition("=")
+        route, _, metric = key.rpartition(".")
+        slos.setdefault(route, {})[metric] = float(value)
+    return slos
+
+
+async def main_async(args) -> int:
+    weights = parse_weights(args.routes)
+    slos = parse_slos(args)
+    rng = random.Random(args.seed)
+    payloads = Payloads([synthetic_garment(args.image_px, args.seed + i) for i in range(16)], rng)
+    mode, levels = ("closed", args.closed) if args.closed else ("open", args.open or "1")
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+
+    results = []
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits) as client:
+        for value in (float(v) for v in levels.split(",")):
+            label = f"{int(value)} users" if mode == "closed" else f"{value:g} req/s"
+            level = await run_level(args, client, payloads, weights, slos, mode, value)
+            print_level(label, level)
+            results.append(level)
+
+    passing = [r["level"] for r in results if r["slo_met"]]
+    unit = "concurrent users" if mode == "closed" else "req/s"
+    if passing:
+        print(f"\nHighest level meeting all SLOs: {max(passing):g} {unit}")
+    else:
+        print("\nNo level met all SLOs")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"base_url": args.base_url, "routes": weights, "levels": results}, f, indent=2)
+    return 0 if passing else 1
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--routes", default="chat", help="route[=weight],... mixed in proportion to their weights")
+    parser.add_argument("--closed", help="closed loop: concurrent users per level, e.g. 1,2,4,8")
+    parser.add_argument("--open", help="open loop: arrival rates (req/s) per level, e.g. 0.5,1,2")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds at the start of each level")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="closed loop: mean pause between a user's requests")
+    parser.add_argument("--sessions", type=int, default=50, help="open loop: distinct session ids")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="client-side cap on outstanding requests")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--image-px", type=int, default=768, help="side of the synthetic garment photos")
+    parser.add_argument("--slo", action="append", default=[], help="override an SLO, e.g. chat.p95_ms=2000 (repeatable)")
+    parser.add_argument("--slo-file", help='JSON {"route": {"p95_ms": ..., "p99_ms": ..., "error_rate": ...}}')
+    parser.add_argument("--json", help="also write the full report here")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--list-routes", action="store_true")
+    args = parser.parse_args()
+
+    if args.list_routes:
+        for name, (method, path, _) in ROUTES.items():
+            print(f"{name:<20}{method:<6}{path:<28}SLO {DEFAULT_SLOS.get(name, {})}")
+        return 0
+    if args.closed and args.open:
+        parser.error("choose --closed or --open")
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
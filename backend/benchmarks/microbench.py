@@ -0,0 +1,340 @@
+"""
+Offline microbenchmarks for the CPU-side work of each request, with stored
+baselines and a regression gate.
+
+    cd backend
+    python benchmarks/microbench.py                    # compare against baselines.json
+    python benchmarks/microbench.py --update-baselines # record new baselines
+    python benchmarks/microbench.py -k prompt          # only cases whose name contains "prompt"
+
+Each case is timed as the best of several repeats of an auto-sized loop.
+Baselines are scaled by a fixed calibration workload timed on every run, so
+a uniformly slower or busier machine doesn't read as a regression. A case
+still slower than its scaled baseline by more than --threshold (default 25%)
+after being re-measured fails the run (exit status 1). Baselines remain
+machine-specific: record them on the machine that runs the gate.
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from starlette.datastructures import Headers, UploadFile  # noqa: E402
+from starlette.formparsers import MultiPartParser  # noqa: E402
+
+from app.models import GarmentAnalysis  # noqa: E402
+from app.services.fashion_agent import build_chat_prompt, merge_profile  # noqa: E402
+from app.services.tara_stylist import TaraResponse  # noqa: E402
+from app.services.virtual_try_on import parse_suggestions  # noqa: E402
+from app.utils.serialization import dumps, packb  # noqa: E402
+from app.utils.uploads import ImagePayload, read_image  # noqa: E402
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+BOUNDARY = "----fashionbench"
+
+CASES: List[Tuple[str, Callable[[], Callable[[], object]]]] = []
+
+
+def case(name: str):
+    """Register a setup function returning the zero-argument callable to time."""
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+def _image_bytes(mb: float) -> bytes:
+    return os.urandom(int(mb * 1024 * 1024))
+
+
+def _multipart_body(image: bytes) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"session_id\"\r\n\r\nbench\r\n"
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"photo.jpg\"\r\n"
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _analysis_dict() -> dict:
+    return {
+        "category": "Tops",
+        "type": "Relaxed Linen Shirt",
+        "style_aesthetic": [f"Aesthetic {i}: clean lines with a relaxed, breathable drape" for i in range(5)],
+        "cultural_elements": ["Mediterranean resort wear"],
+        "vibe_mood": ["Effortlessly Chic", "Coastal Calm", "Quiet Luxury", "Sunlit Ease"],
+        "colors": ["Sage Green", "Ivory", "Sand"],
+        "patterns": ["Solid"],
+        "preference_score": 82,
+        "body_shape_tips": [f"Tip {i}: tuck loosely to define the waist without adding bulk" for i in range(5)],
+        "styling_suggestions": [f"Idea {i}: pair with tailored trousers and leather sandals" for i in range(5)],
+    }
+
+
+def _tara_dict() -> dict:
+    return {"options": [
+        {
+            "id": option,
+            "summary_title": f"Direction {option}",
+            "summary_description": "A refined take on the current look with premium finishes. " * 3,
+            "categories": [
+                {
+                    "category_name": name,
+                    "keywords": ["gold", "minimal", "layered", "statement"],
+                    "description": "Swap the chunky pieces for delicate layered chains.\nKeep metals consistent.",
+                }
+                for name in ("Jewellery", "Tops", "Lower", "Color Palette", "Shoes", "Accessories")
+            ],
+        }
+        for option in range(1, 5)
+    ]}
+
+
+def _register_upload_cases(mb: float):
+    @case(f"multipart_parse_{mb:g}mb")
+    def multipart_parse():
+        body = _multipart_body(_image_bytes(mb))
+        headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+        loop = asyncio.new_event_loop()
+
+        async def stream():
+            # uvicorn delivers the body in 64KB chunks
+            for start in range(0, len(body), 65536):
+                yield body[start:start + 65536]
+
+        async def parse():
+            form = await MultiPartParser(headers, stream()).parse()
+            await form.close()
+
+        return lambda: loop.run_until_complete(parse())
+
+    @case(f"upload_encode_{mb:g}mb")
+    def upload_encode():
+        data = _image_bytes(mb)
+        spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spooled.write(data)
+        upload = UploadFile(spooled, size=len(data), filename="photo.jpg", headers=Headers({"content-type": "image/jpeg"}))
+        loop = asyncio.new_event_loop()
+
+        def run():
+            spooled.seek(0)
+            return loop.run_until_complete(read_image(upload))
+
+        return run
+
+    @case(f"data_url_message_{mb:g}mb")
+    def data_url_message():
+        image_base64 = base64.b64encode(_image_bytes(mb)).decode()
+        return lambda: HumanMessage(content=[
+            {"type": "text", "text": "Analyze this garment image in detail."},
+            ImagePayload.from_base64(image_base64).message_part(),
+        ])
+
+
+for _mb in (1, 5):
+    _register_upload_cases(_mb)
+
+
+@case("garment_analysis_validate")
+def garment_analysis_validate():
+    data = _analysis_dict()
+    return lambda: GarmentAnalysis.model_validate(data)
+
+
+@case("garment_analysis_serialize_json")
+def garment_analysis_serialize_json():
+    analysis = GarmentAnalysis.model_validate(_analysis_dict())
+    return lambda: dumps(analysis)
+
+
+@case("tara_response_validate")
+def tara_response_validate():
+    data = _tara_dict()
+    return lambda: TaraResponse.model_validate(data)
+
+
+@case("tara_response_serialize_json")
+def tara_response_serialize_json():
+    response = TaraResponse.model_validate(_tara_dict())
+    return lambda: dumps(response)
+
+
+@case("tara_response_serialize_msgpack")
+def tara_response_serialize_msgpack():
+    response = TaraResponse.model_validate(_tara_dict())
+    return lambda: packb(response)
+
+
+@case("profile_merge")
+def profile_merge():
+    profile = {
+        "name": "Sam",
+        "budget_tier": "mid",
+        "style_keywords": [f"style {i}" for i in range(30)],
+        "clothing_types_liked": [f"type {i}" for i in range(30)],
+        "colors": [f"color {i}" for i in range(30)],
+    }
+    updates = {
+        "name": None,
+        "budget_tier": "premium",
+        "style_keywords": ["style 3", "minimalist", "quiet luxury"],
+        "clothing_types_liked": ["linen shirts", "type 7"],
+        "colors": ["sage green", "color 1", "ivory"],
+    }
+    return lambda: merge_profile(profile, updates)
+
+
+def _history(turns: int):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"Turn {i}: what should I wear with wide-leg trousers to a summer wedding?"))
+        messages.append(AIMessage(content="Try a fitted linen top in a soft pastel, block heels and gold accessories. " * 4))
+    return messages
+
+
+@case("chat_prompt_200_messages")
+def chat_prompt_long_history():
+    messages = _history(100)
+    profile = {"name": "Sam", "budget_tier": "mid", "style_keywords": ["minimalist", "classic"], "colors": ["navy", "ivory"]}
+    return lambda: build_chat_prompt(messages, profile)
+
+
+@case("chat_prompt_200_messages_economy")
+def chat_prompt_long_history_economy():
+    messages = _history(100)
+    profile = {"name": "Sam", "budget_tier": "mid", "style_keywords": ["minimalist", "classic"], "colors": ["navy", "ivory"]}
+    return lambda: build_chat_prompt(messages, profile, economy_mode=True)
+
+
+@case("parse_suggestions")
+def parse_suggestions_case():
+    text = (
+        "1. \"A flowy emerald silk midi dress with a cowl neckline\"\n\n"
+        "- A cropped black leather moto jacket with silver hardware\n"
+        "* A crisp white cotton poplin shirt with an oversized collar\n"
+        "A relaxed camel wool coat with a tie belt\n"
+        "A fifth suggestion that should be dropped\n"
+    )
+    return lambda: parse_suggestions(text)
+
+
+def time_case(fn: Callable[[], object], repeat: int = 7, min_seconds: float = 0.3) -> float:
+    """Best per-call time in microseconds, with the garbage collector paused as timeit does."""
+    fn()  # warm-up
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _best_time(fn, repeat, min_seconds)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def _best_time(fn: Callable[[], object], repeat: int, min_seconds: float) -> float:
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds / repeat or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_seconds / repeat / elapsed) + 1))
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best * 1e6
+
+
+def _calibration_workload():
+    # a fixed mix of the interpreter work and memory copying the cases spend their time on
+    data = {f"key {i}": [i, str(i), i * 0.5] for i in range(200)}
+    text = " ".join(f"{k}={v[1]}" for k, v in data.items())
+    blob = bytes(64 * 1024)
+    return len(text.split()) + len(blob + blob)
+
+
+def calibrate(repeat: int) -> float:
+    return time_case(_calibration_workload, repeat=repeat)
+
+
+def load_baselines() -> Dict:
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", default="", help="only run cases whose name contains this")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--update-baselines", action="store_true")
+    args = parser.parse_args()
+
+    baselines = load_baselines()
+    recorded = baselines.get("cases", {})
+    calibration = calibrate(args.repeat)
+    # >1 when this run's machine is slower than the one that recorded the baselines
+    scale = calibration / baselines["calibration_us"] if baselines.get("calibration_us") else 1.0
+    results: Dict[str, float] = {}
+    regressions = []
+
+    print(f"calibration {calibration:.2f}us (baseline scale x{scale:.2f})\n")
+    print(f"{'case':36} {'us/op':>12} {'baseline':>12} {'change':>8}")
+    for name, setup in CASES:
+        if args.pattern not in name:
+            continue
+        fn = setup()
+        micros = time_case(fn, repeat=args.repeat)
+        baseline = recorded.get(name)
+        if not baseline or args.update_baselines:
+            results[name] = round(micros, 3)
+            print(f"{name:36} {micros:>12.2f} {baseline or 0:>12.2f} {'new' if not baseline else 'updated':>8}")
+            continue
+        expected = baseline * scale
+        for _ in range(2):
+            if micros / expected - 1 <= args.threshold:
+                break
+            # re-measure before calling it a regression; noisy neighbours cause one-off spikes
+            micros = min(micros, time_case(fn, repeat=args.repeat))
+        change = micros / expected - 1
+        flag = "  REGRESSION" if change > args.threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:36} {micros:>12.2f} {expected:>12.2f} {change:>+8.0%}{flag}")
+
+    if args.update_baselines:
+        recorded.update(results)
+        baselines = {
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.machine()},
+            "calibration_us": round(calibration, 3),
+            "cases": dict(sorted(recorded.items())),
+        }
+        with open(BASELINES_PATH, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"\nBaselines written to {BASELINES_PATH}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4 @@
+import os
+
+# services build their Groq clients at import; tests never call the API
+os.environ.setdefault("GROQ_API_KEY", "test")
@@ -0,0 +1,208 @@
+import asyncio
+import math
+
+import pytest
+
+from app.utils.admission import AdmissionControlMiddleware, AdmissionGate, Overloaded, gates_from_env
+
+
+def make_gate(concurrency=1, queue=2, max_wait=30.0):
+    gate = AdmissionGate("test", concurrency=concurrency, queue=queue, max_wait=max_wait)
+    # target 0.5s, interval 2s
+    gate.service_seconds = 1.0
+    return gate
+
+
+async def settle():
+    # a woken waiter resumes through shield and wait_for, a few loop iterations later
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+# acquire / release
+
+def test_acquire_admits_immediately_while_slots_are_free():
+    gate = make_gate(concurrency=2)
+
+    async def run():
+        await gate.acquire()
+        await gate.acquire()
+
+    asyncio.run(run())
+    assert gate.in_flight == 2
+    assert not gate._waiters
+
+
+def test_acquire_rejects_when_the_queue_is_full():
+    gate = make_gate(concurrency=1, queue=1)
+
+    async def run():
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as excinfo:
+            await gate.acquire()
+        waiter.cancel()
+        return excinfo.value
+
+    error = asyncio.run(run())
+    assert error.reason == "queue_full"
+    assert error.retry_after >= 1
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    gate = make_gate(max_wait=0.01)
+
+    async def run():
+        await gate.acquire()
+        with pytest.raises(Overloaded) as excinfo:
+            await gate.acquire()
+        return excinfo.value
+
+    assert asyncio.run(run()).reason == "timeout"
+    assert not gate._waiters
+    assert gate.in_flight == 1
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    gate = make_gate(queue=4)
+    order = []
+
+    async def wait(name):
+        await gate.acquire()
+        order.append(name)
+
+    async def run():
+        await gate.acquire()
+        tasks = [asyncio.create_task(wait(name)) for name in ("a", "b")]
+        await asyncio.sleep(0)
+        gate.release(0.1)
+        await settle()
+        assert order == ["a"]
+        gate.release(0.1)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["a", "b"]
+    assert gate.in_flight == 1
+
+
+def test_cancelled_waiter_leaves_the_queue_without_taking_a_slot():
+    gate = make_gate(queue=4)
+
+    async def run():
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert len(gate._waiters) == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert not gate._waiters
+        gate.release(0.1)
+
+    asyncio.run(run())
+    assert gate.in_flight == 0
+
+
+def test_waiter_cancelled_after_admission_gives_the_slot_back():
+    gate = make_gate(queue=4)
+
+    async def run():
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        # the waiter is cancelled in the same instant it is handed the slot
+        waiter.cancel()
+        gate.release(0.1)
+        assert gate.in_flight == 1
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(run())
+    assert gate.in_flight == 0
+
+
+def test_dispatch_sheds_waiters_codel_drops():
+    gate = make_gate(queue=4)
+    gate._should_drop = lambda sojourn, now: True
+
+    async def run():
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        gate.release(0.1)
+        with pytest.raises(Overloaded) as excinfo:
+            await waiter
+        return excinfo.value
+
+    assert asyncio.run(run()).reason == "codel"
+    assert gate.in_flight == 0
+
+
+# CoDel drop schedule
+
+def test_should_drop_never_drops_below_target():
+    gate = make_gate()
+    assert not gate._should_drop(0.4, now=100.0)
+    assert gate._first_above is None
+
+
+def test_should_drop_waits_a_full_interval_above_target():
+    gate = make_gate()
+    assert not gate._should_drop(0.6, now=100.0)
+    assert gate._first_above == 102.0
+    assert not gate._should_drop(0.6, now=101.9)
+    assert gate._should_drop(0.6, now=102.0)
+    assert gate._dropping
+
+
+def test_should_drop_speeds_up_with_the_square_root_of_the_drop_count():
+    gate = make_gate()
+    gate._should_drop(0.6, now=100.0)
+    assert gate._should_drop(0.6, now=102.0)
+    assert gate._drop_next == pytest.approx(104.0)
+
+    assert not gate._should_drop(0.6, now=103.9)
+    assert gate._should_drop(0.6, now=104.0)
+    assert gate._drop_count == 2
+    assert gate._drop_next == pytest.approx(104.0 + 2.0 / math.sqrt(2))
+
+    assert gate._should_drop(0.6, now=gate._drop_next)
+    assert gate._drop_count == 3
+
+
+def test_should_drop_resets_once_the_wait_is_back_below_target():
+    gate = make_gate()
+    gate._should_drop(0.6, now=100.0)
+    gate._should_drop(0.6, now=102.0)
+    assert not gate._should_drop(0.1, now=102.5)
+    assert not gate._dropping
+    assert gate._first_above is None
+
+
+def test_should_drop_resumes_near_the_previous_rate_after_a_short_break():
+    gate = make_gate()
+    gate._should_drop(0.6, now=100.0)
+    for now in (102.0, 104.0, 105.5, 106.7, 107.8):
+        gate._should_drop(0.6, now=now)
+    assert gate._drop_count == 5
+    gate._should_drop(0.1, now=108.0)
+
+    gate._should_drop(0.6, now=109.0)
+    assert gate._should_drop(0.6, now=111.0)
+    assert gate._drop_count == 3
+
+
+# routing
+
+def test_batch_and_outfits_have_their_own_gate(monkeypatch):
+    monkeypatch.delenv("ADMISSION_GATES", raising=False)
+    monkeypatch.delenv("ADMISSION_CONTROL_ENABLED", raising=False)
+    gates, routes = gates_from_env()
+    middleware = AdmissionControlMiddleware(None, gates, routes)
+    assert middleware._gate("POST", "/api/analyze-garments/batch").name == "bulk"
+    assert middleware._gate("GET", "/api/wardrobe/u1/outfits").name == "bulk"
+    assert middleware._gate("POST", "/api/analyze-garment").name == "garment_analysis"
+    assert middleware._gate("GET", "/api/wardrobe/u1/items/outfits") is None
+    assert middleware._gate("GET", "/api/wardrobe/u1") is None
@@ -0,0 +1,155 @@
+import asyncio
+
+import pytest
+
+from app.main import create_app
+from app.utils.cancellation import CLIENT_CLOSED_REQUEST, REQUESTS_CANCELLED, DisconnectCancellationMiddleware
+
+
+class Client:
+    """Drives one ASGI request: sends the body, then holds the connection open until `disconnect()`."""
+
+    def __init__(self):
+        self.sent = []
+        self._body_sent = False
+        self._disconnected = asyncio.Event()
+
+    def scope(self, path):
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"test")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("test", 80),
+        }
+
+    async def receive(self):
+        if not self._body_sent:
+            self._body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await self._disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    def disconnect(self):
+        self._disconnected.set()
+
+    @property
+    def status(self):
+        return next((m["status"] for m in self.sent if m["type"] == "http.response.start"), None)
+
+
+class Handler:
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"ok": True}
+
+
+def full_app(handler):
+    # the real middleware stack: the request-id and metrics BaseHTTPMiddleware
+    # handlers and CORS sit outside the cancellation middleware
+    app = create_app()
+
+    @app.get("/test/slow")
+    async def slow():
+        return await handler()
+
+    return app
+
+
+def test_disconnect_cancels_the_request_through_the_full_stack():
+    route_count = REQUESTS_CANCELLED.value(route="/test/slow")
+
+    async def run():
+        handler = Handler()
+        client = Client()
+        app = full_app(handler)
+        request = asyncio.create_task(app(client.scope("/test/slow"), client.receive, client.send))
+        await asyncio.wait_for(handler.started.wait(), 5)
+        client.disconnect()
+        await asyncio.wait_for(request, 5)
+        return handler, client
+
+    handler, client = asyncio.run(run())
+    assert handler.cancelled
+    assert REQUESTS_CANCELLED.value(route="/test/slow") == route_count + 1
+    assert client.status == CLIENT_CLOSED_REQUEST
+
+
+def test_request_completes_normally_through_the_full_stack():
+    route_count = REQUESTS_CANCELLED.value(route="/test/slow")
+
+    async def run():
+        handler = Handler()
+        handler.release.set()
+        client = Client()
+        app = full_app(handler)
+        await asyncio.wait_for(app(client.scope("/test/slow"), client.receive, client.send), 5)
+        # the server reports the disconnect once the response is done; nothing is cancelled
+        client.disconnect()
+        await asyncio.sleep(0)
+        return handler, client
+
+    handler, client = asyncio.run(run())
+    assert not handler.cancelled
+    assert client.status == 200
+    assert b"".join(m.get("body", b"") for m in client.sent) == b'{"ok":true}'
+    assert REQUESTS_CANCELLED.value(route="/test/slow") == route_count
+
+
+def test_disconnect_after_the_response_started_does_not_send_a_second_response():
+    unmatched_count = REQUESTS_CANCELLED.value(route="unmatched")
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"chunk", "more_body": True})
+        await asyncio.Event().wait()
+
+    async def run():
+        client = Client()
+        middleware = DisconnectCancellationMiddleware(app)
+        request = asyncio.create_task(middleware(client.scope("/stream"), client.receive, client.send))
+        await asyncio.sleep(0.01)
+        client.disconnect()
+        await asyncio.wait_for(request, 5)
+        return client
+
+    client = asyncio.run(run())
+    assert [m["type"] for m in client.sent] == ["http.response.start", "http.response.body"]
+    assert REQUESTS_CANCELLED.value(route="unmatched") == unmatched_count + 1
+
+
+def test_server_shutdown_cancellation_is_passed_on():
+    async def app(scope, receive, send):
+        await asyncio.Event().wait()
+
+    async def run():
+        client = Client()
+        middleware = DisconnectCancellationMiddleware(app)
+        request = asyncio.create_task(middleware(client.scope("/slow"), client.receive, client.send))
+        await asyncio.sleep(0.01)
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        return client
+
+    assert asyncio.run(run()).sent == []
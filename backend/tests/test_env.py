@@ -0,0 +1,26 @@
+import pytest
+
+from app.utils.env import env_flag
+
+
+@pytest.mark.parametrize(
+    "value, default, expected",
+    [
+        (None, False, False),
+        (None, True, True),
+        ("1", False, True),
+        ("true", False, True),
+        ("YES", False, True),
+        (" True ", False, True),
+        ("0", True, False),
+        ("false", True, False),
+        ("off", True, False),
+        ("", True, False),
+    ],
+)
+def test_env_flag(monkeypatch, value, default, expected):
+    if value is None:
+        monkeypatch.delenv("TEST_FLAG", raising=False)
+    else:
+        monkeypatch.setenv("TEST_FLAG", value)
+    assert env_flag("TEST_FLAG", default=default) is expected
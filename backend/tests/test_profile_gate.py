@@ -0,0 +1,40 @@
+import pytest
+
+from app.services.profile_gate import ProfileGate
+
+QUESTION = "Which colours do you usually prefer to wear?"
+
+# (user message, assistant reply it answers, decision, local updates)
+TURNS = [
+    # no preference signal
+    ("thanks!", "", "skip", {}),
+    ("What goes with this?", "", "skip", {}),
+    ("Can you show me more options", "", "skip", {}),
+    # lexicon terms without a cue may or may not be a lasting preference
+    ("I'm looking for a red dress for a wedding", "", "llm", {}),
+    ("black jeans", "", "llm", {}),
+    ("Navy and olive", QUESTION, "llm", {}),
+    # trivial statements are extracted locally
+    ("I love navy and olive", "", "local", {"colors": ["Navy", "Olive"]}),
+    ("I mostly wear jeans and sneakers", "", "local", {"clothing_types_liked": ["jeans", "sneakers"]}),
+    ("My style is minimalist and a bit boho", "", "local", {"style_keywords": ["Minimalist", "Boho"]}),
+    ("my name is Priya", "", "local", {"name": "Priya"}),
+    ("I'm on a tight budget", "", "local", {"budget_tier": "low"}),
+    ("I really like blues", "", "local", {"colors": ["Blue"]}),
+    ("I love trench coats", "", "local", {"clothing_types_liked": ["trench coat"]}),
+    ("I love navy\n\n[Shared image: a pink hat]", "", "local", {"colors": ["Navy"]}),
+    # anything harder goes to the LLM
+    ("I don't like pink", "", "llm", {}),
+    ("Do I like navy?", "", "llm", {}),
+    ("I love that!", "", "llm", {}),
+    ("I'm Priya", "", "llm", {}),
+    ("I love cheap and designer bags", "", "llm", {}),
+    ("I love " + "navy and olive, " * 30, "", "llm", {}),
+]
+
+
+@pytest.mark.parametrize("text, previous_reply, decision, updates", TURNS)
+def test_classify_text(text, previous_reply, decision, updates):
+    result = ProfileGate().classify_text(text, previous_reply)
+    assert result.decision == decision, result.reason
+    assert result.updates == updates
@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.services.fashion_agent import FashionAgent
+from app.services.session_store import SESSION_CACHE, SESSION_CONFLICTS, SQLiteSessionStore, VersionConflict
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+def turn(text, profile=None):
+    return {"messages": [HumanMessage(content=text), AIMessage(content="ok")], "user_profile": profile or {}}
+
+
+# SQLiteSessionStore
+
+def test_load_of_unknown_session_is_empty_at_version_zero(store):
+    state, version = store._load_sync("s1")
+    assert state == {"messages": [], "user_profile": {}}
+    assert version == 0
+
+
+def test_save_and_load_round_trip(store):
+    assert store._save_sync("s1", turn("hi", {"colors": ["navy"]}), 0) == 1
+    state, version = store._load_sync("s1")
+    assert version == 1
+    assert [m.content for m in state["messages"]] == ["hi", "ok"]
+    assert state["user_profile"] == {"colors": ["navy"]}
+
+
+def test_exactly_one_of_two_saves_from_the_same_version_wins(store):
+    store._save_sync("s1", turn("first"), 0)
+    conflicts = SESSION_CONFLICTS.value()
+
+    async def save_both():
+        return await asyncio.gather(
+            store.save("s1", turn("a"), 1),
+            store.save("s1", turn("b"), 1),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(save_both())
+    assert [r for r in results if not isinstance(r, VersionConflict)] == [2]
+    assert sum(isinstance(r, VersionConflict) for r in results) == 1
+    assert SESSION_CONFLICTS.value() == conflicts + 1
+    assert store._load_sync("s1")[1] == 2
+
+
+def test_insert_race_at_version_zero_raises_for_the_loser(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    assert first._save_sync("s1", turn("first"), 0) == 1
+    with pytest.raises(VersionConflict):
+        second._save_sync("s1", turn("second"), 0)
+    state, version = second._load_sync("s1")
+    assert version == 1
+    assert state["messages"][0].content == "first"
+
+
+def test_read_cache_is_reused_while_the_version_is_current(store):
+    store._save_sync("s1", turn("hi"), 0)
+    hits, misses = SESSION_CACHE.value(result="hit"), SESSION_CACHE.value(result="miss")
+    store._load_sync("s1")
+    store._load_sync("s1")
+    assert SESSION_CACHE.value(result="hit") == hits + 2
+    assert SESSION_CACHE.value(result="miss") == misses
+
+
+def test_loaded_state_is_a_copy_of_the_cached_one(store):
+    store._save_sync("s1", turn("hi", {"colors": ["navy"]}), 0)
+    state, _ = store._load_sync("s1")
+    state["messages"].append(HumanMessage(content="local"))
+    state["user_profile"]["colors"].append("red")
+    state, _ = store._load_sync("s1")
+    assert len(state["messages"]) == 2
+    assert state["user_profile"]["colors"] == ["navy"]
+
+
+def test_read_cache_is_invalidated_by_another_workers_write(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    reader, writer = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    writer._save_sync("s1", turn("first"), 0)
+    reader._load_sync("s1")
+    writer._save_sync("s1", turn("second"), 1)
+
+    misses = SESSION_CACHE.value(result="miss")
+    state, version = reader._load_sync("s1")
+    assert version == 2
+    assert state["messages"][0].content == "second"
+    assert SESSION_CACHE.value(result="miss") == misses + 1
+
+
+def test_read_cache_evicts_least_recently_used(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), read_cache_size=2)
+    for session_id in ("a", "b", "c"):
+        store._save_sync(session_id, turn(session_id), 0)
+    assert list(store._cache) == ["b", "c"]
+
+
+# FashionAgent._save_turn
+
+class FlakyStore:
+    """Wraps a store and lets another 'worker' save right before the first `conflicts` saves."""
+
+    def __init__(self, store, conflicts):
+        self.store = store
+        self.conflicts = conflicts
+        self.saves = 0
+
+    async def load(self, session_id):
+        return await self.store.load(session_id)
+
+    async def save(self, session_id, state, expected_version):
+        self.saves += 1
+        if self.conflicts:
+            self.conflicts -= 1
+            other, version = await self.store.load(session_id)
+            other["messages"] = other["messages"] + [HumanMessage(content="other worker")]
+            other["user_profile"] = {**other["user_profile"], "colors": other["user_profile"].get("colors", []) + ["red"]}
+            await self.store.save(session_id, other, version)
+        return await self.store.save(session_id, state, expected_version)
+
+
+def make_agent(sessions):
+    agent = object.__new__(FashionAgent)
+    agent.sessions = sessions
+    return agent
+
+
+def test_save_turn_replays_the_turn_on_top_of_a_concurrent_save(store):
+    store._save_sync("s1", turn("hi", {"colors": ["navy"]}), 0)
+    sessions = FlakyStore(store, conflicts=1)
+    agent = make_agent(sessions)
+    state, version = store._load_sync("s1")
+
+    new_messages = [HumanMessage(content="mine"), AIMessage(content="reply")]
+    before = state["user_profile"]
+    after = {**before, "name": "Ada"}
+    asyncio.run(agent._save_turn("s1", state, version, new_messages, before, after))
+
+    saved, version = store._load_sync("s1")
+    assert sessions.saves == 2
+    assert version == 3
+    assert [m.content for m in saved["messages"]] == ["hi", "ok", "other worker", "mine", "reply"]
+    # the other worker's profile change survives; only this turn's change is merged in
+    assert saved["user_profile"] == {"colors": ["navy", "red"], "name": "Ada"}
+
+
+def test_save_turn_gives_up_after_repeated_conflicts(store):
+    store._save_sync("s1", turn("hi"), 0)
+    agent = make_agent(FlakyStore(store, conflicts=10))
+    state, version = store._load_sync("s1")
+    with pytest.raises(VersionConflict, match="after 3 attempts"):
+        asyncio.run(agent._save_turn("s1", state, version, [HumanMessage(content="mine")], {}, {}))
@@ -0,0 +1,190 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, Field
+
+from app.utils.structured_repair import RepairingStructuredOutput, StructuredOutputError, complete_json, repair_model
+
+
+class Item(BaseModel):
+    id: int
+    title: str
+
+
+class Answer(BaseModel):
+    title: str
+    score: int = Field(..., ge=0, le=100)
+    tags: List[str]
+    notes: List[str] = Field(default_factory=list)
+    items: List[Item]
+    nickname: Optional[str] = None
+
+
+VALID = {"title": "t", "score": 50, "tags": ["a"], "items": [{"id": 1, "title": "x"}]}
+
+
+# complete_json
+
+def test_complete_json_parses_plain_and_fenced_json():
+    assert complete_json('{"a": 1}') == {"a": 1}
+    assert complete_json('```json\n{"a": [1, 2]}\n```') == {"a": [1, 2]}
+
+
+def test_complete_json_skips_surrounding_prose():
+    assert complete_json('Here you go: {"a": 1} hope that helps') == {"a": 1}
+
+
+def test_complete_json_closes_open_string_and_brackets():
+    assert complete_json('{"a": [1, 2, {"b": "hel') == {"a": [1, 2, {"b": "hel"}]}
+
+
+def test_complete_json_drops_incomplete_trailing_member():
+    assert complete_json('{"a": 1, "b": [1, 2], "c": tru') == {"a": 1, "b": [1, 2]}
+    assert complete_json('{"a": 1, "b":') == {"a": 1}
+
+
+def test_complete_json_ignores_brackets_and_escapes_inside_strings():
+    assert complete_json('{"a": "x}]\\"y", "b": [1') == {"a": 'x}]"y', "b": [1]}
+
+
+def test_complete_json_returns_none_without_json():
+    assert complete_json("sorry, I can't help with that") is None
+    assert complete_json("{") == {}
+
+
+# repair_model
+
+def test_repair_model_passes_valid_data_through():
+    fixes = []
+    model, _, failed = repair_model(Answer, VALID, fixes)
+    assert model == Answer(**VALID)
+    assert failed == [] and fixes == []
+
+
+def test_repair_model_clamps_and_parses_numbers():
+    for raw, expected in ((105, 100), (-3, 0), ("85%", 85), ("85/100", 85), (42.6, 43)):
+        fixes = []
+        model = repair_model(Answer, {**VALID, "score": raw}, fixes)[0]
+        assert model.score == expected
+        assert fixes
+
+
+def test_repair_model_coerces_strings_and_lists():
+    fixes = []
+    model = repair_model(Answer, {**VALID, "title": ["a", "b"], "tags": "casual, minimal\n- chic", "notes": None}, fixes)[0]
+    assert model.title == "a, b"
+    assert model.tags == ["casual", "minimal", "chic"]
+    assert model.notes == []
+    assert {"coerce", "default_list"} <= set(fixes)
+
+
+def test_repair_model_drops_invalid_items():
+    fixes = []
+    model = repair_model(Answer, {**VALID, "items": [{"id": "2", "title": "y"}, {"bad": 1}, "junk"]}, fixes)[0]
+    assert model.items == [Item(id=2, title="y")]
+    assert fixes.count("drop_item") == 2
+
+
+def test_repair_model_keeps_required_list_failed_when_every_item_is_invalid():
+    model, _, failed = repair_model(Answer, {**VALID, "items": [{"bad": 1}, {"title": "no id"}]}, [])
+    assert model is None
+    assert failed == ["items"]
+
+
+def test_repair_model_reports_missing_fields():
+    data = dict(VALID)
+    del data["tags"]
+    model, repaired, failed = repair_model(Answer, data, [])
+    assert model is None
+    assert failed == ["tags"]
+    assert repaired["title"] == "t"
+
+
+# RepairingStructuredOutput
+
+class FakeLLM:
+    """Returns queued include_raw outputs (or raises queued errors) and `partial` for re-asks."""
+
+    site = "test"
+
+    def __init__(self, outputs, partial=None):
+        self.outputs = list(outputs)
+        self.partial = partial
+        self.schemas = []
+
+    def with_structured_output(self, schema, **kwargs):
+        self.schemas.append(schema)
+
+        def call(_input):
+            if not kwargs.get("include_raw"):
+                return schema.model_validate(self.partial)
+            output = self.outputs.pop(0)
+            if isinstance(output, Exception):
+                raise output
+            return output
+
+        async def acall(_input):
+            return call(_input)
+
+        return RunnableLambda(call, afunc=acall)
+
+
+def failed_output(args):
+    raw = AIMessage(content="", tool_calls=[{"name": "Answer", "args": args, "id": "1"}])
+    return {"raw": raw, "parsed": None, "parsing_error": ValueError("invalid")}
+
+
+def test_wrapper_returns_parsed_output():
+    llm = FakeLLM([{"raw": None, "parsed": Answer(**VALID), "parsing_error": None}])
+    wrapper = RepairingStructuredOutput(llm, Answer)
+    assert wrapper.invoke("hi") == Answer(**VALID)
+    assert wrapper.counts["valid"] == 1
+
+
+def test_wrapper_repairs_truncated_tool_call():
+    raw = AIMessage(content="", invalid_tool_calls=[{"name": "Answer", "args": '{"title": "t", "score": 120, "tags": "a, b", "items": [{"id": 1, "title": "x"}]', "id": "1", "error": "bad"}])
+    wrapper = RepairingStructuredOutput(FakeLLM([{"raw": raw, "parsed": None, "parsing_error": ValueError()}]), Answer)
+    model = asyncio.run(wrapper.ainvoke("hi"))
+    assert model.score == 100 and model.tags == ["a", "b"]
+    assert wrapper.counts["repaired"] == 1
+
+
+def test_wrapper_reasks_only_failed_fields():
+    data = dict(VALID)
+    del data["tags"]
+    llm = FakeLLM([failed_output(data), failed_output(data)], partial={"tags": ["z"]})
+    wrapper = RepairingStructuredOutput(llm, Answer)
+    assert wrapper.invoke("hi").tags == ["z"]
+    assert asyncio.run(wrapper.ainvoke("hi")).tags == ["z"]
+    assert wrapper.counts["partial_retry"] == 2
+    # the subset schema is built once per set of failed fields
+    assert [schema.__name__ for schema in llm.schemas] == ["Answer", "AnswerFields"]
+
+
+def test_wrapper_recovers_groq_failed_generation():
+    error = Exception("tool_use_failed")
+    error.body = {"error": {"failed_generation": '{"name": "Answer", "arguments": {"title": "t", "score": "90%", "tags": ["a"], "items": [{"id": 1, "title": "x"}]}}'}}
+    wrapper = RepairingStructuredOutput(FakeLLM([error]), Answer)
+    assert wrapper.invoke("hi").score == 90
+
+
+def test_wrapper_repeats_the_call_when_nothing_is_recoverable():
+    unusable = {"raw": AIMessage(content="sorry"), "parsed": None, "parsing_error": ValueError()}
+    wrapper = RepairingStructuredOutput(FakeLLM([unusable, {"raw": None, "parsed": Answer(**VALID), "parsing_error": None}]), Answer)
+    assert wrapper.invoke("hi") == Answer(**VALID)
+    assert wrapper.counts["full_retry"] == 1
+
+    wrapper = RepairingStructuredOutput(FakeLLM([unusable, unusable]), Answer)
+    with pytest.raises(StructuredOutputError):
+        wrapper.invoke("hi")
+    assert wrapper.counts["failed"] == 1
+
+
+def test_wrapper_propagates_other_errors():
+    wrapper = RepairingStructuredOutput(FakeLLM([RuntimeError("network")]), Answer)
+    with pytest.raises(RuntimeError, match="network"):
+        wrapper.invoke("hi")
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from app.services.tara_stylist import STYLE_DIRECTIONS, TaraRecommendationOption, TaraStylistService
+
+
+def make_service(fail_ids=(), hang_ids=()):
+    service = object.__new__(TaraStylistService)
+    service.cancelled = []
+
+    async def generate_option(description, prompt, option_id):
+        if option_id in hang_ids:
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                service.cancelled.append(option_id)
+                raise
+        await asyncio.sleep(0.01 * option_id)
+        if option_id in fail_ids:
+            raise ValueError(f"option {option_id} failed")
+        return TaraRecommendationOption(id=option_id, summary_title="t", summary_description="d", categories=[])
+
+    async def describe_look(image_data):
+        return "look"
+
+    service._generate_option = generate_option
+    service.describe_look = describe_look
+    return service
+
+
+def test_parallel_keeps_successful_options_in_id_order():
+    service = make_service(fail_ids={2})
+    response = asyncio.run(service.generate_recommendations("img", "prompt", parallel=True))
+    assert [option.id for option in response.options] == [i for i in range(1, len(STYLE_DIRECTIONS) + 1) if i != 2]
+
+
+def test_parallel_raises_only_when_every_option_fails():
+    service = make_service(fail_ids=set(range(1, len(STYLE_DIRECTIONS) + 1)))
+    with pytest.raises(RuntimeError, match="options failed"):
+        asyncio.run(service.generate_recommendations("img", "prompt", parallel=True))
+
+
+def test_parallel_cancels_outstanding_options_when_the_request_is_cancelled():
+    service = make_service(hang_ids={3})
+
+    async def run():
+        task = asyncio.create_task(service.generate_recommendations("img", "prompt", parallel=True))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert service.cancelled == [3]
+
+
+def test_stream_reports_failure_when_every_option_fails():
+    service = make_service(fail_ids=set(range(1, len(STYLE_DIRECTIONS) + 1)))
+
+    async def consume():
+        return [option async for option in service.stream_recommendations("img", "prompt")]
+
+    with pytest.raises(RuntimeError, match="options failed"):
+        asyncio.run(consume())
@@ -0,0 +1,163 @@
+import io
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.routers import try_on
+from app.services.try_on_results import TryOnResultStore, parse_range
+
+
+# parse_range
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10-", (10, 999)),
+        ("bytes=-100", (900, 999)),
+        # a suffix longer than the body is the whole body
+        ("bytes=-5000", (0, 999)),
+        # an end past the body is clamped
+        ("bytes=900-5000", (900, 999)),
+        # several ranges are served as the whole body
+        ("bytes=0-9,20-29", None),
+        # other units and malformed specs are ignored
+        ("items=0-9", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=1000-1100", "bytes=50-10", "bytes=-0"])
+def test_parse_range_rejects_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
+
+
+# GET /api/try-on/results/{result_id}
+
+def png_bytes(width=64, height=96):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 60)).save(out, "PNG")
+    return out.getvalue()
+
+
+ORIGINAL = png_bytes()
+
+
+@pytest.fixture
+def results(monkeypatch):
+    upstream_calls = []
+
+    def upstream(request):
+        upstream_calls.append(request.url)
+        return httpx.Response(200, content=ORIGINAL, headers={"content-type": "image/png"})
+
+    store = TryOnResultStore()
+    store._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+    store.upstream_calls = upstream_calls
+    monkeypatch.setattr(try_on, "try_on_results", store)
+    return store
+
+
+@pytest.fixture
+def client(results):
+    app = FastAPI()
+    app.include_router(try_on.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_first_fetch_streams_the_original_and_caches_it(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    response = client.get(f"/api/try-on/results/{result_id}")
+    assert response.status_code == 200
+    assert response.content == ORIGINAL
+    assert response.headers["content-type"] == "image/png"
+
+    response = client.get(f"/api/try-on/results/{result_id}")
+    assert response.content == ORIGINAL
+    assert "etag" in response.headers
+    assert len(results.upstream_calls) == 1
+
+
+def test_if_none_match_returns_304(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    client.get(f"/api/try-on/results/{result_id}")
+    etag = client.get(f"/api/try-on/results/{result_id}").headers["etag"]
+
+    response = client.get(f"/api/try-on/results/{result_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_range_returns_206_with_content_range(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    size = len(ORIGINAL)
+
+    # a range on a result that isn't cached yet downloads it whole first
+    response = client.get(f"/api/try-on/results/{result_id}", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.content == ORIGINAL[:10]
+    assert response.headers["content-range"] == f"bytes 0-9/{size}"
+
+    response = client.get(f"/api/try-on/results/{result_id}", headers={"Range": "bytes=-4"})
+    assert response.status_code == 206
+    assert response.content == ORIGINAL[-4:]
+    assert response.headers["content-range"] == f"bytes {size - 4}-{size - 1}/{size}"
+    assert len(results.upstream_calls) == 1
+
+
+def test_unsatisfiable_range_returns_416(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    size = len(ORIGINAL)
+    response = client.get(f"/api/try-on/results/{result_id}", headers={"Range": f"bytes={size}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{size}"
+
+
+def test_multi_range_returns_the_whole_body(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    response = client.get(f"/api/try-on/results/{result_id}", headers={"Range": "bytes=0-1,5-6"})
+    assert response.status_code == 200
+    assert response.content == ORIGINAL
+
+
+def test_variant_is_transcoded_once_and_revalidated(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    url = f"/api/try-on/results/{result_id}?format=auto&width=40"
+    response = client.get(url, headers={"Accept": "image/webp,*/*"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    # 40 snaps up to 160, and an image is never upscaled
+    assert Image.open(io.BytesIO(response.content)).size == (64, 96)
+
+    etag = response.headers["etag"]
+    response = client.get(url, headers={"Accept": "image/webp,*/*", "If-None-Match": etag})
+    assert response.status_code == 304
+
+    response = client.get(url, headers={"Accept": "image/jpeg"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] != etag
+
+
+def test_unknown_or_expired_result_is_404(client, results):
+    assert client.get("/api/try-on/results/nope").status_code == 404
+    result_id = results.register("https://pixazo.example/out.png")
+    results.ttl_seconds = -1
+    assert client.get(f"/api/try-on/results/{result_id}").status_code == 404
+
+
+def test_invalid_parameters_are_400(client, results):
+    result_id = results.register("https://pixazo.example/out.png")
+    assert client.get(f"/api/try-on/results/{result_id}?format=gif").status_code == 400
+    assert client.get(f"/api/try-on/results/{result_id}?width=100").status_code == 400
@@ -0,0 +1,151 @@
+import os
+
+import pytest
+
+from app.models import GarmentAnalysis
+from app.services import wardrobe_store
+from app.services.wardrobe_store import WardrobeIndex, WardrobeStore
+
+
+def analysis(category="Tops", type="Shirt", colors=("Navy",), patterns=("Solid",), style=("Minimalist: clean lines",)):
+    return GarmentAnalysis(
+        category=category,
+        type=type,
+        style_aesthetic=list(style),
+        vibe_mood=["Relaxed"],
+        colors=list(colors),
+        patterns=list(patterns),
+        preference_score=70,
+        body_shape_tips=["Tuck it in"],
+        styling_suggestions=["Pair with chinos"],
+    )
+
+
+def types(items):
+    return sorted(item["type"] for item in items)
+
+
+# WardrobeStore persistence
+
+def test_add_remove_and_replay_after_reopening(tmp_path):
+    store = WardrobeStore(str(tmp_path))
+    shirt = store.add("u1", analysis())
+    jeans = store.add("u1", analysis(category="Bottoms", type="Jeans", colors=["Blue"]))
+    assert store.remove("u1", shirt)
+    assert not store.remove("u1", shirt)
+
+    reopened = WardrobeStore(str(tmp_path))
+    items = reopened.items("u1")
+    assert [item["item_id"] for item in items] == [jeans]
+    assert items[0]["colors"] == ["Blue"]
+    assert reopened.query("u1", {"colors": ["navy"]}) == []
+    # ids keep counting from where the log left off
+    assert reopened.add("u1", analysis()) == jeans + 1
+
+
+def test_wardrobes_are_kept_per_user(tmp_path):
+    store = WardrobeStore(str(tmp_path))
+    store.add("u1", analysis())
+    assert store.items("u2") == []
+    assert len(WardrobeStore(str(tmp_path)).items("u1")) == 1
+
+
+def test_directory_is_only_created_on_first_write(tmp_path):
+    directory = tmp_path / "wardrobes"
+    store = WardrobeStore(str(directory))
+    assert store.items("u1") == []
+    assert not directory.exists()
+    store.add("u1", analysis())
+    assert directory.exists()
+
+
+def test_compaction_then_reload(tmp_path):
+    store = WardrobeStore(str(tmp_path))
+    ids = [store.add("u1", analysis(type=f"Shirt {n}", colors=["Navy", "White"])) for n in range(3)]
+    store.remove("u1", ids[1])
+    store.compact("u1")
+    snapshot_path, log_path = store._paths("u1")
+    assert os.path.exists(snapshot_path)
+    assert not os.path.exists(log_path)
+
+    # changes after the snapshot go to a fresh log and are replayed on top of it
+    store.add("u1", analysis(type="Jeans", colors=["Blue"]))
+    reopened = WardrobeStore(str(tmp_path))
+    items = reopened.items("u1")
+    assert types(items) == ["Jeans", "Shirt 0", "Shirt 2"]
+    assert items[0] == store.items("u1")[0]
+    assert types(reopened.query("u1", {"colors": ["white"]})) == ["Shirt 0", "Shirt 2"]
+    assert reopened.add("u1", analysis()) == ids[-1] + 2
+
+
+def test_log_is_compacted_automatically(tmp_path, monkeypatch):
+    monkeypatch.setattr(wardrobe_store, "COMPACT_AFTER_OPS", 3)
+    store = WardrobeStore(str(tmp_path))
+    for _ in range(3):
+        store.add("u1", analysis())
+    snapshot_path, log_path = store._paths("u1")
+    assert os.path.exists(snapshot_path)
+    assert not os.path.exists(log_path)
+    assert len(WardrobeStore(str(tmp_path)).items("u1")) == 3
+
+
+def test_least_recently_used_wardrobes_are_evicted(tmp_path):
+    store = WardrobeStore(str(tmp_path), max_loaded=2)
+    for user_id in ("a", "b", "c"):
+        store.add(user_id, analysis(type=user_id))
+    assert list(store._indexes) == ["b", "c"]
+
+    store.items("b")
+    store.items("a")
+    assert list(store._indexes) == ["b", "a"]
+    # an evicted wardrobe is reloaded from disk intact
+    assert types(store.items("a")) == ["a"]
+    assert types(store.items("c")) == ["c"]
+    assert list(store._indexes) == ["a", "c"]
+
+
+# WardrobeIndex.query
+
+@pytest.fixture
+def index():
+    index = WardrobeIndex()
+    index.add({"category": "Tops", "type": "Shirt", "colors": ["Midnight Navy"], "patterns": ["Solid"]})
+    index.add({"category": "Tops", "type": "Tee", "colors": ["White"], "patterns": ["Striped"]})
+    index.add({"category": "Bottoms", "type": "Chinos", "colors": ["Navy"], "patterns": ["Solid"]})
+    index.add({"category": "Dress", "type": "Gown", "colors": ["Red"], "style_aesthetic": ["Romantic: soft and flowing"]})
+    return index
+
+
+@pytest.mark.parametrize(
+    "filters, expected",
+    [
+        ({}, [1, 2, 3, 4]),
+        ({"colors": []}, [1, 2, 3, 4]),
+        # OR within a field
+        ({"colors": ["navy"]}, [1, 3]),
+        ({"colors": ["white", "red"]}, [2, 4]),
+        # AND across fields
+        ({"colors": ["navy"], "category": ["top"]}, [1]),
+        ({"colors": ["navy", "white"], "patterns": ["solid"]}, [1, 3]),
+        ({"colors": ["navy"], "patterns": ["striped"]}, []),
+        # normalised like the indexed values: case, plurals, aesthetic descriptions
+        ({"category": ["TOPS"]}, [1, 2]),
+        ({"style_aesthetic": ["Romantic: anything"]}, [4]),
+        ({"colors": ["midnight navy"]}, [1]),
+        ({"colors": ["green"]}, []),
+    ],
+)
+def test_query_semantics(index, filters, expected):
+    assert index.query(filters) == expected
+
+
+def test_query_rejects_unindexed_fields(index):
+    with pytest.raises(KeyError):
+        index.query({"body_shape_tips": ["tuck"]})
+
+
+def test_removed_items_leave_the_index(index):
+    assert index.remove(1)
+    assert index.query({"colors": ["navy"]}) == [3]
+    assert "midnight navy" not in index.postings["colors"]
+    assert not index.remove(1)